@@ -0,0 +1,183 @@
+'''
+zero-copy ISO Base Media File Format box reader, backed by mmap and memoryview
+
+only box headers are read while walking the tree: payloads of leaf boxes (like 'mdat') are
+never touched, so their pages are not loaded from disk
+
+PreadReader does the same with positioned reads (os.pread) of the needed ranges only, for
+network mounts and object storage where mapping the whole file is not an option
+'''
+
+import os
+import mmap
+from struct import Struct
+from collections import namedtuple
+
+
+class BoxReader:
+  S_BOX_HEADER = Struct('>L4s')
+  S_BOX_LARGESIZE = Struct('>Q')
+  NT_BOX = namedtuple('box', 'name offset size hsize') #hsize is size of header (size and name), payload starts at offset+hsize
+
+  #boxes containing other boxes, just after the name
+  CONTAINERS = { b'moov', b'trak', b'mdia', b'minf', b'dinf', b'stbl', b'iprp', b'ipco' }
+  #boxes containing other boxes at specific offsets after the name
+  INNER_OFFSETS = { b'CRAW': 0x52, b'CCTP':12, b'stsd':8, b'dref':8, b'CDI1':4, b'meta':4, b'iref':4 }
+
+  UUID_LEN = 16
+  UUID_CANON = bytes.fromhex('85c0b687820f11e08111f4ce462b6a48') #CNCV, CCTP, CTBO, CMT1-4, THMB
+  UUID_CMTA = bytes.fromhex('5766b829bb6a47c5bcfb8b9f2260d06d') #CMTA, in roll
+  UUID_CNOP = bytes.fromhex('210f1687914911e4811100242131fce4') #CNOP, in roll
+  UUID_PRVW = bytes.fromhex('eaf42b5e1c984b88b9fbb7dc406e4d16') #PRVW
+  UUID_XPACKET = bytes.fromhex('be7acfcb97a942e89c71999491e3afac')
+  #inner boxes offset, after uuid value
+  UUID_INNER_OFFSETS = { UUID_CANON:0, UUID_CMTA:0, UUID_CNOP:0, UUID_PRVW:8 }
+
+  def __init__(self, data, filesize=None):
+    self.map = None
+    self.data = memoryview(data)
+    if filesize is None:
+      filesize = len(self.data)
+    self.filesize = filesize
+
+  @classmethod
+  def open(cls, filename):
+    with open(filename, 'rb') as f:
+      filesize = f.seek(0, 2)
+      if filesize == 0: #mmap does not support empty files
+        return cls(b'', 0)
+      m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    reader = cls(m, filesize)
+    reader.map = m
+    return reader
+
+  def close(self):
+    self.data.release()
+    if self.map is not None:
+      try:
+        self.map.close()
+      except BufferError: #memoryviews on payloads are still alive, mapping is closed when they are released
+        pass
+      self.map = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def read(self, offset, size):
+    '''memoryview on file content, no copy'''
+    return self.data[ offset: offset+size ]
+
+  def __getitem__(self, s): #file content by absolute offsets, like reader[start:end]
+    return self.read( s.start, s.stop-s.start )
+
+  def boxes(self, start=0, end=None):
+    '''yields boxes found between start and end (absolute offsets), reading only their headers'''
+    if end is None:
+      end = self.filesize
+    o = start
+    while o + BoxReader.S_BOX_HEADER.size <= end:
+      header = self.read( o, min(BoxReader.S_BOX_HEADER.size+BoxReader.S_BOX_LARGESIZE.size, end-o) )
+      size, name = BoxReader.S_BOX_HEADER.unpack_from(header, 0)
+      hsize = BoxReader.S_BOX_HEADER.size
+      if size == 1:
+        if len(header) < hsize+BoxReader.S_BOX_LARGESIZE.size:
+          return
+        size, = BoxReader.S_BOX_LARGESIZE.unpack_from(header, hsize)
+        hsize += BoxReader.S_BOX_LARGESIZE.size
+      elif size == 0: #box extends to the end of its container
+        size = end - o
+      if size < hsize: #corrupted
+        return
+      yield BoxReader.NT_BOX(name, o, size, hsize)
+      o += size
+
+  def payload(self, box, limit=None):
+    '''box content, after size and name. limit is the maximum size to read'''
+    size = box.size-box.hsize
+    if limit is not None:
+      size = min(size, limit)
+    return self.read( box.offset+box.hsize, size )
+
+  def children(self, box):
+    '''returns (start, end) of inner boxes, or None if box is not a known container'''
+    start = box.offset + box.hsize
+    end = box.offset + box.size
+    if box.name in BoxReader.CONTAINERS:
+      return start, end
+    elif box.name == b'uuid':
+      uuidValue = bytes( self.read( start, BoxReader.UUID_LEN ) )
+      if uuidValue in BoxReader.UUID_INNER_OFFSETS:
+        return start+BoxReader.UUID_LEN+BoxReader.UUID_INNER_OFFSETS[uuidValue], end
+    elif box.name in BoxReader.INNER_OFFSETS:
+      return start+BoxReader.INNER_OFFSETS[box.name], end
+    return None
+
+  def walk(self, start=0, end=None, depth=0):
+    '''yields (depth, box) for the whole tree, depth first'''
+    for box in self.boxes(start, end):
+      yield depth, box
+      inner = self.children(box)
+      if inner:
+        yield from self.walk(inner[0], inner[1], depth+1)
+
+  def find(self, path, start=0, end=None):
+    '''first box matching path like b'moov/trak/mdia', or None'''
+    names = path.split(b'/')
+    for box in self.boxes(start, end):
+      if box.name == names[0]:
+        if len(names) == 1:
+          return box
+        inner = self.children(box)
+        if inner:
+          found = self.find(b'/'.join(names[1:]), inner[0], inner[1])
+          if found:
+            return found
+    return None
+
+
+class PreadReader(BoxReader):
+  '''BoxReader doing positioned reads, without mapping the file.
+  load() reads a range once (moov for example), later reads inside it are served from memory'''
+
+  def __init__(self, fd, filesize):
+    self.map = None
+    self.data = None
+    self.fd = fd
+    self.filesize = filesize
+    self.segments = [] #(offset, bytes) loaded with load()
+    self.reads = 0 #number of os.pread calls
+    self.bytes_read = 0
+
+  @classmethod
+  def open(cls, filename):
+    fd = os.open(filename, os.O_RDONLY)
+    return cls(fd, os.fstat(fd).st_size)
+
+  def close(self):
+    if self.fd is not None:
+      os.close(self.fd)
+      self.fd = None
+    self.segments = []
+
+  def pread(self, offset, size):
+    self.reads += 1
+    data = os.pread(self.fd, size, offset)
+    self.bytes_read += len(data)
+    return data
+
+  def load(self, offset, size):
+    '''reads a range in one call and keeps it for next reads'''
+    size = min(size, self.filesize-offset)
+    for start, data in self.segments:
+      if start <= offset and offset+size <= start+len(data):
+        return
+    self.segments.append( (offset, self.pread(offset, size)) )
+
+  def read(self, offset, size):
+    for start, data in self.segments:
+      if start <= offset and offset+size <= start+len(data):
+        return memoryview(data)[ offset-start: offset-start+size ]
+    return self.pread(offset, size)
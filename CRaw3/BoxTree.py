@@ -0,0 +1,95 @@
+'''
+tree of parsed boxes: one BoxNode per box (name, offset, size, value returned by its Cr3 handler, inner boxes)
+
+nodes have __slots__ and no inner list when they have no inner boxes. Sample tables of stsz and co64 are arrays,
+see Cr3. Paths are box names separated by /, like 'moov/trak[2]/mdia/minf/stbl/stsd/CRAW/CMP1': trak[2] is the
+second trak of moov (from 1, like 'trak2' in Cr3.cr3), * is any box, and ... any number of levels (even none):
+'moov/trak[3]/.../CMP1'
+'''
+
+import re
+
+PATH_SEGMENT = re.compile(r'^([^\[\]]+)(?:\[(\d+)\])?$')
+
+def parse_path(path):
+  '''list of (name, index) from path. name is None for *, ... is kept as is, index is None for all'''
+  if isinstance(path, bytes):
+    path = path.decode('latin-1')
+  segments = []
+  for segment in path.strip('/').split('/'):
+    if segment == '...':
+      segments.append( segment )
+      continue
+    match = PATH_SEGMENT.match( segment )
+    if match is None:
+      raise ValueError('invalid path segment: %r' % segment)
+    name, index = match.groups()
+    segments.append( ( None if name == '*' else name.encode('latin-1'), None if index is None else int(index) ) )
+  return segments
+
+
+class BoxNode:
+  __slots__ = ('name', 'offset', 'size', 'value', 'children')
+
+  def __init__(self, name, offset, size, value=None):
+    self.name = name
+    self.offset = offset
+    self.size = size
+    self.value = value
+    self.children = None #list of BoxNode, created with the first inner box
+
+  def add(self, node):
+    if self.children is None:
+      self.children = []
+    self.children.append( node )
+    return node
+
+  def __iter__(self):
+    return iter( self.children or () )
+
+  def __repr__(self):
+    return 'BoxNode(%r, 0x%x, 0x%x)' % (self.name, self.offset, self.size)
+
+  def walk(self, depth=0):
+    '''yields (depth, node) for inner boxes, depth first, in file order'''
+    for child in self.children or ():
+      yield depth, child
+      yield from child.walk( depth+1 )
+
+  def _match(self, segments):
+    if not segments:
+      yield self
+      return
+    segment = segments[0]
+    if segment == '...':
+      yield from self._match( segments[1:] )
+      for child in self.children or ():
+        yield from child._match( segments )
+      return
+    name, index = segment
+    candidates = [ c for c in self.children or () if name is None or c.name == name ]
+    if index is not None:
+      candidates = candidates[ index-1:index ] if index > 0 else []
+    for child in candidates:
+      yield from child._match( segments[1:] )
+
+  def findall(self, path):
+    '''nodes matching path, in file order'''
+    nodes = []
+    seen = set()
+    for node in self._match( parse_path(path) ):
+      if id(node) not in seen: #... can match a node by several ways
+        seen.add( id(node) )
+        nodes.append( node )
+    return nodes
+
+  def find(self, path):
+    '''first node matching path, or None'''
+    for node in self._match( parse_path(path) ):
+      return node
+    return None
+
+  def get(self, path, default=None):
+    '''value of the first node matching path, default if missing'''
+    node = self.find( path )
+    return default if node is None else node.value
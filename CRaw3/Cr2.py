@@ -2,9 +2,15 @@
 parses CR2 files using TiffIfd and Jpeg classes
 '''
 
+import logging
+import sys
+from array import array
+
 from CRaw3.TiffIfd import TiffIfd
 from CRaw3.Jpeg import Jpeg
 
+logger = logging.getLogger(__name__)
+
 class Cr2:
   def __init__(self, data, length, name):
     self.ifd_list = dict()
@@ -16,18 +22,18 @@ class Cr2:
     
     if TiffIfd.TIFF_EXIF in self.ifd_list[ 0 ].ifd:    
       offset = self.ifd_list[ 0 ].ifd[TiffIfd.TIFF_EXIF].value
-      self.ifd_list[ TiffIfd.TIFF_EXIF ] = TiffIfd( data[offset:], length, offset, '%x' % TiffIfd.TIFF_EXIF, False, False, True )
+      self.ifd_list[ TiffIfd.TIFF_EXIF ] = TiffIfd( data, length, 0, '%x' % TiffIfd.TIFF_EXIF, False, False, True, offset )
     if TiffIfd.TIFF_MAKERNOTE in self.ifd_list[ TiffIfd.TIFF_EXIF ].ifd:    
       offset = self.ifd_list[ TiffIfd.TIFF_EXIF ].ifd[TiffIfd.TIFF_MAKERNOTE].value
-      self.ifd_list[ TiffIfd.TIFF_MAKERNOTE ] = TiffIfd( data[offset:], length, offset, '%x' % TiffIfd.TIFF_MAKERNOTE, False, False, True )
+      self.ifd_list[ TiffIfd.TIFF_MAKERNOTE ] = TiffIfd( data, length, 0, '%x' % TiffIfd.TIFF_MAKERNOTE, False, False, True, offset )
     if TiffIfd.TIFF_GPS in self.ifd_list[ 0 ].ifd:    
       offset = self.ifd_list[ 0 ].ifd[TiffIfd.TIFF_GPS].value
-      self.ifd_list[ TiffIfd.TIFF_GPS ] = TiffIfd( data[offset:], length, offset, '%x' % TiffIfd.TIFF_GPS, False, False, True )
+      self.ifd_list[ TiffIfd.TIFF_GPS ] = TiffIfd( data, length, 0, '%x' % TiffIfd.TIFF_GPS, False, False, True, offset )
     #other IFD has no header
     while self.ifd_list[ ifd_num ].next != 0:
       next = self.ifd_list[ ifd_num ].next 
       ifd_num += 1
-      self.ifd_list[ ifd_num ] = TiffIfd( data[next:], length, next, '%d' % ifd_num, False, False, True )
+      self.ifd_list[ ifd_num ] = TiffIfd( data, length, 0, '%d' % ifd_num, False, False, True, next )
       
   def display(self):
     for key, ifd in self.ifd_list.items():
@@ -42,39 +48,69 @@ class Cr2:
     f.close()
 
   def extract_pic1(self, filename): #thumbnail, jpg
-    offset = self.ifd_list[ 1 ].ifd[ TiffIfd.TiffIfd.TIFF_EXIF_ThumbnailOffset ].value
-    length = self.ifd_list[ 1 ].ifd[ TiffIfd.TiffIfd.TIFF_EXIF_ThumbnailLength ].value      
+    offset = self.ifd_list[ 1 ].ifd[ TiffIfd.TIFF_EXIF_ThumbnailOffset ].value
+    length = self.ifd_list[ 1 ].ifd[ TiffIfd.TIFF_EXIF_ThumbnailLength ].value      
     f = open(filename, 'wb')
     f.write( self.data[offset:offset+length] )
     f.close()
     
-  def extract_pic2(self, filename): #saved as .ppm, (RGB 16bits, little endian). no WB, no scaling
+  def get_pic2(self, as_array=True): #RGB 16bits, little endian. no WB, no scaling
+    '''width, height and IFD2 pixels: numpy array (height, width, 3) of uint16 viewing the file data, or bytes'''
     offset = self.ifd_list[ 2 ].ifd[ TiffIfd.TIFF_EXIF_PreviewImageStart ].value
-    length = self.ifd_list[ 2 ].ifd[ TiffIfd.TIFF_EXIF_PreviewImageLength ].value      
+    length = self.ifd_list[ 2 ].ifd[ TiffIfd.TIFF_EXIF_PreviewImageLength ].value
     width = self.ifd_list[ 2 ].ifd[ TiffIfd.TIFF_EXIF_ImageWidth ].value
     height = self.ifd_list[ 2 ].ifd[ TiffIfd.TIFF_EXIF_ImageHeight ].value
-    out = open(filename, 'w')
-    print ('P3\n%d %d' % (width, height), file=out)
-    print ('%s' % (1<<14), file=out)
-    pic = Struct('<%dH'%(3*width*height)).unpack_from(self.data[offset:offset+length], 0)
-    index = 0
-    for y in range(height):
-      for x in range(width):
-        print ('%4d %4d %4d ' % (pic[index], pic[index+1], pic[index+2]), end='', file=out)
-        index += 3
-      print(file=out)
-    out.close()    
+    size = 3*width*height*2
+    if length < size or offset+size > len(self.data):
+      logger.error('IFD2 is truncated (%d bytes for %dx%d)', length, width, height)
+      return None
+    if not as_array:
+      return width, height, self.data[offset:offset+size]
+    import numpy as np
+    return width, height, np.frombuffer(self.data, '<u2', 3*width*height, offset).reshape(height, width, 3)
+
+  def extract_pic2(self, filename=None, pixels=False):
+    '''saved as binary .ppm (RGB 16bits, big endian) or .tif (RGB 16bits, little endian) according to filename,
+    in one write. no WB, no scaling. Returns width, height, and the numpy array of get_pic2() if pixels is True'''
+    pic = self.get_pic2(pixels)
+    if pic is None:
+      return None
+    width, height, values = pic
+    if filename:
+      with open(filename, 'wb') as out:
+        if filename.lower().endswith(('.tif', '.tiff')):
+          out.write( TiffIfd.tiff16_header(width, height, 3) )
+          out.write( values if not pixels else values.tobytes() )
+        else:
+          out.write( b'P6\n%d %d\n%d\n' % (width, height, (1<<14)-1) )
+          rgb = array('H')
+          rgb.frombytes( values if not pixels else values.tobytes() )
+          if sys.byteorder == 'little':
+            rgb.byteswap()
+          out.write( rgb.tobytes() )
+    if pixels:
+      return width, height, values
     return width, height
-  
-  def get_lossless_info(self):
+
+  def get_lossless_info(self, display=True):
     offset = self.ifd_list[ 3 ].ifd[ TiffIfd.TIFF_EXIF_StripOffsets ].value
     length = self.ifd_list[ 3 ].ifd[ TiffIfd.TIFF_EXIF_StripByteCounts ].value    
-    self.jpg = Jpeg( self.data[offset:offset+length] )
+    self.jpg = Jpeg( self.data[offset:offset+length], display )
+
+  def get_raw(self):
+    '''decoded lossless Jpeg of IFD3, slices reassembled, as numpy array of sensor size. None if not supported'''
+    from CRaw3.LjpegDecoder import LjpegDecoder #needs numpy
+    self.get_lossless_info( False )
+    frame = LjpegDecoder( self.jpg ).decode()
+    if frame is None:
+      return None
+    slices = self.ifd_list[ 3 ].get( TiffIfd.TIFF_CR2_SLICE )
+    if slices and slices[1]:
+      return LjpegDecoder.unslice( frame, slices )
+    return frame
     
   def get_model_id(self):
     return self.ifd_list[ TiffIfd.TIFF_MAKERNOTE ].ifd[ TiffIfd.TIFF_MAKERNOTE_MODELID ].value
     
   def get_model_name(self):
-    offset = self.ifd_list[ 0 ].ifd[ TiffIfd.TIFF_EXIF_Model ].value
-    length = self.ifd_list[ 0 ].ifd[ TiffIfd.TIFF_EXIF_Model ].length
-    return self.data[ offset: offset+length-1 ]
\ No newline at end of file
+    return self.ifd_list[ 0 ].get( TiffIfd.TIFF_EXIF_Model )
\ No newline at end of file
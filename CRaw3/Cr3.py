@@ -0,0 +1,462 @@
+'''
+parses CR3 (and CRM) files using BoxReader, TiffIfd, Ctmd and Crx classes
+
+all parsing state is kept in the instance: several files can be parsed in the same process. Parsed boxes are kept
+in tree (see BoxTree), with the values returned by handlers. cr3 is a flat index of these values, by name and per
+trak ('trak1', ...). stsz and co64 sample tables are arrays
+
+parsing builds no display strings: Display.display_tree() prints the tree once parsed, and problems found while
+parsing are logged (logging module, one logger per module)
+'''
+
+import sys
+from struct import Struct, unpack
+from array import array
+from collections import namedtuple
+
+from CRaw3.Box import BoxReader
+from CRaw3.TiffIfd import TiffIfd
+from CRaw3.FrameIndex import FrameIndex, SIZE_CODE
+from CRaw3.BoxTree import BoxNode
+from CRaw3.Ctmd import Ctmd
+from CRaw3.Crx import Crx
+from CRaw3.Profiler import NULL_PROFILER
+
+def getShortBE(d, a):
+ return unpack('>H',(d)[a:a+2])[0]
+
+def getLongBE(d, a):
+ return unpack('>L',(d)[a:a+4])[0]
+
+def getLongLongBE(d, a):
+ return unpack('>Q',(d)[a:a+8])[0]
+
+def getArrayBE(typecode, d, a, count):
+ #count big endian values from offset a, decoded at once as array (less if d is truncated)
+ values = array(typecode)
+ size = min( count*values.itemsize, (len(d)-a)//values.itemsize*values.itemsize )
+ values.frombytes( d[a:a+size] )
+ if sys.byteorder == 'little':
+   values.byteswap()
+ return values
+
+def getEntries(s, d, a, count):
+ #count entries of Struct s from offset a, as tuples (less if d is truncated)
+ size = min( count*s.size, (len(d)-a)//s.size*s.size )
+ return s.iter_unpack( d[a:a+size] )
+
+
+class Cr3:
+  CMT_TAGS = { b'CMT1', b'CMT2', b'CMT3', b'CMT4', b'CMTA' }
+
+  def __init__(self, reader, profiler=None): #parsing displays nothing, see Display.display_tree()
+    self.reader = reader
+    self.profiler = NULL_PROFILER if profiler is None else profiler #see Profiler
+    self.count = dict()
+    #keep important values
+    self.cr3 = dict()
+    self.frame_indexes = dict() #FrameIndex per trak
+    self.tree = BoxNode(None, 0, getattr(reader, 'filesize', 0)) #parsed boxes, see BoxTree
+
+  @property
+  def box_list(self): #(depth, name, offset, size) of parsed boxes, in parsing order
+    return [ (depth, node.name, node.offset, node.size) for depth, node in self.tree.walk() ]
+
+  #CTMD INDEX, content is in mdat
+  def ctmd(self, d, l, depth, base, name):
+    self.profiler.enter('classes', 'Ctmd')
+    _ctmd = Ctmd(d, l, base, name ) #parse index
+    _ctmd.profiler = self.profiler
+    self.profiler.leave( len(d) )
+    return _ctmd
+
+  #to parse Canon CR3 ISO Base File format
+  def ftyp(self, b, d, l, depth):
+    return bytes(d[:4]) #major brand, other fields are rendered by Display
+
+  def moov(self, b, d, l, depth):
+    return
+
+  def uuid(self, b, d, l, depth):
+    uuidValue = bytes(d[:16])
+    return uuidValue
+
+  S_STSZ = Struct('>LL')
+  def stsz(self, b, d, l, depth):
+    size, count = Cr3.S_STSZ.unpack_from(d, 4) #after version and flags
+    if size!=0:
+      size_list = array( SIZE_CODE, [ size ] ) * count
+    else:
+      size_list = getArrayBE( SIZE_CODE, d, 12, count )
+    return size_list
+
+  def co64(self, b, d, l, depth):
+    count = getLongBE(d, 4)
+    offset_list = getArrayBE( 'Q', d, 8, count )
+    return offset_list
+
+  S_STSC_ENTRY = Struct('>LLL')
+  NT_STSC_ENTRY = namedtuple('stsc_entry', 'first_chunk samples description')
+  def stsc(self, b, d, l, depth): #sample to chunk
+    count = getLongBE(d, 4)
+    entry_list = list( map( Cr3.NT_STSC_ENTRY._make, getEntries( Cr3.S_STSC_ENTRY, d, 8, count ) ) )
+    return entry_list
+
+  S_STTS_ENTRY = Struct('>LL')
+  def stts(self, b, d, l, depth): #time to sample, (count, delta) list
+    count = getLongBE(d, 4)
+    entry_list = list( getEntries( Cr3.S_STTS_ENTRY, d, 8, count ) )
+    return entry_list
+
+  def mdhd(self, b, d, l, depth): #returns timescale
+    version = d[0]
+    timescale = getLongBE(d, 20 if version==1 else 12)
+    return timescale
+
+  S_PRVW = Struct('>LHHHHL')
+  NT_PRVW = namedtuple('prvw', 'w h size')
+  def prvw(self, b, d, l, depth):
+    _, _, w, h, _, jpegSize = Cr3.S_PRVW.unpack_from(d, 0)
+    _prvw = Cr3.NT_PRVW( w, h, jpegSize)
+    return _prvw
+
+  S_THMB = Struct('>LHHLHH')
+  NT_THMB = namedtuple('thmb', 'w h size')
+  def thmb(self, b, d, l, depth):
+    _, w, h, jpegSize, _, _ = Cr3.S_THMB.unpack_from(d, 0)
+    _thmb = Cr3.NT_THMB( w, h, jpegSize)
+    return _thmb
+
+  S_CTBO_LINE = Struct('>LQQ')
+  NT_CTBO_LINE = namedtuple('ctbo_line', 'index offset size')
+  def ctbo(self, b, d, l, depth):
+    nbLine = getLongBE( d, 0 )
+    offsetList = { line[0]: line for line in map( Cr3.NT_CTBO_LINE._make, getEntries( Cr3.S_CTBO_LINE, d, 4, nbLine ) ) }
+    return offsetList
+
+  def cncv(self, b, d, l, depth):
+    d = bytes(d)
+    return d
+
+  def cdi1(self, b, d, l, depth): #2 shorts
+    return tuple( getShortBE(d, i) for i in range(0, 4, 2) )
+
+  def iad1(self, b, d, l, depth): #shorts
+    return tuple( getShortBE(d, i) for i in range(0, len(d)//2*2, 2) )
+
+  #offset does start after name, thus +8 when including size (long) and name (4*char)
+  S_CMP1 = Struct('>HHHHLLLLBBBBL')
+  NT_CMP1 = namedtuple('cmp1', 'iw ih tw th d p cfa extra wl b35 hsize')
+  def cmp1(self, b, d, l, depth):
+    _, size, version, _, iw, ih, tw, th, _32, _33, _34, b35, hsize = Cr3.S_CMP1.unpack_from(d, 0)
+    bits = int(_32)
+    planes = int(_33)>>4
+    cfa = int(_33)&0xf
+    extra = int(_34)>>4
+    wavelets = int(_34)&0xf
+    cmp = Cr3.NT_CMP1(iw, ih, tw, th, bits, planes, cfa, extra, wavelets, b35, hsize)
+    return cmp
+
+  S_CRAW = Struct('>LL16sHHHHHHLH32sHHHH')
+  NT_CRAW = namedtuple('craw', 'w h bits')
+  def craw(self, b, d, l, depth):
+    _, _, _, w, h, _, _, _, _, _, _, _, bits, _, _, _ = Cr3.S_CRAW.unpack_from(d, 0)
+    _craw = Cr3.NT_CRAW( w, h, bits)
+    return _craw
+
+  def cnop(self, b, d, l, depth):
+    return
+
+  tags = { b'ftyp':ftyp, b'moov':moov, b'uuid':uuid, b'stsz':stsz, b'co64':co64, b'stsc':stsc, b'stts':stts, b'mdhd':mdhd, b'PRVW':prvw, b'CTBO':ctbo, b'THMB':thmb, b'CNCV':cncv,
+           b'CDI1':cdi1, b'IAD1':iad1, b'CMP1':cmp1, b'CRAW':craw, b'CNOP':cnop }
+  #handlers only needing the start of the payload (before jpeg data, or inner boxes)
+  PAYLOAD_LIMITS = { b'uuid':BoxReader.UUID_LEN, b'PRVW':S_PRVW.size, b'THMB':S_THMB.size }
+
+  #walk boxes between start and end (absolute offsets). Payloads are only read when needed,
+  #as memoryviews on the mapped file (no copy) with BoxReader
+  def parse(self, start=0, end=None, depth=0, parent=None):
+    reader = self.reader
+    parent = self.tree if parent is None else parent
+    cr3 = self.cr3
+    count = self.count
+    profiler = self.profiler
+    o = start
+    for box in reader.boxes(start, end):
+      chunkName = box.name
+      l = box.size
+      o = box.offset
+      no = box.hsize #next offset to look for data
+      profiler.enter('boxes', chunkName)
+      nbytes = 0 #payload bytes given to handlers
+      node = parent.add( BoxNode(chunkName, o, l) )
+
+      if chunkName not in count: #enumerate atom to create unique ID
+        count[ chunkName ] = 1
+      else:
+        count[ chunkName ] = count[ chunkName ] +1
+      if chunkName == b'trak':  #will keep stsz and co64 per trak
+        trakName = 'trak%d' % count[b'trak']
+        if trakName not in cr3:
+          cr3[ trakName ] = dict()
+
+      if chunkName in Cr3.tags: #dedicated parsing
+        d = reader.payload( box, Cr3.PAYLOAD_LIMITS.get(chunkName) )
+        nbytes = len(d)
+        profiler.enter('handlers', chunkName)
+        r = Cr3.tags[chunkName](self, o, d, l, depth+1) #return results
+        profiler.leave( nbytes )
+        node.value = r
+      elif chunkName in Cr3.CMT_TAGS:
+        d = bytes(reader.payload(box))
+        nbytes = len(d)
+        profiler.enter('classes', 'TiffIfd')
+        tiff = TiffIfd( d, l, o+no, chunkName, False )
+        profiler.leave( nbytes )
+        node.value = tiff
+        cr3[ chunkName ] = ( o+no, tiff )
+      elif chunkName == b'CTMD':
+        d = bytes(reader.payload(box))
+        nbytes = len(d)
+        r = self.ctmd( d, l, depth+1, o+no, chunkName )
+        r.trak = 'trak%d' % count[b'trak'] #trak of CTMD samples
+        node.value = r
+        cr3[ chunkName ] = r
+
+      inner = reader.children(box) #containers, and boxes with inner boxes at specific offsets
+      if inner:
+        self.parse( inner[0], inner[1], depth+1, node )
+
+      #post processing
+      if chunkName in (b'stsz', b'co64', b'stsc', b'stts', b'mdhd', b'CRAW', b'CMP1'):  #keep these values per trak
+        trakName = 'trak%d' % count[b'trak']
+        cr3[ trakName ][ chunkName ] = r
+      elif chunkName == b'CNCV' or chunkName == b'CTBO' or chunkName == b'ftyp':
+        cr3[ chunkName ] = r
+      elif chunkName == b'PRVW' or chunkName == b'THMB':
+        cr3[ chunkName ] = o+no, r  #save chunk offset
+      elif chunkName == b'uuid':
+        if r == BoxReader.UUID_CNOP:
+          cr3[ r ] = o #save offset
+      profiler.leave( nbytes )
+      o += l
+    return o
+
+  HEADER_READ_SIZE = 0x10000 #ftyp and moov are usually inside the first 64KB
+  CTBO_PREVIEW = 2
+  CTBO_CMTA = 5
+  #CTBO areas read by parse_headers(), and how many bytes (None for all)
+  CTBO_HEADER_AREAS = { CTBO_PREVIEW:0x200, CTBO_CMTA:None }
+
+  def parse_headers(self):
+    '''header only parsing: ftyp, moov, then uuid areas listed in CTBO (PRVW header, CMTA). mdat is never read.
+    With a PreadReader, this is a few positioned reads per file'''
+    o = self.parse_moov()
+    self.parse_areas()
+    return o
+
+  def parse_moov(self):
+    '''first step of parse_headers(): top level boxes up to moov (all but mdat without CTBO)'''
+    reader = self.reader
+    if hasattr(reader, 'load'):
+      reader.load(0, Cr3.HEADER_READ_SIZE)
+    o = 0
+    for box in reader.boxes(0, reader.filesize):
+      if box.name == b'mdat':
+        continue
+      if hasattr(reader, 'load'):
+        reader.load(box.offset, box.size)
+      o = self.parse(box.offset, box.offset+box.size)
+      if box.name == b'moov' and b'CTBO' in self.cr3: #other areas are listed in CTBO
+        break
+    return o
+
+  def header_areas(self):
+    '''(offset, size, size to read) of CTBO areas parsed by parse_areas(), known once moov is parsed'''
+    areas = []
+    if b'CTBO' in self.cr3:
+      for line in self.cr3[b'CTBO'].values():
+        if line.index in Cr3.CTBO_HEADER_AREAS and line.size > 0:
+          size = Cr3.CTBO_HEADER_AREAS[ line.index ]
+          areas.append( (line.offset, line.size, line.size if size is None else min(size, line.size)) )
+    return areas
+
+  def parse_areas(self):
+    '''second step of parse_headers(): areas listed in CTBO'''
+    for offset, size, read_size in self.header_areas():
+      if hasattr(self.reader, 'load'):
+        self.reader.load(offset, read_size)
+      self.parse(offset, offset+size)
+
+  def getIfd(self, name, details): # details is dict with 'picture', 'type', 'tag'
+    cr3 = self.cr3
+    if name in Cr3.CMT_TAGS:
+      if name in cr3:
+        return cr3[name][1]
+    elif name== b'CTMD':
+      if 'picture' in details:
+        pic_num = details[ 'picture' ]
+      else:
+        pic_num = 0
+      ctmd = self.get_ctmd_picture( pic_num )
+      if ctmd and 'type' in details:
+        if details[ 'type' ] in Ctmd.CTMD_TIFF_TYPES:
+          for ctmd_record in ctmd.values():
+            if ctmd_record.type == details[ 'type' ]:
+              for subdir_tag, tiff_subdir in ctmd_record.content.items():
+                offset, payload_size, payload_tag, entries = tiff_subdir
+                if details[ 'tag' ] == payload_tag:
+                  return entries[1]
+    return None
+
+  def get_crx_version(self):
+    '''CRX codec version, from CNCV name: 2 for CanonCR3_002, 1 for CanonCR3_001 or CanonCRM0001'''
+    if b'CNCV' not in self.cr3:
+      return 1
+    name = self.cr3[b'CNCV'].split(b'/')[0]
+    digits = name[ len(name.rstrip(b'0123456789')): ]
+    return int(digits) if digits else 1
+
+  def is_crm(self):
+    return b'CNCV' in self.cr3 and self.cr3[b'CNCV'].find(b'CanonCRM')>=0
+
+  def is_cr3(self):
+    return b'CNCV' in self.cr3 and self.cr3[b'CNCV'].find(b'CanonCR3')>=0
+
+  def get_frame_index(self, trak):
+    '''FrameIndex of samples of trak, built once. Can be set with a FrameIndex.load() result'''
+    if trak not in self.frame_indexes:
+      if trak not in self.cr3 or b'co64' not in self.cr3[trak]:
+        return None
+      self.frame_indexes[ trak ] = FrameIndex.from_trak( self.cr3[trak] )
+    return self.frame_indexes[ trak ]
+
+  def get_crx_trak(self):
+    #main CRX picture: trak1 for CRM frames, trak3 for CR3
+    return 'trak1' if self.is_crm() else 'trak3'
+
+  def get_ctmd_index(self):
+    '''FrameIndex of CTMD samples (trak4 in CR3, trak2 in CRM, see Ctmd.trak), None if missing'''
+    if b'CTMD' not in self.cr3:
+      return None
+    return self.get_frame_index( self.cr3[b'CTMD'].trak )
+
+  def get_ctmd(self):
+    #CTMD records are in mdat, pointed by the trak of CTMD
+    _ctmd = self.cr3[b'CTMD']
+    index = self.get_ctmd_index()
+    _ctmd.offsets = index.offsets
+    _ctmd.sizes = index.sizes
+    return _ctmd
+
+  def parse_ctmd(self):
+    _ctmd = self.get_ctmd()
+    self.profiler.enter('classes', 'Ctmd.parse')
+    _ctmd.parse( self.reader )
+    self.profiler.leave( sum(_ctmd.sizes) )
+    return _ctmd
+
+  def ctmd_pictures(self, start=0, tiff=False):
+    '''yields (picture number, CTMD records) from start, one picture at a time. With tiff=False, use
+    Ctmd.get_tiff() to decode TIFF records'''
+    return self.get_ctmd().pictures( self.reader, start, tiff )
+
+  def get_ctmd_picture(self, pic_num=0, tiff=True):
+    '''CTMD records of one picture, from parse_ctmd() results or with one read. None if missing'''
+    if self.get_ctmd_index() is None:
+      return None
+    _ctmd = self.get_ctmd()
+    if hasattr(_ctmd, 'ctmd_list'):
+      return _ctmd.ctmd_list.get( pic_num )
+    for _, records in _ctmd.pictures( self.reader, pic_num, tiff ):
+      return records
+    return None
+
+  def get_timestamp(self, pic_num=0):
+    '''CTMD time stamp of a picture or CRM frame, as Ctmd.NT_CTMD_TIMESTAMP. None if missing'''
+    records = self.get_ctmd_picture( pic_num, tiff=False )
+    if records and Ctmd.CTMD_TYPE_TIMESTAMP in records:
+      return records[ Ctmd.CTMD_TYPE_TIMESTAMP ].content
+    return None
+
+  def get_sample(self, trak, index=0):
+    '''memoryview on picture #index of trak, in mdat. None if missing'''
+    frames = self.get_frame_index( trak )
+    if frames is None or index >= len(frames):
+      return None
+    frame = frames.frame( index )
+    return self.reader.read( frame.offset, frame.size )
+
+  def get_thumbnail_range(self): #(offset, size) of THMB jpeg in file, None if missing
+    if b'THMB' not in self.cr3:
+      return None
+    offset, thmb = self.cr3[b'THMB']
+    return offset+Cr3.S_THMB.size, thmb.size
+
+  def get_preview_range(self): #(offset, size) of PRVW jpeg in file, None if missing
+    if b'PRVW' not in self.cr3:
+      return None
+    offset, prvw = self.cr3[b'PRVW']
+    return offset+Cr3.S_PRVW.size, prvw.size
+
+  def get_jpeg_range(self): #(offset, size) of full size jpeg (trak1 of CR3), None if missing
+    frames = self.get_frame_index( 'trak1' )
+    if self.is_crm() or frames is None or len(frames) == 0:
+      return None
+    frame = frames.frame( 0 )
+    return frame.offset, frame.size
+
+  def get_thumbnail(self):
+    r = self.get_thumbnail_range()
+    return None if r is None else self.reader.read( *r )
+
+  def get_preview(self):
+    r = self.get_preview_range()
+    return None if r is None else self.reader.read( *r )
+
+  def get_crx(self, trak, index=0, header_only=False):
+    '''Crx header parser for picture #index of trak. With header_only, only tile/plane/subband headers are read'''
+    frames = self.get_frame_index( trak )
+    if frames is None or index >= len(frames):
+      return None
+    frame = frames.frame( index )
+    sample = self.reader.read( frame.offset, self.cr3[trak][b'CMP1'].hsize if header_only else frame.size )
+    crx = Crx( frame.offset, sample, self.cr3[trak][b'CMP1'], self.get_crx_version() )
+    self.profiler.enter('classes', 'Crx.parse_tile')
+    crx.parse_tile()
+    self.profiler.leave( self.cr3[trak][b'CMP1'].hsize )
+    return crx
+
+  def get_raw(self, trak='trak3', index=0, jobs=None, reduction=0, crx=None):
+    '''decoded CRX picture #index of trak, as numpy Bayer array, using jobs processes. None if not supported.
+    With reduction, lossy picture is 2**reduction times smaller: only headers and coarse subbands are read.
+    crx is the result of get_crx() for this picture, when already parsed (subbands missing in its data are read)'''
+    from CRaw3.CrxDecoder import CrxDecoder #needs numpy
+    if crx is None:
+      crx = self.get_crx(trak, index, header_only=reduction>0)
+    if crx is None or not crx.tiles:
+      return None
+    return CrxDecoder( crx, self.reader ).decode(jobs, reduction)
+
+  def get_values(self, ifd, tag): #decoded once per ifd, see TiffIfd.get()
+    return ifd.get( tag )
+
+  NT_SENSOR_INFO = namedtuple('sensorInfo','w h lb tb rb bb')
+  def get_sensor_info(self):
+    cmt3 = self.getIfd( b'CMT3', None )
+    _, SensorWidth, SensorHeight, _, _, SensorLeftBorder, SensorTopBorder, SensorRightBorder, SensorBottomBorder, *_ = self.get_values( cmt3, TiffIfd.TIFF_MAKERNOTE_SENSORINFO )
+    return Cr3.NT_SENSOR_INFO( SensorWidth, SensorHeight, SensorLeftBorder, SensorTopBorder, SensorRightBorder, SensorBottomBorder )
+
+  def get_camera_settings(self):
+    return self.get_values( self.getIfd( b'CMT3', None ), TiffIfd.TIFF_MAKERNOTE_CAMERASETTINGS )
+
+  def get_roll_info(self): #only in CSI_* files (raw burst mode). (length, current, total)
+    cmt3 = self.getIfd( b'CMT3', None )
+    if cmt3 and TiffIfd.TIFF_MAKERNOTE_ROLLINFO in cmt3.ifd:
+      return self.get_values( cmt3, TiffIfd.TIFF_MAKERNOTE_ROLLINFO )
+    return None
+
+  def get_model_id(self):
+    return self.getIfd( b'CMT3', None ).ifd[ TiffIfd.TIFF_MAKERNOTE_MODELID ].value
+
+  def get_model_name(self):
+    return self.getIfd( b'CMT1', None ).get( TiffIfd.TIFF_EXIF_Model )
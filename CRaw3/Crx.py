@@ -1,21 +1,28 @@
 
+import logging
 from struct import Struct
 from collections import namedtuple
 from binascii import hexlify
 
+logger = logging.getLogger(__name__)
+
 class Crx:    
 
-  def __init__(self, base, data, cmp1):
+  def __init__(self, base, data, cmp1, version=1):
     self.base = base
     self.data = data
     self.cmp1 = cmp1
+    self.version = version #codec version, from CNCV: 1 for CanonCR3_001, 2 for CanonCR3_002
     self.tiles = dict()
     self.planes = dict()
     self.subbands = dict()
     
   S_CRXSUBBAND = Struct('>HHLL')
-  NT_CRXSUBBAND = namedtuple('crx_subband', 'index offset size supportsPartial quantValue val_19bits')
+  S_CRXSUBBAND2 = Struct('>HHLLLH2s') #v2: quantization step base and multiplier
+  #quantization steps of v2 are per line, qStepBase and qStepMult are 0 with v1
+  NT_CRXSUBBAND = namedtuple('crx_subband', 'index offset size supportsPartial quantValue val_19bits qStepBase qStepMult', defaults=(0, 0))
   SUBBAND_MARKER = 0xff03
+  SUBBAND_MARKER2 = 0xff13
 
   def parse_subband(self, d, ptotal, tindex, pindex):
   
@@ -23,11 +30,18 @@ class Crx:
     dataOffset = self.planes[tindex][pindex].offset 
     
     while dataOffset < self.planes[tindex][pindex].offset + ptotal: #stay in current plane data
-      sign, length, sb_size, val = Crx.S_CRXSUBBAND.unpack_from(d, offset)
-      #print('    %8x %d %8x %8x' % (sign, length, sb_size, val))
-      if sign!= Crx.SUBBAND_MARKER or length!=8: 
-        print('error: sign != Crx.SUBBAND_MARKER or length != 8')
-        return
+      qStepBase = qStepMult = 0
+      if self.version == 2:
+        sign, length, sb_size, val, qStepBase, qStepMult, _ = Crx.S_CRXSUBBAND2.unpack_from(d, offset)
+        if sign != Crx.SUBBAND_MARKER2 or length != 16:
+          logger.error('sign != Crx.SUBBAND_MARKER2 or length != 16')
+          return
+      else:
+        sign, length, sb_size, val = Crx.S_CRXSUBBAND.unpack_from(d, offset)
+        #print('    %8x %d %8x %8x' % (sign, length, sb_size, val))
+        if sign!= Crx.SUBBAND_MARKER or length!=8: 
+          logger.error('sign != Crx.SUBBAND_MARKER or length != 8')
+          return
       sb_index        = (val & 0xf0000000)>>28
       supportsPartial = (val & 0x08000000)>>27
       quantValue      = (val & 0x07f80000)>>19
@@ -37,31 +51,33 @@ class Crx:
         self.subbands[tindex] = dict()
       if pindex not in self.subbands[tindex]:
         self.subbands[tindex][pindex] = dict()
-      self.subbands[tindex][pindex][sb_index] = Crx.NT_CRXSUBBAND(sb_index, dataOffset, sb_size, supportsPartial, quantValue, _19bits )  
+      self.subbands[tindex][pindex][sb_index] = Crx.NT_CRXSUBBAND(sb_index, dataOffset, sb_size, supportsPartial, quantValue, _19bits, qStepBase, qStepMult )  
       
-      offset = offset + Crx.S_CRXSUBBAND.size
+      offset = offset + self.subband_header_size()
       dataOffset = dataOffset + sb_size
       
     n_subbands = len(self.subbands[tindex][pindex])    
-    if self.cmp1.wl>0 and n_subbands!=10 or self.cmp1.wl==0 and n_subbands!=1:
-      print('error: self.cmp1.wl>0 and n_subbands!=10 or self.cmp1.wl==0 and n_subbands!=1')
+    if n_subbands != 3*self.cmp1.wl+1:
+      logger.error('%d subbands, %d wavelet levels', n_subbands, self.cmp1.wl)
 
     return n_subbands
 
   S_CRXPLANE = Struct('>HHLL')
   NT_CRXPLANE = namedtuple('crx_plane', 'index offset size supportsPartial roundedBits')
   PLANE_MARKER = 0xff02
+  PLANE_MARKER2 = 0xff12
   
   def parse_plane(self, d, ttotal, tindex):
   
     offset = 0
-    dataOffset = self.tiles[tindex].offset
+    tile = self.tiles[tindex]
+    dataOffset = tile.offset + tile.qpSize + tile.extraSize #v2: quantization data is before planes
     
-    while dataOffset < self.tiles[tindex].offset + ttotal:    
+    while dataOffset < tile.offset + ttotal:    
       sign, length, psize, val = Crx.S_CRXPLANE.unpack_from(d, offset)
       #print('  %8x %d %8x %8x' % (sign, length, psize, val))
-      if sign != Crx.PLANE_MARKER or length != 8:
-        print('error: sign != Crx.PLANE_MARKER or length != 8')
+      if sign != (Crx.PLANE_MARKER2 if self.version == 2 else Crx.PLANE_MARKER) or length != 8:
+        logger.error('sign != Crx.PLANE_MARKER or length != 8')
         return
       pindex            = (val & 0xf0000000)>>28
       supportsPartial  = (val & 0x08000000)>>27
@@ -75,18 +91,26 @@ class Crx:
       offset = offset + Crx.S_CRXPLANE.size
       
       n_subbands = self.parse_subband( d[offset:], psize, tindex, pindex)
+      if n_subbands is None:
+        return
       
       if psize != sum( [ self.subbands[tindex][pindex][c].size for c in range(n_subbands) ] ):
-        print('error: size(plane) != sum( inner subbands)')
+        logger.error('size(plane) != sum( inner subbands)')
 
-      offset += (n_subbands*Crx.S_CRXSUBBAND.size)
+      offset += (n_subbands*self.subband_header_size())
       dataOffset += psize
 
     return len(self.planes[tindex])
     
   S_CRXTILE = Struct('>HHLH2s')
-  NT_CRXTILE = namedtuple('crx_tile', 'index offset size')
+  S_CRXTILE2 = Struct('>HHLH2sLHH') #v2 with 16 bytes: sizes of quantization data and extra data, 0
+  #qpSize and extraSize are 0 with v1
+  NT_CRXTILE = namedtuple('crx_tile', 'index offset size qpSize extraSize', defaults=(0, 0))
   TILE_MARKER = 0xff01
+  TILE_MARKER2 = 0xff11
+
+  def subband_header_size(self):
+    return Crx.S_CRXSUBBAND2.size if self.version == 2 else Crx.S_CRXSUBBAND.size
     
   def parse_tile(self):
   
@@ -96,20 +120,31 @@ class Crx:
     while offset+Crx.S_CRXTILE.size <= self.cmp1.hsize: #header size from cmp1, bug in Canon code: for small crx, header size in cmp1 is 4 bytes too big for parsing
       sign, length, tsize, tindex, _ = Crx.S_CRXTILE.unpack_from(self.data, offset)
       #print('%8x %d %8x %d' % (sign, length, tsize, tindex))
-      if sign != Crx.TILE_MARKER or length != 8:   #r3 craw, r5m2 craw
-        print('not supported: 0x%08x, sign (0x%04x) != Crx.TILE_MARKER or length (%d) != 8' % (self.base+offset, sign, length))
+      qpSize = extraSize = 0
+      if self.version == 2 and sign == Crx.TILE_MARKER2 and length == 16:   #r3 craw, r5m2 craw
+        if offset+Crx.S_CRXTILE2.size > len(self.data): #truncated header only data
+          logger.warning('not supported: 0x%08x, tile header truncated', self.base+offset)
+          return
+        _, _, _, _, _, qpSize, extraSize, zero = Crx.S_CRXTILE2.unpack_from(self.data, offset)
+        if zero != 0:
+          logger.warning('not supported: 0x%08x, tile header ends with 0x%04x', self.base+offset, zero)
+          return
+      elif sign != (Crx.TILE_MARKER2 if self.version == 2 else Crx.TILE_MARKER) or length != 8:
+        logger.warning('not supported: 0x%08x, sign (0x%04x) != Crx.TILE_MARKER or length (%d) != 8, version %d', self.base+offset, sign, length, self.version)
         return
-      self.tiles[tindex] = Crx.NT_CRXTILE(tindex, dataOffset, tsize)
-      offset = offset + Crx.S_CRXTILE.size
+      self.tiles[tindex] = Crx.NT_CRXTILE(tindex, dataOffset, tsize, qpSize, extraSize)
+      offset = offset + 4 + length
       if self.cmp1.wl > 0:
-        n_subband = 10
+        n_subband = 3*self.cmp1.wl + 1
       else:
         n_subband = 1
       n_plane = self.parse_plane(self.data[offset:], tsize, tindex)
-      if tsize != sum( [ self.planes[tindex][c].size for c in range(n_plane) ] ):
-        print('error: size(tile) != sum( inner planes)')
+      if n_plane is None:
+        return
+      if tsize != qpSize + extraSize + sum( [ self.planes[tindex][c].size for c in range(n_plane) ] ):
+        logger.error('size(tile) != sum( inner planes)')
 
-      offset = offset + (((n_subband*Crx.S_CRXSUBBAND.size)+Crx.S_CRXPLANE.size)*n_plane)
+      offset = offset + (((n_subband*self.subband_header_size())+Crx.S_CRXPLANE.size)*n_plane)
       dataOffset += tsize
 
     return offset
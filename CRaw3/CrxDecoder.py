@@ -0,0 +1,555 @@
+'''
+CRX decoder, using the tile/plane/subband index built by Crx
+
+lossless planes (cmp1.wl==0) have one subband, coded with adaptive Golomb-Rice codes, run length mode and
+Median Edge Detection prediction, like JPEG-LS (see readme). Planes are placed in a Bayer array of
+CMP1 width and height, according to cfa layout.
+
+lossy planes (cmp1.wl levels of wavelets) have 3*wl+1 subbands. LL is coded like a lossless plane, other
+subbands are not predicted. Subbands are dequantized, then the inverse LeGall 5/3 transform is done on whole
+rows and columns with numpy. Subbands of a tile include the coefficients of neighbour tiles needed at its borders.
+
+the bitstream is converted to a list of big endian 32 bits words with numpy, the entropy decoder keeps
+a few bits of it in a Python int. Runs and Bayer placement are done with slices. Needs numpy
+
+tiles and planes are independent: decode(jobs) spreads (tile, plane) units over forked processes, sharing the
+sample and writing into one shared Bayer array
+
+lossy pictures can be decoded at 1/2, 1/4 or 1/8 scale (reduction 1 to wl), stopping the inverse transform
+before the finest levels: their subbands are not read
+'''
+
+import logging
+import mmap
+import multiprocessing
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class CrxDecoder:
+  #run length mode, like JPEG-LS: J[s] bits for the remaining symbols, JS[s] = 1<<J[s]
+  J = [ 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 5, 5, 6, 6, 7, 7, 8, 9, 10, 11, 12, 13, 14, 15 ]
+  JS = [ 1<<j for j in J ]
+  ESCAPE_ZEROS = 41 #at least 41 zeros: error code is coded on 21 bits
+  ESCAPE_BITS = 21
+  K_MAX = 15
+  Q_STEP = [ 0x28, 0x2D, 0x33, 0x39, 0x40, 0x48 ] #dequantization steps, per quantValue%6
+  #coefficients of the right (or bottom) neighbour tile in (high, low) subbands, per level from the finest.
+  #Index is wavelet levels-1, then tile width (or height) & 7
+  EX_COEF = [ [ (1,1), (1,0), (1,1), (1,0), (1,1), (1,0), (1,1), (1,0) ],
+              [ (1,1,1,1), (1,0,1,0), (1,2,2,1), (1,1,1,1), (1,1,1,1), (1,0,1,0), (1,2,2,1), (1,1,1,1) ],
+              [ (1,1,1,1,1,1), (1,0,1,0,1,0), (1,2,2,2,2,1), (1,1,1,2,2,1), (1,1,1,2,2,1), (1,0,1,1,1,1),
+                (1,2,2,1,1,1), (1,1,1,1,1,1) ] ]
+  #(row, column) of planes 0 to 3 in 2x2 Bayer cell, per cfa layout
+  CFA_OFFSETS = { 0: ((0,0), (0,1), (1,0), (1,1)),   #RGGB
+                  1: ((0,1), (0,0), (1,1), (1,0)),   #GRBG
+                  2: ((1,0), (1,1), (0,0), (0,1)),   #GBRG
+                  3: ((1,1), (1,0), (0,1), (0,0)) }  #BGGR
+
+  def __init__(self, crx, reader=None):
+    self.crx = crx
+    self.reader = reader #for subbands after crx.data, when crx has only headers
+    cmp1 = crx.cmp1
+    self.cmp1 = cmp1
+    #with 4 planes, each plane has half width and half height of the picture, tiles too
+    self.plane_width = cmp1.iw//2
+    self.plane_height = cmp1.ih//2
+    self.tile_width = cmp1.tw//2
+    self.tile_height = cmp1.th//2
+    self.tile_cols = (self.plane_width + self.tile_width - 1) // self.tile_width
+    self.tile_rows = (self.plane_height + self.tile_height - 1) // self.tile_height
+
+  @staticmethod
+  def reduced(length, reduction):
+    '''length after reduction levels of wavelets, each one keeping (length+1)//2 low coefficients'''
+    for level in range(reduction):
+      length = (length+1) >> 1
+    return length
+
+  def tile_area(self, tindex, reduction=0):
+    '''(row, column, height, width) of tile in plane coordinates, at 1/2**reduction scale'''
+    tr, tc = divmod( tindex, self.tile_cols )
+    row = tr*self.tile_height
+    col = tc*self.tile_width
+    height = min(self.tile_height, self.plane_height-row)
+    width = min(self.tile_width, self.plane_width-col)
+    if reduction:
+      return ( tr*CrxDecoder.reduced(self.tile_height, reduction), tc*CrxDecoder.reduced(self.tile_width, reduction),
+        CrxDecoder.reduced(height, reduction), CrxDecoder.reduced(width, reduction) )
+    return row, col, height, width
+
+  def subband_data(self, tindex, pindex, sindex=0):
+    subband = self.crx.subbands[tindex][pindex][sindex]
+    start = subband.offset - self.crx.base
+    if start+subband.size > len(self.crx.data) and self.reader is not None:
+      return self.reader.read( subband.offset, subband.size )
+    return self.crx.data[ start: start+subband.size ]
+
+  @staticmethod
+  def words(data):
+    '''bitstream as a list of big endian 32 bits words, zero padded'''
+    padded = bytes(data) + bytes( 8 + (-len(data) & 3) )
+    return np.frombuffer(padded, dtype='>u4').tolist()
+
+  #bit reader: acc keeps n bits not yet read, words[wi] is the next 32 bits word. State is passed and
+  #returned, to keep it in local variables of decode_lossless()
+  @staticmethod
+  def get_bits(words, acc, n, wi, count):
+    if n < count:
+      acc = (acc << 32) | words[wi]
+      wi += 1
+      n += 32
+    n -= count
+    return acc >> n, acc & ((1 << n) - 1), n, wi
+
+  @staticmethod
+  def get_code(words, acc, n, wi, k):
+    '''adaptive Golomb-Rice code with parameter k'''
+    z = 0
+    while not acc: #count leading zeros
+      if wi >= len(words):
+        raise ValueError('end of bitstream')
+      z += n
+      acc = words[wi]
+      wi += 1
+      n = 32
+    bl = acc.bit_length()
+    z += n - bl
+    n = bl - 1
+    acc ^= 1 << n #one after the zeros
+    if z >= CrxDecoder.ESCAPE_ZEROS:
+      return CrxDecoder.get_bits( words, acc, n, wi, CrxDecoder.ESCAPE_BITS )
+    if k:
+      value, acc, n, wi = CrxDecoder.get_bits( words, acc, n, wi, k )
+      return (z << k) | value, acc, n, wi
+    return z, acc, n, wi
+
+  @staticmethod
+  def get_run(words, acc, n, wi, s, length):
+    '''number of symbols repeated (at most length) and updated run index s'''
+    J = CrxDecoder.J
+    get_bits = CrxDecoder.get_bits
+    count = 1
+    while True:
+      bit, acc, n, wi = get_bits( words, acc, n, wi, 1 )
+      if not bit:
+        break
+      count += CrxDecoder.JS[s]
+      if count > length:
+        count = length
+        break
+      if s < 31:
+        s += 1
+      if count == length:
+        break
+    if count < length:
+      if J[s]:
+        value, acc, n, wi = get_bits( words, acc, n, wi, J[s] )
+        count += value
+      if s > 0:
+        s -= 1
+      if count > length:
+        raise ValueError('run length')
+    return count, s, acc, n, wi
+
+  @staticmethod
+  def decode_lossless(data, width, height):
+    '''decodes one lossless plane of width x height values, as int32 array. Corrupted data raises ValueError or IndexError'''
+    get_bits = CrxDecoder.get_bits
+    get_code = CrxDecoder.get_code
+    get_run = CrxDecoder.get_run
+    ESCAPE_ZEROS = CrxDecoder.ESCAPE_ZEROS
+    K_MAX = CrxDecoder.K_MAX
+    words = CrxDecoder.words(data)
+    out = np.empty( (height, width), dtype=np.int32 )
+    acc = n = wi = 0
+    k = 0 #Golomb-Rice parameter
+    s = 0 #run length index
+
+    #line buffers have one value before and after the line
+    prev = [0]*(width+2)
+    cur = [0]*(width+2)
+    for y in range(height):
+      x = 0
+      length = width
+      if y == 0: #top line, prediction is left value
+        while length > 1:
+          if cur[x]:
+            pred = cur[x]
+          else:
+            bit, acc, n, wi = get_bits( words, acc, n, wi, 1 )
+            if bit:
+              count, s, acc, n, wi = get_run( words, acc, n, wi, s, length )
+              length -= count
+              cur[x+1: x+1+count] = [ cur[x] ]*count
+              x += count
+              if length <= 0:
+                break
+            pred = 0
+          code, acc, n, wi = get_code( words, acc, n, wi, k )
+          cur[x+1] = pred + (-(code & 1) ^ (code >> 1))
+          kp = k - (code < ((1 << k) >> 1)) + ((code >> k) > 2) + ((code >> k) > 5)
+          k = kp if kp < K_MAX else K_MAX
+          x += 1
+          length -= 1
+        if length == 1:
+          code, acc, n, wi = get_code( words, acc, n, wi, k )
+          cur[x+1] = cur[x] + (-(code & 1) ^ (code >> 1))
+          kp = k - (code < ((1 << k) >> 1)) + ((code >> k) > 2) + ((code >> k) > 5)
+          k = kp if kp < K_MAX else K_MAX
+          x += 1
+      else:
+        cur[0] = prev[1]
+        while length > 1:
+          a = cur[x]
+          b = prev[x+1]
+          if a != b or a != prev[x+2]: #median edge detection
+            c = prev[x]
+            d = b - c
+            if d >= 0:
+              pred = (b if a < b else a) if c < a else a + d
+            else:
+              pred = (b if a >= b else a) if c >= a else a + d
+            if acc: #most frequent case: get_code() inlined
+              bl = acc.bit_length()
+              z = n - bl
+              n = bl - 1
+              acc ^= 1 << n
+              if z >= ESCAPE_ZEROS:
+                code, acc, n, wi = get_bits( words, acc, n, wi, CrxDecoder.ESCAPE_BITS )
+              elif k:
+                if n < k:
+                  acc = (acc << 32) | words[wi]
+                  wi += 1
+                  n += 32
+                n -= k
+                code = (z << k) | (acc >> n)
+                acc &= (1 << n) - 1
+              else:
+                code = z
+            else:
+              code, acc, n, wi = get_code( words, acc, n, wi, k )
+          else:
+            bit, acc, n, wi = get_bits( words, acc, n, wi, 1 )
+            if bit:
+              count, s, acc, n, wi = get_run( words, acc, n, wi, s, length )
+              length -= count
+              cur[x+1: x+1+count] = [ a ]*count
+              x += count
+              if length <= 0:
+                break
+            pred = prev[x+1]
+            code, acc, n, wi = get_code( words, acc, n, wi, k )
+          cur[x+1] = pred + (-(code & 1) ^ (code >> 1))
+          #next gradient is used to predict k, but for the last value of the line (after a run)
+          if length > 1:
+            d = prev[x+2] - prev[x+1]
+            code = (code + (d+d if d >= 0 else -d-d)) >> 1
+          kp = k - (code < ((1 << k) >> 1)) + ((code >> k) > 2) + ((code >> k) > 5)
+          k = kp if kp < K_MAX else K_MAX
+          x += 1
+          length -= 1
+        if length == 1:
+          a = cur[x]
+          b = prev[x+1]
+          c = prev[x]
+          d = b - c
+          if d >= 0:
+            pred = (b if a < b else a) if c < a else a + d
+          else:
+            pred = (b if a >= b else a) if c >= a else a + d
+          code, acc, n, wi = get_code( words, acc, n, wi, k )
+          cur[x+1] = pred + (-(code & 1) ^ (code >> 1))
+          kp = k - (code < ((1 << k) >> 1)) + ((code >> k) > 2) + ((code >> k) > 5)
+          k = kp if kp < K_MAX else K_MAX
+          x += 1
+      cur[x+1] = cur[x] + 1
+      out[y] = cur[1: width+1]
+      prev, cur = cur, prev
+    return out
+
+  @staticmethod
+  def decode_noref(data, width, height):
+    '''decodes one high frequency subband of width x height values, as int32 array. Values are not predicted,
+    previous line only gives the context: run length mode when top, top right and left values are zero.
+    The k parameter of previous line is kept per column'''
+    get_bits = CrxDecoder.get_bits
+    get_code = CrxDecoder.get_code
+    get_run = CrxDecoder.get_run
+    K_MAX = CrxDecoder.K_MAX
+    words = CrxDecoder.words(data)
+    out = np.empty( (height, width), dtype=np.int32 )
+    acc = n = wi = 0
+    k = 0
+    s = 0
+
+    prev = [0]*(width+2)
+    cur = [0]*(width+2)
+    kline = [0]*(width+1) #k after each value of previous line
+    for y in range(height):
+      if y == 0:
+        x = 0
+        length = width
+        while length > 1:
+          if cur[x]:
+            code, acc, n, wi = get_code( words, acc, n, wi, k )
+            cur[x+1] = -(code & 1) ^ (code >> 1)
+          else:
+            bit, acc, n, wi = get_bits( words, acc, n, wi, 1 )
+            if bit:
+              count, s, acc, n, wi = get_run( words, acc, n, wi, s, length )
+              length -= count
+              cur[x+1: x+1+count] = [0]*count
+              kline[x: x+count] = [0]*count
+              x += count
+              if length <= 0:
+                break
+            #after a run (or a zero left value without run), value is not zero
+            code, acc, n, wi = get_code( words, acc, n, wi, k )
+            cur[x+1] = -((code+1) & 1) ^ ((code+1) >> 1)
+          #no K_MAX limit on the top line, like LibRaw crxDecodeTopLineNoRefPrevLine: clamping would desynchronize
+          #valid streams
+          k = k - (code < ((1 << k) >> 1)) + ((code >> k) > 2) + ((code >> k) > 5)
+          kline[x] = k
+          x += 1
+          length -= 1
+        if length == 1:
+          code, acc, n, wi = get_code( words, acc, n, wi, k )
+          cur[x+1] = -(code & 1) ^ (code >> 1)
+          k = k - (code < ((1 << k) >> 1)) + ((code >> k) > 2) + ((code >> k) > 5)
+          kline[x] = k
+          x += 1
+        cur[x+1] = 0
+      else:
+        x = 0
+        while x < width-1:
+          if prev[x+2] or prev[x+1] or cur[x]:
+            code, acc, n, wi = get_code( words, acc, n, wi, k )
+            cur[x+1] = -(code & 1) ^ (code >> 1)
+          else:
+            bit, acc, n, wi = get_bits( words, acc, n, wi, 1 )
+            if bit:
+              count, s, acc, n, wi = get_run( words, acc, n, wi, s, width-x )
+              cur[x+1: x+1+count] = [0]*count
+              kline[x: x+count] = [0]*count
+              x += count
+            if x >= width-1:
+              if x == width-1:
+                code, acc, n, wi = get_code( words, acc, n, wi, k )
+                cur[x+1] = -((code+1) & 1) ^ ((code+1) >> 1)
+                kp = k - (code < ((1 << k) >> 1)) + ((code >> k) > 2) + ((code >> k) > 5)
+                k = kp if kp < K_MAX else K_MAX
+                kline[x] = k
+              x += 1
+              continue
+            code, acc, n, wi = get_code( words, acc, n, wi, k )
+            cur[x+1] = -((code+1) & 1) ^ ((code+1) >> 1)
+          k = k - (code < ((1 << k) >> 1)) + ((code >> k) > 2) + ((code >> k) > 5)
+          #k of top right value, in previous line
+          if kline[x+1] - k > 1:
+            k += 1
+          elif k > K_MAX:
+            k = K_MAX
+          kline[x] = k
+          x += 1
+        if x == width-1:
+          code, acc, n, wi = get_code( words, acc, n, wi, k )
+          cur[x+1] = -(code & 1) ^ (code >> 1)
+          kp = k - (code < ((1 << k) >> 1)) + ((code >> k) > 2) + ((code >> k) > 5)
+          k = kp if kp < K_MAX else K_MAX
+          kline[x] = k
+      out[y] = cur[1: width+1]
+      prev, cur = cur, prev
+    return out
+
+  @staticmethod
+  def qscale(q):
+    '''dequantization factor of quantValue q'''
+    if q//6 >= 6:
+      return CrxDecoder.Q_STEP[q%6] << (q//6 - 6)
+    return CrxDecoder.Q_STEP[q%6] >> (6 - q//6)
+
+  @staticmethod
+  def band_extents(length, before, after, levels):
+    '''(output length, low band length, high band length) per level, from the finest. Subbands of a tile have
+    coefficients of neighbour tiles: one more high coefficient before the tile, EX_COEF after it'''
+    extra = CrxDecoder.EX_COEF[levels-1][length & 7] if after else (0,)*(2*levels)
+    extents = []
+    for level in range(levels):
+      odd = length & 1
+      own = (length+1) >> 1
+      low = own + extra[2*level+1]
+      high = own - odd + extra[2*level] + before
+      extents.append( (length if level == 0 else extents[-1][1], low, high) )
+      length = own
+    return extents
+
+  def band_sizes(self, tindex):
+    '''(height, width) of the 3*wl+1 subbands of a tile, coarse LL band first, then HL, LH and HH per level'''
+    tr, tc = divmod( tindex, self.tile_cols )
+    _, _, height, width = self.tile_area(tindex)
+    levels = self.cmp1.wl
+    cols = CrxDecoder.band_extents( width, tc > 0, tc < self.tile_cols-1, levels )
+    rows = CrxDecoder.band_extents( height, tr > 0, tr < self.tile_rows-1, levels )
+    sizes = [ (rows[-1][1], cols[-1][1]) ]
+    for level in reversed(range(levels)):
+      sizes += [ (rows[level][1], cols[level][2]), (rows[level][2], cols[level][1]), (rows[level][2], cols[level][2]) ]
+    return sizes
+
+  @staticmethod
+  def idwt53(low, high, length, before=False, after=False):
+    '''inverse LeGall 5/3 lifting along last axis, on whole arrays: length samples from low and high
+    coefficients. before: high starts with the coefficient before the first sample. after: low and high have
+    the coefficients after the last sample. Without neighbour, coefficients are mirrored'''
+    if length <= 1:
+      return low[..., :1]
+    even_count = (length+1)//2
+    odd_count = length//2
+    if not before:
+      high = np.concatenate( (high[..., :1], high), axis=-1 )
+    #high[..., i] is now coefficient i-1
+    if after:
+      count = even_count + 1 - length%2 #last odd sample needs next even sample
+      even = low[..., :count] - ((high[..., :count] + high[..., 1:count+1] + 2) >> 2)
+    else:
+      if high.shape[-1] < even_count+1:
+        high = np.concatenate( (high, high[..., -1:]), axis=-1 )
+      even = low[..., :even_count] - ((high[..., :even_count] + high[..., 1:even_count+1] + 2) >> 2)
+      if length%2 == 0:
+        even = np.concatenate( (even, even[..., -1:]), axis=-1 )
+    out = np.empty( low.shape[:-1]+(length,), dtype=low.dtype )
+    out[..., 0::2] = even[..., :even_count]
+    out[..., 1::2] = high[..., 1:odd_count+1] + ((even[..., :odd_count] + even[..., 1:odd_count+1]) >> 1)
+    return out
+
+  def decode_bands(self, tindex, pindex, count=None):
+    '''dequantized subbands of one lossy plane (count first ones), as list of int32 arrays'''
+    plane = self.crx.planes[tindex][pindex]
+    bands = []
+    for sindex, (height, width) in enumerate( self.band_sizes(tindex)[:count] ):
+      subband = self.crx.subbands[tindex][pindex][sindex]
+      size = subband.size - subband.val_19bits
+      if size <= 0 or width <= 0 or height <= 0:
+        values = np.zeros( (max(height, 0), max(width, 0)), dtype=np.int32 )
+      elif sindex == 0 and plane.supportsPartial:
+        values = CrxDecoder.decode_lossless( self.subband_data(tindex, pindex, sindex)[:size], width, height )
+      else:
+        values = CrxDecoder.decode_noref( self.subband_data(tindex, pindex, sindex)[:size], width, height )
+      q = CrxDecoder.qscale(subband.quantValue)
+      if q != 1:
+        values *= q
+      bands.append(values)
+    return bands
+
+  def decode_lossy(self, tindex, pindex, reduction=0):
+    '''values of one lossy plane: inverse wavelet transform of subbands, coarse level first. Rows (low and
+    high bands of a level) are transformed, then columns. The reduction finest levels are not done'''
+    tr, tc = divmod( tindex, self.tile_cols )
+    _, _, height, width = self.tile_area(tindex)
+    levels = self.cmp1.wl
+    left, right = tc > 0, tc < self.tile_cols-1
+    top, bottom = tr > 0, tr < self.tile_rows-1
+    cols = CrxDecoder.band_extents( width, left, right, levels )
+    rows = CrxDecoder.band_extents( height, top, bottom, levels )
+    bands = self.decode_bands(tindex, pindex, 1+3*(levels-reduction))
+    low = bands[0]
+    for level in reversed(range(reduction, levels)):
+      hl, lh, hh = bands[ 1+3*(levels-1-level): 4+3*(levels-1-level) ]
+      length = cols[level][0]
+      l = CrxDecoder.idwt53( low, hl, length, left, right )
+      h = CrxDecoder.idwt53( lh, hh, length, left, right )
+      low = CrxDecoder.idwt53( l.T, h.T, rows[level][0], top, bottom ).T
+    #coefficients of neighbour tiles are removed
+    return np.ascontiguousarray( low[ :CrxDecoder.reduced(height, reduction), :CrxDecoder.reduced(width, reduction) ] )
+
+  def decode_plane(self, tindex, pindex, reduction=0):
+    '''values of one plane of one tile, as int32 array (tile height, tile width), at 1/2**reduction scale.
+    None if not supported'''
+    _, _, height, width = self.tile_area(tindex)
+    plane = self.crx.planes[tindex][pindex]
+    if plane.roundedBits:
+      logger.warning('not supported: plane with roundedBits, tile %d plane %d', tindex, pindex)
+      return None
+    try:
+      if self.cmp1.wl != 0:
+        if self.crx.version == 2:
+          logger.warning('not supported: CRX v2 lossy plane (quantization per line), tile %d plane %d', tindex, pindex)
+          return None
+        if any( self.crx.subbands[tindex][pindex][i].supportsPartial for i in self.crx.subbands[tindex][pindex] ):
+          logger.warning('not supported: subband with supportsPartial, tile %d plane %d', tindex, pindex)
+          return None
+        return self.decode_lossy(tindex, pindex, reduction)
+      if reduction:
+        logger.warning('not supported: reduced decoding of lossless plane')
+        return None
+      if not plane.supportsPartial:
+        logger.warning('not supported: lossless plane without supportsPartial, tile %d plane %d', tindex, pindex)
+        return None
+      return CrxDecoder.decode_lossless( self.subband_data(tindex, pindex), width, height )
+    except (ValueError, IndexError) as e:
+      logger.error('tile %d plane %d at 0x%x: %s', tindex, pindex, plane.offset, e)
+      return None
+
+  def units(self):
+    '''(tile, plane) pairs, largest first to balance decoding jobs'''
+    planes = self.crx.planes
+    return sorted( [ (t, p) for t in planes for p in planes[t] ], key=lambda u: -planes[u[0]][u[1]].size )
+
+  def decode_unit(self, bayer, tindex, pindex, reduction=0):
+    '''decodes one plane of one tile at its positions in bayer. False if not supported'''
+    cmp1 = self.cmp1
+    values = self.decode_plane(tindex, pindex, reduction)
+    if values is None:
+      return False
+    values += 1 << (cmp1.d-1) #median
+    np.clip(values, 0, (1 << cmp1.d)-1, out=values)
+    row, col, height, width = self.tile_area(tindex, reduction)
+    dy, dx = CrxDecoder.CFA_OFFSETS[cmp1.cfa][pindex]
+    bayer[ 2*row+dy: 2*(row+height): 2, 2*col+dx: 2*(col+width): 2 ] = values
+    return True
+
+  forked = None #(decoder, bayer, reduction) inherited by processes of decode()
+
+  @staticmethod
+  def decode_forked(unit):
+    decoder, bayer, reduction = CrxDecoder.forked
+    return decoder.decode_unit( bayer, unit[0], unit[1], reduction )
+
+  def decode(self, jobs=None, reduction=0):
+    '''Bayer picture as uint16 array (cmp1.ih, cmp1.iw), or None. With jobs>1, (tile, plane) units are decoded
+    by jobs forked processes, reading the sample (mmap) of this process and writing into a shared anonymous
+    mapping, which is the buffer of returned array.
+    Lossy pictures can be reduced by 2**reduction (1 to cmp1.wl), with only the coarse subbands decoded'''
+    cmp1 = self.cmp1
+    if cmp1.p != 4 or cmp1.cfa not in CrxDecoder.CFA_OFFSETS or cmp1.extra != 0:
+      logger.warning('not supported: planes=%d, cfa=%d, encoding type=%d', cmp1.p, cmp1.cfa, cmp1.extra)
+      return None
+    if cmp1.wl > len(CrxDecoder.EX_COEF):
+      logger.warning('not supported: %d wavelet levels', cmp1.wl)
+      return None
+    if reduction > cmp1.wl:
+      logger.warning('not supported: reduction %d with %d wavelet levels', reduction, cmp1.wl)
+      return None
+    height, width = cmp1.ih, cmp1.iw
+    if reduction:
+      row, col, h, w = self.tile_area( self.tile_rows*self.tile_cols-1, reduction )
+      height, width = 2*(row+h), 2*(col+w)
+    units = self.units()
+    if not jobs or jobs < 2 or len(units) < 2 or 'fork' not in multiprocessing.get_all_start_methods():
+      bayer = np.empty( (height, width), dtype=np.uint16 )
+      for tindex, pindex in units:
+        if not self.decode_unit(bayer, tindex, pindex, reduction):
+          return None
+      return bayer
+    shared = mmap.mmap( -1, height*width*2 )
+    bayer = np.frombuffer( shared, dtype=np.uint16 ).reshape( (height, width) )
+    CrxDecoder.forked = (self, bayer, reduction)
+    try:
+      with multiprocessing.get_context('fork').Pool( min(jobs, len(units)) ) as pool:
+        done = pool.map( CrxDecoder.decode_forked, units, chunksize=1 )
+    finally:
+      CrxDecoder.forked = None
+    if not all(done):
+      return None
+    return bayer
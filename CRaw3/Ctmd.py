@@ -1,23 +1,29 @@
 
+import logging
 from struct import Struct
 from collections import namedtuple, OrderedDict
 from CRaw3.TiffIfd import TiffIfd
+from CRaw3.Profiler import NULL_PROFILER
 from binascii import hexlify
 
+logger = logging.getLogger(__name__)
+
 class Ctmd:
   S_CTMD_INDEX_HEADER = Struct('>LLL')
   S_CTMD_INDEX_ENTRY = Struct('>HHL')
   NT_CTMD_INDEX_ENTRY = namedtuple('ctmd_index_entry', 'type size')
+  profiler = NULL_PROFILER #set by Cr3
 
   def __init__(self, data, length, base, name): #parse the index, common to all ctmd in mdat if more than one (rolls)
     self.index_list = []
     self.data = data
+    self.trak = None #trak of CTMD samples ('trak4' in CR3, 'trak2' in CRM), set by Cr3.parse()
     
     _, _, nb = Ctmd.S_CTMD_INDEX_HEADER.unpack_from( data, 0)
-    for i in range(nb):
-      _, type, size = Ctmd.S_CTMD_INDEX_ENTRY.unpack_from( data, Ctmd.S_CTMD_INDEX_HEADER.size + i*Ctmd.S_CTMD_INDEX_ENTRY.size)
-      entry = Ctmd.NT_CTMD_INDEX_ENTRY( type, size )
-      self.index_list.append( entry )
+    start = Ctmd.S_CTMD_INDEX_HEADER.size
+    entries = data[ start: start+nb*Ctmd.S_CTMD_INDEX_ENTRY.size ] #all entries decoded at once
+    entries = entries[ :len(entries)//Ctmd.S_CTMD_INDEX_ENTRY.size*Ctmd.S_CTMD_INDEX_ENTRY.size ] #truncated index
+    self.index_list = [ Ctmd.NT_CTMD_INDEX_ENTRY( type, size ) for _, type, size in Ctmd.S_CTMD_INDEX_ENTRY.iter_unpack( entries ) ]
 
   S_CTMD_RECORD_HEADER = Struct('<LHBBHH')  
   NT_CTMD_RECORD = namedtuple('ctmd_record', 'size type offset content')
@@ -34,44 +40,68 @@ class Ctmd:
   S_CTMD_EXPOSURE = Struct('<HHHHL')
   NT_CTMD_EXPOSURE = namedtuple('ctmd_exposure', 'f_num f_denum expo_num expo_denum iso')
 
-  def parse(self, data ):
-    self.ctmd_list = OrderedDict()
-    pic_num = 0
-    for file_offset, ctmd_size in zip( self.offsets, self.sizes ): #for all pictures in roll
-      ctmd_data = data[ file_offset: file_offset+ctmd_size ]  
-      ctmd_offset = 0
-      ctmd_records = dict()
-      for type, size in self.index_list: #contains type and size
-        ctmd_record = ctmd_data[ ctmd_offset: ctmd_offset+size ]
-        record_size, record_type, _, _, _, _ = Ctmd.S_CTMD_RECORD_HEADER.unpack_from( ctmd_record, 0)
-        if record_size!=size or record_type!=type:
-          print('warning CMDT type:%d/%d size:0x%x/0x%x' % (type, record_type, size, record_size ) )
-        if record_type in Ctmd.CTMD_TIFF_TYPES:
-          record_offset = Ctmd.S_CTMD_RECORD_HEADER.size #inside the record
-          ctmd_tiff = dict()
-          while record_offset < record_size:
-            payload_size, payload_tag = Ctmd.S_CTMD_TIFF_HEADER.unpack_from( ctmd_record, record_offset )
-            #print("size %x tag %x" % (payload_size, payload_tag) )
-            tiff = TiffIfd( ctmd_record[ record_offset+Ctmd.S_CTMD_TIFF_HEADER.size: ], payload_size, file_offset+ctmd_offset+record_offset+Ctmd.S_CTMD_TIFF_HEADER.size, b'CTMD%d_0x%x'%(record_type, payload_tag), False) 
-            ctmd_tiff[ payload_tag ] =  (file_offset+ctmd_offset+record_offset, payload_size, payload_tag, (record_offset+Ctmd.S_CTMD_TIFF_HEADER.size, tiff) )  
-            record_offset += payload_size
-          ctmd_records[type] = Ctmd.NT_CTMD_RECORD(size, type, file_offset+ctmd_offset, ctmd_tiff)  #store context and TIFF entries		
+  def parse_picture(self, ctmd_data, file_offset, tiff=True):
+    #records of one picture, from its CTMD sample. With tiff=False, TiffIfd of types 7, 8 and 9 are not built (see get_tiff())
+    ctmd_offset = 0
+    ctmd_records = dict()
+    for type, size in self.index_list: #contains type and size
+      ctmd_record = ctmd_data[ ctmd_offset: ctmd_offset+size ]
+      record_size, record_type, _, _, _, _ = Ctmd.S_CTMD_RECORD_HEADER.unpack_from( ctmd_record, 0)
+      if record_size!=size or record_type!=type:
+        logger.warning('CMDT type:%d/%d size:0x%x/0x%x', type, record_type, size, record_size )
+      if record_type in Ctmd.CTMD_TIFF_TYPES:
+        record_offset = Ctmd.S_CTMD_RECORD_HEADER.size #inside the record
+        ctmd_tiff = dict()
+        while record_offset < record_size:
+          payload_size, payload_tag = Ctmd.S_CTMD_TIFF_HEADER.unpack_from( ctmd_record, record_offset )
+          #print("size %x tag %x" % (payload_size, payload_tag) )
+          if tiff:
+            self.profiler.enter('classes', 'TiffIfd')
+            ifd = TiffIfd( ctmd_record[ record_offset+Ctmd.S_CTMD_TIFF_HEADER.size: ], payload_size, file_offset+ctmd_offset+record_offset+Ctmd.S_CTMD_TIFF_HEADER.size, b'CTMD%d_0x%x'%(record_type, payload_tag), False)
+            self.profiler.leave( payload_size )
+          else:
+            ifd = None
+          ctmd_tiff[ payload_tag ] =  (file_offset+ctmd_offset+record_offset, payload_size, payload_tag, (record_offset+Ctmd.S_CTMD_TIFF_HEADER.size, ifd) )
+          record_offset += payload_size
+        ctmd_records[type] = Ctmd.NT_CTMD_RECORD(size, type, file_offset+ctmd_offset, ctmd_tiff)  #store context and TIFF entries
+      else:
+        if record_type == Ctmd.CTMD_TYPE_TIMESTAMP:
+          _, y, mo, d, h, m, s, ms = Ctmd.S_CTMD_TIMESTAMP.unpack_from( ctmd_record, Ctmd.S_CTMD_RECORD_HEADER.size )
+          ctmd_records[type] = Ctmd.NT_CTMD_RECORD( size, type, file_offset+ctmd_offset, Ctmd.NT_CTMD_TIMESTAMP( y, mo, d, h, m, s, ms ) )
+        elif record_type == Ctmd.CTMD_TYPE_EXPOSURE:
+          f_num, f_denum, expo_num, expo_denum, iso = Ctmd.S_CTMD_EXPOSURE.unpack_from( ctmd_record, Ctmd.S_CTMD_RECORD_HEADER.size )
+          ctmd_records[type] = Ctmd.NT_CTMD_RECORD( size, type, file_offset+ctmd_offset, Ctmd.NT_CTMD_EXPOSURE ( f_num, f_denum, expo_num, expo_denum, iso ) )
+        elif record_type == Ctmd.CTMD_TYPE_FOCAL:
+          num, denum = Ctmd.S_CTMD_FOCAL.unpack_from( ctmd_record, Ctmd.S_CTMD_RECORD_HEADER.size )
+          ctmd_records[type] = Ctmd.NT_CTMD_RECORD( size, type, file_offset+ctmd_offset, Ctmd.NT_CTMD_FOCAL ( num, denum ) )
         else:
-          if record_type == Ctmd.CTMD_TYPE_TIMESTAMP:
-            _, y, mo, d, h, m, s, ms = Ctmd.S_CTMD_TIMESTAMP.unpack_from( ctmd_record, Ctmd.S_CTMD_RECORD_HEADER.size )
-            ctmd_records[type] = Ctmd.NT_CTMD_RECORD( size, type, file_offset+ctmd_offset, Ctmd.NT_CTMD_TIMESTAMP( y, mo, d, h, m, s, ms ) )
-          elif record_type == Ctmd.CTMD_TYPE_EXPOSURE:
-            f_num, f_denum, expo_num, expo_denum, iso = Ctmd.S_CTMD_EXPOSURE.unpack_from( ctmd_record, Ctmd.S_CTMD_RECORD_HEADER.size )
-            ctmd_records[type] = Ctmd.NT_CTMD_RECORD( size, type, file_offset+ctmd_offset, Ctmd.NT_CTMD_EXPOSURE ( f_num, f_denum, expo_num, expo_denum, iso ) )   
-          elif record_type == Ctmd.CTMD_TYPE_FOCAL:
-            num, denum = Ctmd.S_CTMD_FOCAL.unpack_from( ctmd_record, Ctmd.S_CTMD_RECORD_HEADER.size )
-            ctmd_records[type] = Ctmd.NT_CTMD_RECORD( size, type, file_offset+ctmd_offset, Ctmd.NT_CTMD_FOCAL ( num, denum ) )
-          else:        
-            ctmd_records[type] = Ctmd.NT_CTMD_RECORD( size, type, file_offset+ctmd_offset, None) #do not store content, but type, size and pointer for later processing
-        ctmd_offset += size
-      self.ctmd_list[ pic_num ] =  ctmd_records  
-      pic_num += 1      
-    return self.ctmd_list	
+          ctmd_records[type] = Ctmd.NT_CTMD_RECORD( size, type, file_offset+ctmd_offset, None) #do not store content, but type, size and pointer for later processing
+      ctmd_offset += size
+    return ctmd_records
+
+  def pictures(self, reader, start=0, tiff=False):
+    #yields (pic_num, records) for pictures of the roll (or CRM frames) from start, one positioned read per picture.
+    #Memory does not depend on the number of pictures
+    for pic_num in range( start, len(self.offsets) ):
+      file_offset, ctmd_size = self.offsets[ pic_num ], self.sizes[ pic_num ]
+      yield pic_num, self.parse_picture( reader.read( file_offset, ctmd_size ), file_offset, tiff )
+
+  def get_tiff(self, reader, record, tag):
+    #TiffIfd of tag in a TIFF record (type 7, 8 or 9), read and decoded on demand. None if missing
+    if tag not in record.content:
+      return None
+    offset, payload_size, payload_tag, entries = record.content[ tag ]
+    if entries[1] is not None:
+      return entries[1]
+    start = offset+Ctmd.S_CTMD_TIFF_HEADER.size
+    data = bytes( reader.read( start, payload_size-Ctmd.S_CTMD_TIFF_HEADER.size ) )
+    return TiffIfd( data, payload_size, start, b'CTMD%d_0x%x'%(record.type, payload_tag), False)
+
+  def parse(self, reader):
+    #all pictures at once, with their TiffIfd. reader is a BoxReader (or PreadReader) of the file, like for pictures():
+    #the whole file content is not expected any more, only CTMD samples are read
+    self.ctmd_list = OrderedDict( self.pictures( reader, tiff=True ) )
+    return self.ctmd_list
 
   def display(self):
     for pic_num, ctmd in self.ctmd_list.items():
@@ -0,0 +1,104 @@
+'''
+text display of the boxes parsed by Cr3 (Cr3.tree, see BoxTree): one line per box with its offset, then the values
+of known boxes, like parse_cr3.py output
+
+parsing builds no display strings: this renderer works on the finished tree, and reads again the few payload bytes
+it shows which are not kept as values (ftyp brands, versions, start of unknown boxes)
+'''
+
+from struct import unpack
+from binascii import hexlify
+
+def header_size(reader, node):
+  return 16 if unpack('>L', reader.read(node.offset, 4))[0] == 1 else 8 #64 bits size after name
+
+def box_payload(reader, node, size=None):
+  #payload of node, or its first size bytes
+  hsize = header_size(reader, node)
+  length = node.size-hsize if size is None else min(size, node.size-hsize)
+  return reader.read(node.offset+hsize, max(length, 0))
+
+def table_count(reader, node, a):
+  return unpack('>L', box_payload(reader, node, a+4)[a:a+4])[0]
+
+def ftyp(reader, node, pad, verbose):
+  d = box_payload(reader, node)
+  major_brand = bytes(d[:4])
+  minor_version = unpack('>L', d[4:8])[0]
+  compatible_brands = [ bytes(d[8+e*4:8+e*4+4]) for e in range( (node.size-(4*4))//4 ) ]
+  return [ "ftyp: major_brand={0}, minor_version={1}, {2} (0x{3:x})".format(major_brand, minor_version, compatible_brands, node.size) ]
+
+def uuid(reader, node, pad, verbose):
+  return [ 'uuid: {0} (0x{1:x})'.format(hexlify(node.value), node.size) ]
+
+def stsz(reader, node, pad, verbose):
+  d = box_payload(reader, node, 12)
+  version, size, count = d[0], unpack('>L', d[4:8])[0], unpack('>L', d[8:12])[0]
+  return [ "stsz: version={0}, size=0x{1:x}, count={2} (0x{3:x})".format(version, size, count, node.size),
+    '      '+pad+''.join( '0x%x ' % s for s in node.value ) ]
+
+def co64(reader, node, pad, verbose):
+  d = box_payload(reader, node, 8)
+  return [ "co64: version={0}, count={1} (0x{2:x})".format(unpack('>L', d[0:4])[0], unpack('>L', d[4:8])[0], node.size),
+    '      '+pad+''.join( '0x%x ' % s for s in node.value ) ]
+
+def stsc(reader, node, pad, verbose):
+  return [ "stsc: count={0} (0x{1:x})".format(table_count(reader, node, 4), node.size),
+    '      '+pad+''.join( '%d:%d ' % (e.first_chunk, e.samples) for e in node.value ) ]
+
+def stts(reader, node, pad, verbose):
+  return [ "stts: count={0} (0x{1:x})".format(table_count(reader, node, 4), node.size),
+    '      '+pad+''.join( '%d*%d ' % e for e in node.value ) ]
+
+def mdhd(reader, node, pad, verbose):
+  d = box_payload(reader, node, 1)
+  return [ "mdhd: version={0}, timescale={1} (0x{2:x})".format(d[0], node.value, node.size) ]
+
+def picture(reader, node, pad, verbose): #PRVW and THMB
+  return [ "{0}: width={1}, height={2}, jpeg_size=0x{3:x} (0x{4:x})".format(node.name.decode('latin-1'), node.value.w, node.value.h, node.value.size, node.size) ]
+
+def ctbo(reader, node, pad, verbose):
+  return [ 'CTBO: (0x{0:x})'.format(node.size) ] + [ '      %s%x %7x %7x' % (pad, line.index, line.offset, line.size) for line in node.value.values() ]
+
+def cncv(reader, node, pad, verbose):
+  return [ 'CNCV: {0} (0x{1:x})'.format(node.value, node.size) ]
+
+def shorts(reader, node, pad, verbose): #CDI1 and IAD1
+  lines = [ '{0}: (0x{1:x})'.format(node.name.decode('latin-1'), node.size) ]
+  if verbose>0:
+    lines.append( '      '+pad+''.join( '%d,' % v for v in node.value ) )
+  return lines
+
+def craw(reader, node, pad, verbose):
+  return [ "CRAW: (0x{0:x})".format(node.size), '      %swidth=%d, height=%d, bits=%d' % (pad, node.value.w, node.value.h, node.value.bits) ]
+
+def ctmd(reader, node, pad, verbose):
+  lines = [ 'CTMD: (0x{:x})'.format(node.size) ]
+  if verbose>0:
+    lines.append( '     %s %d' % (pad, len(node.value.index_list)) )
+    lines.extend( '       %s %d 0x%x' % (pad, i.type, i.size) for i in node.value.index_list )
+  return lines
+
+def name_only(reader, node, pad, verbose): #moov, CMP1, CNOP, CMT1-4 and CMTA
+  return [ '{0}: (0x{1:x})'.format(node.name.decode('latin-1'), node.size) ]
+
+def default(reader, node, pad, verbose):
+  d = box_payload(reader, node, min(32, node.size)-header_size(reader, node))
+  return [ '%s %s (0x%x)' % ( repr(node.name), hexlify(d), node.size ) ]
+
+RENDERERS = { b'ftyp':ftyp, b'moov':name_only, b'uuid':uuid, b'stsz':stsz, b'co64':co64, b'stsc':stsc, b'stts':stts, b'mdhd':mdhd,
+  b'PRVW':picture, b'THMB':picture, b'CTBO':ctbo, b'CNCV':cncv, b'CDI1':shorts, b'IAD1':shorts, b'CMP1':name_only, b'CRAW':craw,
+  b'CNOP':name_only, b'CTMD':ctmd, b'CMT1':name_only, b'CMT2':name_only, b'CMT3':name_only, b'CMT4':name_only, b'CMTA':name_only }
+
+def display_tree(cr3file, verbose=0):
+  '''prints the boxes of cr3file, once parsed. With verbose 1, CTMD index and CDI1/IAD1 values, with verbose 2,
+  TIFF tags of CMT boxes'''
+  reader = cr3file.reader
+  for depth, node in cr3file.tree.walk():
+    pad = (depth+1)*'  '
+    lines = RENDERERS.get(node.name, default)(reader, node, pad, verbose)
+    print( '%05x:%s%s' % (node.offset, depth*'  ', lines[0]) )
+    for line in lines[1:]:
+      print( line )
+    if verbose>1 and node.name in cr3file.CMT_TAGS:
+      node.value.display( depth+1 )
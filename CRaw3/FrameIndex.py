@@ -0,0 +1,99 @@
+'''
+sample index of a trak (CRM video frames, CTMD records, CR3 pictures), built from stsz, co64, stsc and stts
+
+co64 lists chunks, and stsc how many samples each chunk has: a sample starts after the previous samples of its chunk.
+Offsets, sizes and times are kept in arrays, for O(1) lookup of any frame of a long clip. The index can be saved to a
+file, to open a clip again without walking its sample tables
+'''
+
+import logging
+import sys
+from array import array
+from struct import Struct
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+SIZE_CODE = 'I' if array('I').itemsize==4 else 'L'
+
+
+class FrameIndex:
+  NT_FRAME = namedtuple('frame', 'offset size time')
+  MAGIC = b'CRXFIDX1'
+  S_HEADER = Struct('<8sQL') #magic, count, timescale. Then offsets (64 bits), sizes (32 bits), times (64 bits), little-endian
+
+  def __init__(self, offsets, sizes, times, timescale=0):
+    self.offsets = offsets
+    self.sizes = sizes
+    self.times = times #start of each sample, in timescale units
+    self.timescale = timescale
+
+  @classmethod
+  def from_trak(cls, trak):
+    '''index of samples of a trak dict of Cr3 (with b'stsz' and b'co64', optionally b'stsc', b'stts' and b'mdhd')'''
+    sizes = array( SIZE_CODE, trak[b'stsz'] )
+    chunks = trak[b'co64']
+    stsc = trak.get(b'stsc') or [ (1, 1, 1) ] #(first chunk, samples per chunk, description). One sample per chunk in CR3
+    offsets = array('Q')
+    sample = 0
+    for e, (first_chunk, samples, _) in enumerate(stsc):
+      last = stsc[e+1][0] if e+1 < len(stsc) else len(chunks)+1
+      for chunk in range(first_chunk-1, last-1):
+        offset = chunks[chunk]
+        for _ in range(samples):
+          if sample >= len(sizes):
+            break
+          offsets.append( offset )
+          offset += sizes[sample]
+          sample += 1
+    times = array('Q')
+    time = 0
+    for count, delta in trak.get(b'stts') or [ (len(sizes), 1) ]:
+      for _ in range(count):
+        times.append( time )
+        time += delta
+    del times[ len(offsets): ]
+    times.extend( [time]*(len(offsets)-len(times)) )
+    return cls( offsets, sizes[ :len(offsets) ], times, trak.get(b'mdhd', 0) )
+
+  def __len__(self):
+    return len(self.offsets)
+
+  def frame(self, n):
+    return FrameIndex.NT_FRAME( self.offsets[n], self.sizes[n], self.times[n] )
+
+  def seconds(self, n):
+    '''start time of sample n, in seconds. None without timescale'''
+    if not self.timescale:
+      return None
+    return self.frame(n).time / self.timescale
+
+  def save(self, filename):
+    with open(filename, 'wb') as f:
+      f.write( FrameIndex.S_HEADER.pack( FrameIndex.MAGIC, len(self), self.timescale ) )
+      for values in (self.offsets, self.sizes, self.times):
+        if sys.byteorder != 'little':
+          values = array( values.typecode, values )
+          values.byteswap()
+        f.write( values.tobytes() )
+
+  @classmethod
+  def load(cls, filename):
+    with open(filename, 'rb') as f:
+      header = f.read(FrameIndex.S_HEADER.size)
+      if len(header) < FrameIndex.S_HEADER.size or header[:8] != FrameIndex.MAGIC:
+        logger.error('not a frame index: %s', filename)
+        return None
+      _, count, timescale = FrameIndex.S_HEADER.unpack( header )
+      arrays = []
+      for code in ('Q', SIZE_CODE, 'Q'):
+        values = array(code)
+        data = f.read(count*values.itemsize)
+        if len(data) != count*values.itemsize:
+          logger.error('truncated frame index: %s', filename)
+          return None
+        values.frombytes( data )
+        if sys.byteorder != 'little':
+          values.byteswap()
+        arrays.append( values )
+    return cls( arrays[0], arrays[1], arrays[2], timescale )
@@ -0,0 +1,363 @@
+'''
+parses Canon HEIF (.HIF) files using BoxReader: items (iinf, iloc, iref), properties (ipco, ipma) and the grid
+of HEVC tiles of the primary picture. See heif.md
+
+tiles and thumbnails are HEVC bitstreams in mdat, extracted as Annex B streams (start codes), with the parameter
+sets (VPS, SPS, PPS) of their hvcC property. Extraction runs in threads, doing positioned reads of each item
+'''
+
+import os
+from struct import Struct, unpack
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from CRaw3.Box import BoxReader
+from CRaw3.TiffIfd import TiffIfd
+
+
+class Heif:
+  NT_ITEM = namedtuple('item', 'id type name method extents') #extents: list of (offset, length). method 1: in idat
+  NT_GRID = namedtuple('grid', 'rows columns width height tiles')
+  NT_TILE = namedtuple('tile', 'id row column offset size width height')
+  NT_ISPE = namedtuple('ispe', 'width height')
+  NT_COLR = namedtuple('colr', 'type primaries transfer matrix full_range') #nclx
+  NT_PIXI = namedtuple('pixi', 'bits')
+  NT_CLLI = namedtuple('clli', 'max_cll max_fall')
+  NT_MDCV = namedtuple('mdcv', 'primaries white_point max_luminance min_luminance')
+  NT_HVCC = namedtuple('hvcC', 'profile level chroma_format luma_bits chroma_bits length_size nal_units') #nal_units: (type, bytes)
+
+  TRANSFER_PQ = 16 #SMPTE ST 2084, colr nclx transfer characteristics
+  HEVC_START_CODE = b'\x00\x00\x00\x01'
+
+  #meta inner boxes after version and flags
+  META_INNER_OFFSET = 4
+
+  def __init__(self, reader):
+    self.reader = reader
+    self.brand = None
+    self.cncv = None
+    self.primary = None
+    self.items = OrderedDict()
+    self.refs = dict() #type: { from_id: [to_id,...] }
+    self.properties = [] #(name, value), property #1 is properties[0]
+    self.associations = dict() #item id: [ (property index, essential), ...]
+    self.idat = None #(offset, size) in file
+    self.exif = None #TiffIfd of Exif item, see get_exif()
+
+  def parse(self):
+    reader = self.reader
+    for box in reader.boxes(0, reader.filesize):
+      if box.name == b'ftyp':
+        self.brand = bytes( reader.payload(box, 4) )
+      elif box.name == b'meta':
+        if hasattr(reader, 'load'):
+          reader.load(box.offset, box.size)
+        self.parse_meta(box)
+    return self
+
+  def parse_meta(self, meta):
+    reader = self.reader
+    for box in reader.boxes(meta.offset+meta.hsize+Heif.META_INNER_OFFSET, meta.offset+meta.size):
+      d = reader.payload(box)
+      if box.name == b'uuid' and bytes(d[:BoxReader.UUID_LEN]) == BoxReader.UUID_CANON:
+        for inner in reader.boxes(box.offset+box.hsize+BoxReader.UUID_LEN, box.offset+box.size):
+          if inner.name == b'CNCV':
+            self.cncv = bytes( reader.payload(inner) )
+      elif box.name == b'pitm':
+        self.primary = unpack('>H', d[4:6])[0] if d[0]==0 else unpack('>L', d[4:8])[0]
+      elif box.name == b'iinf':
+        self.iinf(box, d)
+      elif box.name == b'iref':
+        self.iref(d)
+      elif box.name == b'iprp':
+        for inner in reader.boxes(box.offset+box.hsize, box.offset+box.size):
+          if inner.name == b'ipco':
+            for prop in reader.boxes(inner.offset+inner.hsize, inner.offset+inner.size):
+              self.properties.append( (prop.name, Heif.property(prop.name, bytes(reader.payload(prop)))) )
+          elif inner.name == b'ipma':
+            self.ipma( reader.payload(inner) )
+      elif box.name == b'idat':
+        self.idat = (box.offset+box.hsize, box.size-box.hsize)
+      elif box.name == b'iloc':
+        self.iloc(d)
+
+  def iinf(self, box, d):
+    start = 4 + (2 if d[0]==0 else 4)
+    for infe in self.reader.boxes(box.offset+box.hsize+start, box.offset+box.size):
+      e = self.reader.payload(infe)
+      version = e[0]
+      if version < 2:
+        continue
+      if version == 2:
+        item_id, _ = unpack('>HH', e[4:8])
+        o = 8
+      else:
+        item_id, _ = unpack('>LH', e[4:10])
+        o = 10
+      item_type = bytes(e[o:o+4])
+      name = bytes(e[o+4:]).split(b'\x00')[0]
+      item = self.items.get( item_id, Heif.NT_ITEM( item_id, None, b'', 0, [] ) ) #iloc can be first
+      self.items[ item_id ] = item._replace( type=item_type, name=name )
+
+  def iref(self, d):
+    large = d[0] != 0
+    o = 4
+    while o+8 <= len(d):
+      size, ref_type = unpack('>L4s', d[o:o+8])
+      if size < 8:
+        break
+      p = o+8
+      if large:
+        from_id, count = unpack('>LH', d[p:p+6])
+        to_ids = list( unpack('>%dL' % count, d[p+6:p+6+4*count]) )
+      else:
+        from_id, count = unpack('>HH', d[p:p+4])
+        to_ids = list( unpack('>%dH' % count, d[p+4:p+4+2*count]) )
+      self.refs.setdefault( ref_type, dict() ).setdefault( from_id, [] ).extend( to_ids )
+      o += size
+
+  def ipma(self, d):
+    version, flags = d[0], d[3] & 1
+    count = unpack('>L', d[4:8])[0]
+    o = 8
+    for _ in range(count):
+      if version < 1:
+        item_id = unpack('>H', d[o:o+2])[0]
+        o += 2
+      else:
+        item_id = unpack('>L', d[o:o+4])[0]
+        o += 4
+      n = d[o]
+      o += 1
+      associations = []
+      for _ in range(n):
+        if flags:
+          value = unpack('>H', d[o:o+2])[0]
+          associations.append( (value & 0x7fff, value >> 15) )
+          o += 2
+        else:
+          associations.append( (d[o] & 0x7f, d[o] >> 7) )
+          o += 1
+      self.associations[ item_id ] = associations
+
+  def iloc(self, d):
+    version = d[0]
+    offset_size, length_size = d[4] >> 4, d[4] & 0xf
+    base_offset_size = d[5] >> 4
+    index_size = d[5] & 0xf if version in (1, 2) else 0
+    if version < 2:
+      count = unpack('>H', d[6:8])[0]
+      o = 8
+    else:
+      count = unpack('>L', d[6:10])[0]
+      o = 10
+    def number(size):
+      nonlocal o
+      value = int.from_bytes( d[o:o+size], 'big' )
+      o += size
+      return value
+    for _ in range(count):
+      item_id = number(2 if version < 2 else 4)
+      method = number(2) & 0xf if version in (1, 2) else 0
+      number(2) #data reference index
+      base = number(base_offset_size)
+      extents = []
+      for _ in range(number(2)):
+        number(index_size)
+        extents.append( (base+number(offset_size), number(length_size)) )
+      item = self.items.get( item_id, Heif.NT_ITEM( item_id, None, b'', 0, [] ) )
+      self.items[ item_id ] = item._replace( method=method, extents=extents )
+
+  S_ISPE = Struct('>LLL')
+  @staticmethod
+  def property(name, d):
+    #decoded value of property, raw bytes for unknown ones
+    if name == b'ispe':
+      _, w, h = Heif.S_ISPE.unpack_from(d, 0)
+      return Heif.NT_ISPE( w, h )
+    elif name == b'colr' and d[:4] == b'nclx':
+      primaries, transfer, matrix = unpack('>HHH', d[4:10])
+      return Heif.NT_COLR( b'nclx', primaries, transfer, matrix, d[10] >> 7 )
+    elif name == b'pixi':
+      return Heif.NT_PIXI( tuple(d[5:5+d[4]]) )
+    elif name == b'irot':
+      return (d[0] & 3) * 90 #anti-clockwise degrees
+    elif name == b'clli':
+      return Heif.NT_CLLI( *unpack('>HH', d[:4]) )
+    elif name == b'mdcv':
+      values = unpack('>8HLL', d[:24])
+      return Heif.NT_MDCV( tuple(zip(values[0:6:2], values[1:6:2])), values[6:8], values[8], values[9] )
+    elif name == b'hvcC':
+      return Heif.hvcc(d)
+    return d
+
+  @staticmethod
+  def hvcc(d):
+    nal_units = []
+    o = 23
+    for _ in range(d[22]):
+      nal_type = d[o] & 0x3f
+      n = unpack('>H', d[o+1:o+3])[0]
+      o += 3
+      for _ in range(n):
+        size = unpack('>H', d[o:o+2])[0]
+        nal_units.append( (nal_type, d[o+2:o+2+size]) )
+        o += 2+size
+    return Heif.NT_HVCC( d[1] & 0x1f, d[12], d[16] & 3, (d[17] & 7)+8, (d[18] & 7)+8, (d[21] & 3)+1, nal_units )
+
+  def get_properties(self, item_id):
+    '''properties of item: { name: value }'''
+    values = dict()
+    for index, _ in self.associations.get( item_id, [] ):
+      if 0 < index <= len(self.properties):
+        name, value = self.properties[ index-1 ]
+        values[ name ] = value
+    return values
+
+  def read_item(self, item_id):
+    '''content of item, from mdat or idat'''
+    item = self.items[ item_id ]
+    parts = []
+    for offset, length in item.extents:
+      if item.method == 1: #idat
+        offset += self.idat[0]
+      parts.append( bytes( self.reader.read(offset, length) ) )
+    return b''.join(parts)
+
+  def item_range(self, item_id):
+    '''(offset, size) of item in file, for a single extent item'''
+    item = self.items[ item_id ]
+    offset, length = item.extents[0]
+    return (offset + self.idat[0] if item.method == 1 else offset), length
+
+  def get_grid(self, item_id=None):
+    '''NT_GRID of a grid item (primary item by default), tiles ids in raster order. None if not a grid'''
+    if item_id is None:
+      item_id = self.primary
+    item = self.items.get( item_id )
+    if item is None or item.type != b'grid':
+      return None
+    d = self.read_item( item_id )
+    flags = d[1]
+    rows, columns = d[2]+1, d[3]+1
+    if flags & 1:
+      width, height = unpack('>LL', d[4:12])
+    else:
+      width, height = unpack('>HH', d[4:8])
+    return Heif.NT_GRID( rows, columns, width, height, self.refs.get(b'dimg', {}).get( item_id, [] ) )
+
+  def get_tiles(self, item_id=None):
+    '''list of NT_TILE of the grid: position, byte range in file and size'''
+    grid = self.get_grid( item_id )
+    if grid is None:
+      return []
+    tiles = []
+    for n, tile_id in enumerate(grid.tiles):
+      offset, size = self.item_range( tile_id )
+      ispe = self.get_properties( tile_id ).get( b'ispe', Heif.NT_ISPE(0, 0) )
+      tiles.append( Heif.NT_TILE( tile_id, n // grid.columns, n % grid.columns, offset, size, ispe.width, ispe.height ) )
+    return tiles
+
+  def get_thumbnails(self):
+    '''ids of thumbnail items of primary item'''
+    return [ from_id for from_id, to_ids in self.refs.get(b'thmb', {}).items() if self.primary in to_ids ]
+
+  def get_hdr(self, item_id=None):
+    '''HDR metadata of item (primary by default): colr (nclx), pixi, and clli, mdcv when present.
+    pq is True for PQ transfer function (SMPTE ST 2084)'''
+    if item_id is None:
+      item_id = self.primary
+    properties = self.get_properties( item_id )
+    grid = self.get_grid( item_id )
+    if grid and grid.tiles: #colour properties are on the tiles
+      tile_properties = self.get_properties( grid.tiles[0] )
+      tile_properties.update( properties )
+      properties = tile_properties
+    hdr = { name.decode(): properties[name] for name in (b'colr', b'pixi', b'clli', b'mdcv') if name in properties }
+    colr = hdr.get('colr')
+    hdr['pq'] = isinstance(colr, Heif.NT_COLR) and colr.transfer == Heif.TRANSFER_PQ
+    return hdr
+
+  def hevc_stream(self, item_id):
+    '''Annex B bitstream of a hvc1 item: parameter sets of its hvcC, then its NAL units with start codes'''
+    hvcc = self.get_properties( item_id ).get( b'hvcC' )
+    if not isinstance(hvcc, Heif.NT_HVCC):
+      return None
+    parts = [ Heif.HEVC_START_CODE + bytes(nal) for _, nal in hvcc.nal_units ]
+    d = self.read_item( item_id )
+    o = 0
+    while o+hvcc.length_size <= len(d):
+      size = int.from_bytes( d[o:o+hvcc.length_size], 'big' )
+      o += hvcc.length_size
+      parts.append( Heif.HEVC_START_CODE + d[o:o+size] )
+      o += size
+    return b''.join(parts)
+
+  def extract(self, directory, jobs=None):
+    '''writes tiles and thumbnails as Annex B streams (tile0100.hevc...) and Exif, with jobs threads.
+    Returns the list of filenames'''
+    os.makedirs( directory, exist_ok=True )
+    names = [ (tile.id, 'tile%04x.hevc' % tile.id) for tile in self.get_tiles() ]
+    names += [ (item_id, 'thmb%04x.hevc' % item_id) for item_id in self.get_thumbnails() ]
+    def write(item):
+      filename = os.path.join( directory, item[1] )
+      with open(filename, 'wb') as f:
+        f.write( self.hevc_stream(item[0]) )
+      return filename
+    with ThreadPoolExecutor( jobs ) as pool: #positioned reads and writes release the GIL
+      filenames = list( pool.map( write, names ) )
+    exif = self.get_exif_data()
+    if exif is not None:
+      filename = os.path.join( directory, 'exif.bin' )
+      with open(filename, 'wb') as f:
+        f.write( exif )
+      filenames.append( filename )
+    return filenames
+
+  def get_exif_data(self):
+    '''TIFF data of Exif item (after its 4 bytes header offset). None if missing'''
+    for item in self.items.values():
+      if item.type == b'Exif' and item.extents:
+        d = self.read_item( item.id )
+        return d[ 4+unpack('>L', d[:4])[0]: ]
+    return None
+
+  def get_exif(self):
+    '''TiffIfd of IFD0, Exif and Makernote of Exif item: { 0: ifd0, TiffIfd.TIFF_EXIF: exif, TiffIfd.TIFF_MAKERNOTE: ... }'''
+    if self.exif is not None:
+      return self.exif
+    d = self.get_exif_data()
+    self.exif = ifds = dict()
+    if d is None:
+      return ifds
+    ifds[ 0 ] = TiffIfd( d, len(d), 0, 'ifd0', False )
+    if TiffIfd.TIFF_EXIF in ifds[0].ifd:
+      ifds[ TiffIfd.TIFF_EXIF ] = TiffIfd( d, len(d), 0, 'exif', False, False, False, ifds[0].ifd[TiffIfd.TIFF_EXIF].value, ifds[0].order )
+      exif = ifds[ TiffIfd.TIFF_EXIF ]
+      if TiffIfd.TIFF_MAKERNOTE in exif.ifd:
+        ifds[ TiffIfd.TIFF_MAKERNOTE ] = TiffIfd( d, len(d), 0, 'makernote', False, False, False, exif.ifd[TiffIfd.TIFF_MAKERNOTE].value, ifds[0].order )
+    return ifds
+
+  def get_model_id(self):
+    makernote = self.get_exif().get( TiffIfd.TIFF_MAKERNOTE )
+    if makernote is None or TiffIfd.TIFF_MAKERNOTE_MODELID not in makernote.ifd:
+      return None
+    return makernote.get( TiffIfd.TIFF_MAKERNOTE_MODELID )[0]
+
+  def get_model_name(self):
+    ifd0 = self.get_exif().get( 0 )
+    return None if ifd0 is None else ifd0.get( TiffIfd.TIFF_EXIF_Model )
+
+  def display(self):
+    print('HEIF %s %s' % (self.brand, self.cncv))
+    grid = self.get_grid()
+    if grid:
+      offset, size = self.item_range( self.primary )
+      print("Main 0x%04x at offset 0x%06x (size=0x%x) b'grid' (%dx%d) %dx%d tiles" % (self.primary, offset, size, grid.width, grid.height, grid.rows, grid.columns))
+    for tile in self.get_tiles():
+      print("Tile 0x%04x at offset 0x%06x (size=0x%x) b'hvc1' (%dx%d)" % (tile.id, tile.offset, tile.size, tile.width, tile.height))
+    for item_id in self.get_thumbnails():
+      offset, size = self.item_range( item_id )
+      ispe = self.get_properties( item_id ).get( b'ispe', Heif.NT_ISPE(0, 0) )
+      print("b'thmb' id=0x%x at offset 0x%06x (size 0x%x) %s (%dx%d)" % (item_id, offset, size, self.items[item_id].type, ispe.width, ispe.height))
+    print( self.get_hdr() )
@@ -1,9 +1,13 @@
 '''
-parses main info from lossless Jpeg (ITU-T81)
-
+parses main info from lossless Jpeg (ITU-T81): frame header (SOF3), Huffman tables (DHT) and scan header (SOS).
+Decoding is done by LjpegDecoder
 '''
 
+import logging
 from struct import unpack, Struct
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
 
 def getShortBE(d, a):
  return unpack('>H',(d)[a:a+2])[0]
@@ -19,22 +23,50 @@ class Jpeg:
   JPEG_SOS  =  0xffda
   JPEG_EOI  =  0xffd9
 
-  def __init__(self, data):
+  S_SOF = Struct('>BHHB')
+  NT_COMPONENT = namedtuple('component', 'id h v tq')
+  NT_SCAN_COMPONENT = namedtuple('scan_component', 'id td') #td: Huffman table of DC differences
+
+  def __init__(self, data, display=True):
     self.data = data
-    val = getShortBE(self.data, 0)
+    self.huffman = dict() #table number: (counts of codes per length 1 to 16, symbols)
+    self.components = []
+    self.scan = None #offset of entropy coded data, after SOS header
     ptr = 0
-    size = 0
-    while val != Jpeg.JPEG_SOS:
-      #print('%x' % val)
-      if val == Jpeg.JPEG_SOI:
-        pass
-      elif val == Jpeg.JPEG_DHT:
-        size = getShortBE(self.data, ptr+2)
-      elif val == Jpeg.JPEG_SOF0 or val == Jpeg.JPEG_SOF3:  
-        size = getShortBE(self.data, ptr+2)
-        self.bits, self.high, self.wide, self.n_comp = Struct('>BHHB').unpack_from(data, ptr+4)
-        print(self.bits, self.high, self.wide, self.n_comp)
-      #print('size %x' % size)
+    val = getShortBE(self.data, ptr)
+    if val != Jpeg.JPEG_SOI:
+      logger.error('not a jpeg, 0x%x', val)
+      return
+    ptr += 2
+    while ptr+4 <= len(self.data) and self.scan is None:
+      val = getShortBE(self.data, ptr)
+      size = getShortBE(self.data, ptr+2)
+      if val == Jpeg.JPEG_DHT:
+        self.parse_dht( ptr+4, ptr+2+size )
+      elif val == Jpeg.JPEG_SOF0 or val == Jpeg.JPEG_SOF3:
+        self.sof = val
+        self.bits, self.high, self.wide, self.n_comp = Jpeg.S_SOF.unpack_from(data, ptr+4)
+        for c in range(self.n_comp):
+          id, hv, tq = Struct('>BBB').unpack_from(data, ptr+4+Jpeg.S_SOF.size+c*3)
+          self.components.append( Jpeg.NT_COMPONENT(id, hv>>4, hv&15, tq) )
+        if display:
+          print(self.bits, self.high, self.wide, self.n_comp)
+      elif val == Jpeg.JPEG_SOS:
+        ns = self.data[ptr+4]
+        self.scan_components = [ Jpeg.NT_SCAN_COMPONENT(self.data[ptr+5+c*2], self.data[ptr+6+c*2]>>4) for c in range(ns) ]
+        #for lossless, Ss is the predictor and Al the point transform
+        self.predictor, _, ahal = Struct('>BBB').unpack_from(data, ptr+5+ns*2)
+        self.point_transform = ahal & 15
+        self.scan = ptr+2+size
+      elif val == Jpeg.JPEG_EOI:
+        break
       ptr += size+2
-      val = getShortBE(self.data, ptr)  
-      
\ No newline at end of file
+
+  def parse_dht(self, ptr, end):
+    #one DHT segment can define several tables
+    while ptr < end:
+      table = self.data[ptr] & 15 #Tc (class) is 0 for lossless
+      counts = tuple( self.data[ptr+1:ptr+17] )
+      symbols = bytes( self.data[ptr+17:ptr+17+sum(counts)] )
+      self.huffman[ table ] = (counts, symbols)
+      ptr += 17 + sum(counts)
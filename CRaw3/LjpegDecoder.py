@@ -0,0 +1,159 @@
+'''
+lossless Jpeg (ITU-T81 process 14, SOF3) decoder, for CR2 raw data, using the headers parsed by Jpeg
+
+Huffman codes are decoded with one lookup per difference: a table of 1<<16 entries, indexed by the next 16 bits
+of the bitstream, gives the code length and SSSS (the number of additional bits of the difference). The scan is
+unstuffed and converted to a list of big endian 32 bits words with numpy, the decoder keeps a few bits of it in
+a Python int. Predictor 1 (left sample, used by Canon) is undone with cumulative sums in numpy, other predictors
+sample per sample.
+
+CR2 sensor data is cut in vertical slices (IFD3 tag 0xc640: number of slices but the last one, width of slices,
+width of last slice), coded one after the other as Jpeg rows: unslice() reassembles the sensor picture.
+Needs numpy
+'''
+
+import logging
+import re
+
+import numpy as np
+
+from CRaw3.Jpeg import Jpeg
+
+logger = logging.getLogger(__name__)
+
+class LjpegDecoder:
+  LOOKUP_BITS = 16
+  MARKER = re.compile(b'\xff[^\x00]') #end of scan. 0xff00 is a stuffed 0xff
+
+  def __init__(self, jpeg):
+    self.jpeg = jpeg
+
+  @staticmethod
+  def lookup(counts, symbols):
+    '''Huffman table as a list indexed by the next 16 bits: code length<<8 | SSSS. 0 for invalid codes'''
+    bits = LjpegDecoder.LOOKUP_BITS
+    table = [ 0 ] * (1 << bits)
+    code = 0
+    k = 0
+    for length in range(1, bits+1):
+      shift = bits - length
+      for _ in range(counts[length-1]):
+        if code >= 1 << length:
+          raise ValueError('invalid Huffman table')
+        table[ code << shift:(code+1) << shift ] = [ (length << 8) | symbols[k] ] * (1 << shift)
+        code += 1
+        k += 1
+      code <<= 1
+    return table
+
+  def words(self):
+    '''entropy coded data, unstuffed, as big endian 32 bits words'''
+    scan = bytes( self.jpeg.data[ self.jpeg.scan: ] )
+    end = LjpegDecoder.MARKER.search( scan )
+    if end:
+      scan = scan[ :end.start() ]
+    scan = scan.replace(b'\xff\x00', b'\xff')
+    scan += b'\0' * (-len(scan) % 4)
+    return np.frombuffer(scan, '>u4').tolist()
+
+  def differences(self):
+    '''decoded differences, in scan order (interleaved components)'''
+    jpeg = self.jpeg
+    tables = [ LjpegDecoder.lookup( *jpeg.huffman[ c.td ] ) for c in jpeg.scan_components ]
+    words = self.words()
+    available = len(words)
+    words.extend( [0, 0] ) #the last refill can read past the end
+    count = jpeg.high * jpeg.wide * len(tables)
+    diffs = [ 0 ] * count
+    acc = 0
+    nbits = 0
+    w = 0
+    i = 0
+    while i < count:
+      for table in tables:
+        if nbits < 32:
+          acc = ((acc & ((1 << nbits)-1)) << 32) | words[w]
+          w += 1
+          nbits += 32
+        entry = table[ (acc >> (nbits-16)) & 0xffff ]
+        if entry == 0:
+          raise ValueError('invalid Huffman code at sample %d' % i)
+        nbits -= entry >> 8
+        ssss = entry & 0xff
+        if ssss == 16:
+          diffs[i] = 32768
+        elif ssss:
+          nbits -= ssss
+          v = (acc >> nbits) & ((1 << ssss)-1)
+          diffs[i] = v if v >> (ssss-1) else v - (1 << ssss) + 1
+        i += 1
+      if w > available+1:
+        raise ValueError('truncated scan at sample %d' % i)
+    return diffs
+
+  def supported(self):
+    jpeg = self.jpeg
+    if jpeg.scan is None or getattr(jpeg, 'sof', None) != Jpeg.JPEG_SOF3:
+      logger.warning('not supported: not a lossless Jpeg')
+      return False
+    if any( c.h != 1 or c.v != 1 for c in jpeg.components ) or len(jpeg.scan_components) != jpeg.n_comp:
+      logger.warning('not supported: subsampled or non interleaved components (sRAW, mRAW)')
+      return False
+    if not 1 <= jpeg.predictor <= 7:
+      logger.warning('not supported: predictor %d', jpeg.predictor)
+      return False
+    return True
+
+  def decode(self):
+    '''Jpeg frame as numpy array of uint16, high rows of wide*n_comp samples. None if not supported'''
+    jpeg = self.jpeg
+    if not self.supported():
+      return None
+    n = jpeg.n_comp
+    d = np.array( self.differences(), np.int64 ).reshape(jpeg.high, jpeg.wide, n)
+    first = 1 << (jpeg.bits - jpeg.point_transform - 1)
+    if jpeg.predictor == 1:
+      #first column is predicted from above, other samples from left. Arithmetic is modulo 2**16
+      d[0, 0, :] += first
+      d[:, 0, :] = np.cumsum(d[:, 0, :], axis=0)
+      values = np.cumsum(d, axis=1) & 0xffff
+    else:
+      values = self.predict( d, first )
+    return (values << jpeg.point_transform).astype(np.uint16).reshape(jpeg.high, jpeg.wide*n)
+
+  def predict(self, d, first):
+    predictor = self.jpeg.predictor
+    high, wide, n = d.shape
+    values = np.zeros((high, wide, n), np.int64)
+    for c in range(n):
+      prev = None
+      for y in range(high):
+        diff = d[:, :, c][y].tolist()
+        row = [ 0 ] * wide
+        row[0] = ((first if y == 0 else prev[0]) + diff[0]) & 0xffff
+        for x in range(1, wide):
+          ra = row[x-1]
+          if y == 0:
+            p = ra
+          else:
+            rb, rc = prev[x], prev[x-1]
+            p = ( ra, rb, rc, ra+rb-rc, ra+((rb-rc)>>1), rb+((ra-rc)>>1), (ra+rb)>>1 )[predictor-1]
+          row[x] = (p + diff[x]) & 0xffff
+        values[y, :, c] = row
+        prev = row
+    return values
+
+  @staticmethod
+  def unslice(frame, slices):
+    '''sensor picture from Jpeg frame: slices (count, width, last width) are stored one after the other'''
+    count, width, last = slices
+    flat = frame.ravel()
+    total = count*width + last
+    height = flat.size // total
+    picture = np.empty((height, total), frame.dtype)
+    pos = 0
+    for s in range(count+1):
+      w = width if s < count else last
+      picture[ :, s*width:s*width+w ] = flat[ pos:pos+height*w ].reshape(height, w)
+      pos += height*w
+    return picture
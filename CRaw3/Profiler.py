@@ -0,0 +1,90 @@
+'''
+parse profiling: wall time, bytes and allocated memory blocks per box type, per Cr3.tags handler, and for TiffIfd,
+Ctmd and Crx
+
+Cr3(reader, profiler=Profiler()) records nested sections: a box in its parent box, the tags[...] handler and the
+classes it uses in the box. summary() gives totals per category ('boxes', 'handlers', 'classes') and name, for
+JSON. folded() gives collapsed stacks, as read by flamegraph.pl or speedscope: one line per stack like
+"moov;trak;mdia;minf;stbl;stsz;tags[stsz] 12", with its own time in microseconds (children excluded).
+
+Bytes are the bytes given to the handler or class (payload, TIFF data, CRX header, CTMD samples). Allocations are
+the difference of sys.getallocatedblocks() at the end and at the start of a section: memory blocks still allocated,
+such as the parsed values, not temporary objects
+'''
+
+import sys
+import json
+import time
+
+class NullProfiler:
+  '''profiler of Cr3 by default: records nothing'''
+
+  def enter(self, category, name):
+    pass
+
+  def leave(self, nbytes=0):
+    pass
+
+NULL_PROFILER = NullProfiler()
+
+
+class Profiler:
+  CATEGORIES = ('boxes', 'handlers', 'classes')
+
+  def __init__(self):
+    self.stack = [] #[category, name, start time, start blocks, time of children] of open sections
+    self.stacks = dict() #labels from the outermost section: [calls, own seconds]
+    self.totals = dict() #(category, name): [calls, seconds, own seconds, bytes, allocations]
+
+  @staticmethod
+  def label(category, name):
+    if isinstance(name, bytes):
+      name = name.decode('latin-1')
+    return 'tags[%s]' % name if category == 'handlers' else name
+
+  def enter(self, category, name):
+    self.stack.append( [ category, name, time.perf_counter(), sys.getallocatedblocks(), 0.0 ] )
+
+  def leave(self, nbytes=0):
+    end = time.perf_counter()
+    blocks = sys.getallocatedblocks()
+    category, name, start, start_blocks, children = self.stack.pop()
+    elapsed = end - start
+    if self.stack:
+      self.stack[-1][4] += elapsed
+    own = elapsed - children
+    path = tuple( Profiler.label(c, n) for c, n, _, _, _ in self.stack ) + ( Profiler.label(category, name), )
+    entry = self.stacks.setdefault( path, [0, 0.0] )
+    entry[0] += 1
+    entry[1] += own
+    total = self.totals.setdefault( (category, name), [0, 0.0, 0.0, 0, 0] )
+    total[0] += 1
+    total[1] += elapsed
+    total[2] += own
+    total[3] += nbytes
+    total[4] += blocks - start_blocks
+
+  def summary(self):
+    '''{ category: { name: { calls, seconds, own_seconds, bytes, allocations } } }, names sorted by seconds'''
+    result = { category: dict() for category in Profiler.CATEGORIES }
+    for (category, name), values in sorted( self.totals.items(), key=lambda item: -item[1][1] ):
+      if isinstance(name, bytes):
+        name = name.decode('latin-1')
+      result.setdefault( category, dict() )[ name ] = dict( zip( ('calls', 'seconds', 'own_seconds', 'bytes', 'allocations'), values ) )
+    return result
+
+  def folded(self):
+    '''collapsed stacks, one line per stack: labels separated by ; and own time in microseconds'''
+    lines = []
+    for path, (_, own) in sorted( self.stacks.items() ):
+      us = int( round( own*1e6 ) )
+      if us > 0:
+        lines.append( '%s %d' % ( ';'.join( label.replace(' ', '_').replace(';', '_') for label in path ), us ) )
+    return '\n'.join( lines ) + '\n'
+
+  def save(self, prefix):
+    '''writes prefix.json (summary) and prefix.folded (collapsed stacks)'''
+    with open(prefix+'.json', 'w') as f:
+      json.dump( self.summary(), f, indent=1 )
+    with open(prefix+'.folded', 'w') as f:
+      f.write( self.folded() )
@@ -1,13 +1,20 @@
 
-from struct import Struct, unpack
+import logging
+from struct import Struct, unpack, pack
 from collections import namedtuple, OrderedDict
 from binascii import hexlify
+from array import array
+import sys
+
+logger = logging.getLogger(__name__)
 
 def getShortLE(d, a):
  return unpack('<H',(d)[a:a+2])[0]
 
 def getLongLE(d, a):
  return unpack('<L',(d)[a:a+4])[0]
+
+LONG_CODES = ('I', 'i') if array('I').itemsize==4 else ('L', 'l')
   
  
 class TiffIfd:
@@ -22,6 +29,14 @@ class TiffIfd:
   TIFF_EXIF_ThumbnailLength = 0x202
   TIFF_EXIF_StripOffsets = 0x111
   TIFF_EXIF_StripByteCounts = 0x117
+  TIFF_EXIF_BitsPerSample = 0x102
+  TIFF_EXIF_Compression = 0x103
+  TIFF_EXIF_PhotometricInterpretation = 0x106
+  TIFF_EXIF_SamplesPerPixel = 0x115
+  TIFF_EXIF_RowsPerStrip = 0x116
+  TIFF_EXIF_ISO = 0x8827 #ISOSpeedRatings, in CMT2
+  TIFF_EXIF_LensModel = 0xa434
+  TIFF_CR2_SLICE = 0xc640 #IFD3: number of slices but the last one, slice width, last slice width
   
   TIFF_MAKERNOTE_SENSORINFO = 0xe0  
   TIFF_MAKERNOTE_CAMERASETTINGS = 1
@@ -52,95 +67,150 @@ class TiffIfd:
   tiffTypeLen = [ 1, 1, 2, 4, 4+4, 1, 1, 2, 4, 4+4, 4, 8 ]
   tiffTypeStr = [ 'B', 's', 'H', 'L', 'L', 'c', 'c', 'h', 'l', 'l', 'l', 'q' ] #use with caution, might not always work. Will not with rational
   tiffTypeNames = [ "uchar", "string", "ushort", "ulong", "urational", "char", "byteseq", "short", "long", "rational", "float4", "float8" ]
+  #array typecodes used by get(), None for types returned as bytes. Rationals are pairs of longs
+  tiffTypeArray = [ 'B', None, 'H', LONG_CODES[0], LONG_CODES[0], 'b', None, 'h', LONG_CODES[1], LONG_CODES[1], 'f', 'd' ]
 
-  S_IFD_ENTRY_REC = Struct('<HHLL')  
+  S_IFD_ENTRY_REC = Struct('<HHLL')
+  S_IFD_ENTRY_REC_MM = Struct('>HHLL')
+  S_IFD_ENTRY_SHORT_REC = Struct('<HHLH2x') #one short value, in the value field
   NT_IFD_ENTRY = namedtuple('ifd_entry', 'offset tag type length value')
 
-  def __init__(self, data, length, base, name, display=True, has_header=True, get_next=False):
+  def __init__(self, data, length, base, name, display=True, has_header=True, get_next=False, ptr=0, order=b'II'):
+    #ptr is the IFD offset in data when there is no header. Value offsets are relative to data
     self.data = data
     self.length = length
     self.base = base
     self.name = name
     self.ifd = dict()
+    self.values = dict() #decoded values, per tag
     self.next = 0
 
     '''if not options.quiet and display:
       print( "{0}: (0x{1:x})".format(name, length) )'''
-    if has_header:  
-      #4949 2A00 08000000  
-      self.order = data[0:2] #for a future MM compatible version ?
-      if self.order!=b'II': #should raise exception
-        print('order!=II')
-        return
-      marker = getShortLE( data, 2 )
+    if has_header:
+      #4949 2A00 08000000 or 4D4D 002A 00000008
+      order = bytes( data[0:2] )
+    if order not in (b'II', b'MM'): #should raise exception
+      logger.error('order not II or MM')
+      return
+    self.order = order
+    endian = '<' if order==b'II' else '>'
+    if has_header:
+      marker, ptr = unpack( endian+'HL', data[2:8] )
       if marker != 0x2a:
-        print('marker != 0x2a')
+        logger.error('marker != 0x2a')
         return
-      ptr = getShortLE( data, 4 ) #8
-    else:
-      ptr = 0    
-      
-    n = getShortLE( data, ptr )
+
+    s_entry = TiffIfd.S_IFD_ENTRY_REC if order==b'II' else TiffIfd.S_IFD_ENTRY_REC_MM
+    n = unpack( endian+'H', data[ptr:ptr+2] )[0]
     ptr = ptr + 2
     for i in range(n):
-      tag, type, length, val = TiffIfd.S_IFD_ENTRY_REC.unpack_from( data[ptr:ptr+TiffIfd.S_IFD_ENTRY_REC.size] )
-      ifd_entry = TiffIfd.NT_IFD_ENTRY( self.base+ptr, tag, type, length, val )
-      self.ifd[ tag ] = ifd_entry  
-      ptr = ptr + TiffIfd.S_IFD_ENTRY_REC.size
+      tag, type, length, val = s_entry.unpack_from( data, ptr )
+      self.ifd[ tag ] = TiffIfd.NT_IFD_ENTRY( self.base+ptr, tag, type, length, val )
+      ptr = ptr + s_entry.size
       if self.base+ptr > self.base+self.length:
-        print('base+ptr > base+length !')
+        logger.error('base+ptr > base+length !')
     if get_next:
-      self.next =  getLongLE( data, ptr )   
+      self.next = unpack( endian+'L', data[ptr:ptr+4] )[0]
+
+  def raw(self, tag):
+    #bytes of the entry value, inside the entry when they fit in 4 bytes
+    entry = self.ifd[ tag ]
+    size = entry.length * TiffIfd.tiffTypeLen[entry.type-1]
+    if size <= 4:
+      start = entry.offset - self.base + 8
+    else:
+      start = entry.value
+    return bytes( self.data[ start: start+size ] )
+
+  def get(self, tag, default=None):
+    #decoded value of entry: a tuple of numbers (of (numerator, denominator) for rationals), bytes for strings
+    #and byte sequences. Decoded once per IFD
+    if tag in self.values:
+      return self.values[ tag ]
+    if tag not in self.ifd:
+      return default
+    entry = self.ifd[ tag ]
+    if entry.type < 1 or entry.type > len(TiffIfd.tiffTypeArray):
+      return default
+    code = TiffIfd.tiffTypeArray[entry.type-1]
+    data = self.raw( tag )
+    if code is None:
+      if entry.type == TiffIfd.TIFF_TYPE_STRING:
+        zero = data.find(b'\x00')
+        if zero != -1:
+          data = data[ :zero ]
+      value = data
+    else:
+      values = array( code )
+      values.frombytes( data[ :len(data)//values.itemsize*values.itemsize ] )
+      if (self.order==b'II') != (sys.byteorder=='little'):
+        values.byteswap()
+      if entry.type in (TiffIfd.TIFF_TYPE_URATIONAL, TiffIfd.TIFF_TYPE_RATIONAL):
+        value = tuple( zip( values[0::2], values[1::2] ) )
+      else:
+        value = tuple( values )
+    self.values[ tag ] = value
+    return value
 
-  def print_entry(self, type, length, val, max):
-    #we should verify this is access after self.base+self.length in self.data
-    typeLen = TiffIfd.tiffTypeLen[type-1] 
-    data2 = self.data[ val: val+min(length,max)*typeLen ]
+  def print_entry(self, tag, max):
+    entry = self.ifd[ tag ]
+    type, length = entry.type, entry.length
     if type == TiffIfd.TIFF_TYPE_UCHAR or type == TiffIfd.TIFF_TYPE_STRING:
       if length < 5:
-        print('%x'%val)
-      else:  
-        zero = data2.find(b'\x00')
+        print('%x'%entry.value)
+      else:
+        data = self.raw( tag )
+        zero = data.find(b'\x00')
         if zero!=-1:
-          data2 = self.data[ val: val+zero ]
-        print(data2)
-    elif type == TiffIfd.TIFF_TYPE_USHORT:
+          data = data[ :zero ]
+        print(data)
+    elif type in (TiffIfd.TIFF_TYPE_USHORT, TiffIfd.TIFF_TYPE_ULONG, TiffIfd.TIFF_TYPE_SHORT, TiffIfd.TIFF_TYPE_LONG):
+      values = self.get( tag )
       if length == 1:
-        print('%hu'%val)
+        print('%d'%values[0])
       else:
-        if length*typeLen > 4: #do not fit in long (tag 0x404b)
-          for i in range(0, min(length,max)*typeLen, typeLen):
-            print( '%hu '%( getShortLE(data2, i) ), end='' )
+        print( ' '.join( '%d'%v for v in values[:max] ), end='' )
         if length > max:
-          print('...')
+          print(' ...')
         else:
-          print()      
-    elif type == TiffIfd.TIFF_TYPE_ULONG:
-      if length == 1:
-        print('%lu'%val)
-      else:
-        for i in range(0, min(length,max)*typeLen, typeLen):
-          print( '%lu '%( getLongLE(data2, i) ), end='' )
-        if length>max:
-          print('...')
-        else:
-          print()  
+          print()
     elif type == TiffIfd.TIFF_TYPE_BYTESEQ:
       if length < 5:
-        print()    
+        print()
       else:
+        data = self.get( tag )
         if length>max:
-          print(hexlify(data2), '...')
+          print(hexlify(data[:max]), '...')
         else:
-          print(hexlify(data2))
-    elif type == TiffIfd.TIFF_TYPE_URATIONAL:
-      print('%lu / %lu' % ( getLongLE(data2, 0), getLongLE(data2, 4) ) )
-    elif type == TiffIfd.TIFF_TYPE_URATIONAL:
-      print('%ld / %ld' % ( getLongLE(data2, 0), getLongLE(data2, 4) ) )
+          print(hexlify(data))
+    elif type == TiffIfd.TIFF_TYPE_URATIONAL or type == TiffIfd.TIFF_TYPE_RATIONAL:
+      print( ' '.join( '%d / %d' % r for r in self.get(tag)[:max] ) )
     else:
-      print()  
-  
+      print()
+
   def display( self, depth=0):
     for entry in self.ifd.values():
       print( "     %s 0x%06lx %5d/0x%-4x %9s(%d)*%-6ld %9lu/0x%-lx, " % (depth*'  ', entry.offset, entry.tag , entry.tag, TiffIfd.tiffTypeNames[entry.type-1],entry.type,entry.length,entry.value,entry.value), end='' )
-      self.print_entry( entry.type, entry.length, entry.value, 20)
+      self.print_entry( entry.tag, 20 )
+
+  @staticmethod
+  def tiff16_header(width, height, samples=1):
+    #header of an uncompressed 16 bits little-endian TIFF (grey or RGB) in one strip, pixels follow it
+    entry = TiffIfd.S_IFD_ENTRY_REC
+    entry_short = TiffIfd.S_IFD_ENTRY_SHORT_REC
+    ifd_end = 8 + 2 + 9*entry.size + 4
+    data_start = ifd_end + (2*samples if samples > 2 else 0) #BitsPerSample values do not fit in entry
+    entries = [ entry.pack( TiffIfd.TIFF_EXIF_ImageWidth, TiffIfd.TIFF_TYPE_ULONG, 1, width ),
+      entry.pack( TiffIfd.TIFF_EXIF_ImageHeight, TiffIfd.TIFF_TYPE_ULONG, 1, height ),
+      entry.pack( TiffIfd.TIFF_EXIF_BitsPerSample, TiffIfd.TIFF_TYPE_USHORT, samples, ifd_end ) if samples > 2 else entry_short.pack( TiffIfd.TIFF_EXIF_BitsPerSample, TiffIfd.TIFF_TYPE_USHORT, samples, 16 ),
+      entry_short.pack( TiffIfd.TIFF_EXIF_Compression, TiffIfd.TIFF_TYPE_USHORT, 1, 1 ),
+      entry_short.pack( TiffIfd.TIFF_EXIF_PhotometricInterpretation, TiffIfd.TIFF_TYPE_USHORT, 1, 2 if samples >= 3 else 1 ), #RGB or black is zero
+      entry.pack( TiffIfd.TIFF_EXIF_StripOffsets, TiffIfd.TIFF_TYPE_ULONG, 1, data_start ),
+      entry_short.pack( TiffIfd.TIFF_EXIF_SamplesPerPixel, TiffIfd.TIFF_TYPE_USHORT, 1, samples ),
+      entry.pack( TiffIfd.TIFF_EXIF_RowsPerStrip, TiffIfd.TIFF_TYPE_ULONG, 1, height ),
+      entry.pack( TiffIfd.TIFF_EXIF_StripByteCounts, TiffIfd.TIFF_TYPE_ULONG, 1, width*height*samples*2 ) ]
+    header = b'II*\x00' + pack('<LH', 8, len(entries)) + b''.join(entries) + pack('<L', 0)
+    if samples > 2:
+      header += pack('<%dH' % samples, *[16]*samples)
+    return header
@@ -1 +1 @@
-__all__ = [ "TiffIfd", "Crx", "Cr2", "Jpeg", "Ctmd" ]
+__all__ = [ "TiffIfd", "Crx", "Cr2", "Jpeg", "Ctmd", "Box", "Cr3", "CrxDecoder" ]
@@ -0,0 +1,107 @@
+'''
+box tree walk benchmark: peak RSS and wall time versus file size
+
+compares the mmap/memoryview BoxReader with the former approach (whole file read, then a bytes copy of
+each box payload at each nesting level). Synthetic files are sparse: mdat content is never written
+
+usage: python benchmarks/bench_boxes.py [-s 16,64,256,1024] [-d tmpdir]
+'''
+
+import os
+import sys
+import time
+import resource
+import subprocess
+import tempfile
+from struct import Struct, pack
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from CRaw3.Box import BoxReader
+
+S_BOX_HEADER = Struct('>L4s')
+
+def box(name, payload):
+  return S_BOX_HEADER.pack(S_BOX_HEADER.size+len(payload), name) + payload
+
+def make_file(filename, mdat_size):
+  '''minimal CR3 shaped file: ftyp, moov (Canon uuid, 4 traks), mdat of mdat_size bytes (sparse)'''
+  ftyp = box(b'ftyp', b'crx ' + pack('>L', 1) + b'crx isom')
+  canon = box(b'uuid', BoxReader.UUID_CANON + box(b'CNCV', b'CanonCR3_001/00.09.00/00.00.00') +
+    box(b'CTBO', pack('>L', 1) + pack('>LQQ', 3, 0, mdat_size)) )
+  traks = b''
+  for t in range(4):
+    stsd = box(b'stsd', bytes(8) + box(b'CRAW', bytes(0x52)))
+    stbl = box(b'stbl', stsd + box(b'stsz', pack('>LLL', 0, 0, 1) + pack('>L', mdat_size//4)) + box(b'co64', pack('>LLQ', 0, 1, 0)))
+    traks += box(b'trak', box(b'mdia', box(b'minf', stbl)))
+  moov = box(b'moov', canon + traks)
+  with open(filename, 'wb') as f:
+    f.write(ftyp + moov)
+    f.write(pack('>L4sQ', 1, b'mdat', 16 + mdat_size))
+    f.truncate(f.tell() + mdat_size)
+
+def walk_mmap(filename):
+  n = 0
+  with BoxReader.open(filename) as reader:
+    for depth, box in reader.walk():
+      n += 1
+  return n
+
+def walk_legacy(filename):
+  '''former parse_cr3.py approach: f.read() then payload slices, copied at each level'''
+  with open(filename, 'rb') as f:
+    data = f.read()
+  def parse(d):
+    n = 0
+    o = 0
+    while o + 8 <= len(d):
+      l, name = S_BOX_HEADER.unpack_from(d, o)
+      no = 8
+      if l == 1:
+        l, = Struct('>Q').unpack_from(d, o+8)
+        no = 16
+      payload = d[o+no:o+l] #copy
+      n += 1
+      if name in BoxReader.CONTAINERS:
+        n += parse(payload)
+      elif name == b'uuid' and payload[:16] in BoxReader.UUID_INNER_OFFSETS:
+        n += parse(payload[16+BoxReader.UUID_INNER_OFFSETS[payload[:16]]:])
+      elif name in BoxReader.INNER_OFFSETS:
+        n += parse(payload[BoxReader.INNER_OFFSETS[name]:])
+      o += l
+    return n
+  return parse(data)
+
+def child(mode, filename):
+  t0 = time.perf_counter()
+  n = walk_mmap(filename) if mode == 'mmap' else walk_legacy(filename)
+  elapsed = time.perf_counter() - t0
+  print('%d %f %d' % (n, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+def measure(mode, filename):
+  out = subprocess.run([sys.executable, __file__, '--child', mode, filename], stdout=subprocess.PIPE, check=True).stdout
+  n, elapsed, maxrss = out.split()
+  return int(n), float(elapsed), int(maxrss)
+
+if __name__ == '__main__':
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("-s", "--sizes", dest="sizes", help="mdat sizes in MB, comma separated", default='16,64,256,1024')
+  parser.add_option("-d", "--dir", dest="dir", help="directory for synthetic files", default=None)
+  parser.add_option("-l", "--no-legacy", action="store_false", dest="legacy", help="skip former read()+slices approach", default=True)
+  parser.add_option("--child", action="store_true", dest="child", default=False)
+  (options, args) = parser.parse_args()
+
+  if options.child:
+    child(args[0], args[1])
+    sys.exit()
+
+  modes = ['mmap', 'legacy'] if options.legacy else ['mmap']
+  print('%10s %8s %6s %10s %12s' % ('size(MB)', 'mode', 'boxes', 'time(ms)', 'maxrss(KB)'))
+  with tempfile.TemporaryDirectory(dir=options.dir) as tmp:
+    for mb in [ int(s) for s in options.sizes.split(',') ]:
+      filename = os.path.join(tmp, 'synthetic_%d.cr3' % mb)
+      make_file(filename, mb<<20)
+      for mode in modes:
+        n, elapsed, maxrss = measure(mode, filename)
+        print('%10d %8s %6d %10.2f %12d' % (mb, mode, n, elapsed*1000, maxrss))
+      os.remove(filename)
@@ -0,0 +1,150 @@
+'''
+parser benchmark on synthetic CR3 and CRM files (see tests/synthetic.py), to compare versions of the parser
+
+times box parsing (Cr3.parse with BoxReader, Cr3.parse_headers with PreadReader), TiffIfd decoding of CMT1-4,
+Ctmd.parse of all pictures, Crx.parse_tile of all pictures and extraction (THMB, PRVW, JPEG and CRX samples),
+across file sizes, roll lengths and tile counts. Best time of repeats, in ms, and memory kept by a Cr3 after
+header only parsing, in KB (kept_kb). Results are saved as JSON with -o,
+and compared with saved results with -c: slower than threshold times the saved time is a regression (exit status 1)
+
+usage: python benchmarks/bench_parse.py [-s 1,32,256] [-n 1,20] [-t 1x1,2x2] [-o new.json] [-c old.json]
+'''
+
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import tracemalloc
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from CRaw3.Box import BoxReader, PreadReader
+from CRaw3.Cr3 import Cr3
+from CRaw3.Crx import Crx
+from CRaw3.TiffIfd import TiffIfd
+from tests.synthetic import make_file
+
+def parse_boxes(filename):
+  with BoxReader.open(filename) as reader:
+    cr3file = Cr3(reader)
+    cr3file.parse()
+    return len(cr3file.box_list)
+
+def parse_headers(filename):
+  with PreadReader.open(filename) as reader:
+    Cr3(reader).parse_headers()
+
+def decode_tiff(cr3file):
+  for name in sorted(Cr3.CMT_TAGS):
+    if name in cr3file.cr3:
+      _, ifd = cr3file.cr3[name]
+      ifd = TiffIfd(ifd.data, ifd.length, ifd.base, name, False)
+      for tag in ifd.ifd:
+        ifd.get(tag)
+
+def parse_tiles(cr3file, headers):
+  trak = cr3file.get_crx_trak()
+  version = cr3file.get_crx_version()
+  cmp1 = cr3file.cr3[trak][b'CMP1']
+  for offset, header in headers:
+    Crx(offset, header, cmp1, version).parse_tile()
+
+def extract(cr3file):
+  size = len(cr3file.get_thumbnail()) + len(cr3file.get_preview())
+  traks = [cr3file.get_crx_trak()] if cr3file.is_crm() else ['trak1', cr3file.get_crx_trak()]
+  for trak in traks:
+    for n in range(len(cr3file.get_frame_index(trak))):
+      size += len(bytes(cr3file.get_sample(trak, n)))
+  return size
+
+def kept(filename):
+  '''KB allocated by header only parsing and still used by the Cr3 object'''
+  tracemalloc.start()
+  with PreadReader.open(filename) as reader:
+    cr3file = Cr3(reader)
+    cr3file.parse_headers()
+  size = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  return size/1024
+
+def best(function, repeat, *args):
+  times = []
+  for _ in range(repeat):
+    t0 = time.perf_counter()
+    function(*args)
+    times.append(time.perf_counter() - t0)
+  return min(times)*1000
+
+def measure(filename, repeat):
+  '''best time in ms of each operation on filename'''
+  results = { 'boxes': best(parse_boxes, repeat, filename), 'headers': best(parse_headers, repeat, filename) }
+  with BoxReader.open(filename) as reader:
+    cr3file = Cr3(reader)
+    cr3file.parse()
+    trak = cr3file.get_crx_trak()
+    frames = cr3file.get_frame_index(trak)
+    hsize = cr3file.cr3[trak][b'CMP1'].hsize
+    headers = [ (frames.offsets[n], bytes(reader.read(frames.offsets[n], hsize))) for n in range(len(frames)) ]
+    results['tiffifd'] = best(decode_tiff, repeat, cr3file)
+    results['ctmd'] = best(cr3file.parse_ctmd, repeat)
+    results['crx'] = best(parse_tiles, repeat, cr3file, headers)
+    results['extract'] = best(extract, repeat, cr3file)
+  results['kept_kb'] = kept(filename)
+  return results
+
+def compare(results, baseline, threshold):
+  '''prints ratios to baseline, returns the number of regressions'''
+  regressions = 0
+  print('%-32s %-8s %10s %10s %7s' % ('config', 'op', 'old', 'new', 'ratio'))
+  for config, ops in sorted(results.items()):
+    for op, ms in sorted(ops.items()):
+      old = baseline.get(config, {}).get(op)
+      if old is None:
+        continue
+      ratio = ms/old if old else float('inf')
+      flag = ''
+      if ratio > threshold:
+        regressions += 1
+        flag = ' regression'
+      print('%-32s %-8s %10.3f %10.3f %7.2f%s' % (config, op, old, ms, ratio, flag))
+  return regressions
+
+if __name__ == '__main__':
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("-s", "--sizes", dest="sizes", help="file sizes in MB, comma separated", default='1,32,256')
+  parser.add_option("-n", "--rolls", dest="rolls", help="pictures per file (roll length), comma separated", default='1,20')
+  parser.add_option("-t", "--tiles", dest="tiles", help="CRX tiles as columns x rows, comma separated", default='1x1,2x2')
+  parser.add_option("-r", "--repeat", dest="repeat", type="int", help="best of repeat runs", default=5)
+  parser.add_option("-m", "--crm", action="store_true", dest="crm", help="CRM clips (rolls are frames)", default=False)
+  parser.add_option("-d", "--dir", dest="dir", help="directory for synthetic files", default=None)
+  parser.add_option("-o", "--output", dest="output", help="saves results as JSON", default=None)
+  parser.add_option("-c", "--compare", dest="compare", help="JSON results to compare with", default=None)
+  parser.add_option("--threshold", dest="threshold", type="float", help="regression when new/old time is above, default 1.25", default=1.25)
+  (options, args) = parser.parse_args()
+
+  results = dict()
+  ops = [ 'boxes', 'headers', 'tiffifd', 'ctmd', 'crx', 'extract', 'kept_kb' ]
+  print('%-32s %s' % ('config', ' '.join('%9s' % op for op in ops)))
+  with tempfile.TemporaryDirectory(dir=options.dir) as tmp:
+    for mb in [ int(s) for s in options.sizes.split(',') ]:
+      for roll in [ int(s) for s in options.rolls.split(',') ]:
+        for tiles in options.tiles.split(','):
+          columns, rows = [ int(s) for s in tiles.split('x') ]
+          config = '%s size=%dMB roll=%d tiles=%s' % ('crm' if options.crm else 'cr3', mb, roll, tiles)
+          filename = os.path.join(tmp, 'synthetic.crm' if options.crm else 'synthetic.cr3')
+          make_file(filename, mb<<20, roll, (columns, rows), crm=options.crm)
+          results[config] = measure(filename, options.repeat)
+          print('%-32s %s' % (config, ' '.join('%9.3f' % results[config][op] for op in ops)))
+          os.remove(filename)
+
+  if options.output:
+    with open(options.output, 'w') as f:
+      json.dump({ 'python': platform.python_version(), 'machine': platform.machine(), 'repeat': options.repeat,
+        'results': results }, f, indent=1, sort_keys=True)
+  if options.compare:
+    with open(options.compare) as f:
+      baseline = json.load(f)['results']
+    if compare(results, baseline, options.threshold):
+      sys.exit(1)
@@ -0,0 +1,93 @@
+'''
+sample table decoding benchmark: stsz, co64, stsc, stts, CTBO and CTMD index payloads of n entries
+
+compares Cr3 handlers (and Ctmd index parsing), which decode tables in bulk, with the former approach: one
+unpack (and a slice) per entry, kept here as reference. CRM clips have one stsz and co64 entry per frame
+
+usage: python benchmarks/bench_tables.py [-n 1000,10000,100000] [-r 5]
+'''
+
+import os
+import sys
+import time
+from struct import Struct, pack, unpack
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from CRaw3.Cr3 import Cr3
+from CRaw3.Ctmd import Ctmd
+
+def stsz_legacy(d):
+  count = unpack('>L', d[8:12])[0]
+  return [ unpack('>L', d[12+s*4:16+s*4])[0] for s in range(count) ]
+
+def co64_legacy(d):
+  count = unpack('>L', d[4:8])[0]
+  return [ unpack('>Q', d[8+o*8:16+o*8])[0] for o in range(count) ]
+
+def stsc_legacy(d):
+  count = unpack('>L', d[4:8])[0]
+  return [ Cr3.NT_STSC_ENTRY( *Cr3.S_STSC_ENTRY.unpack_from(d, 8+n*12) ) for n in range(count) ]
+
+def stts_legacy(d):
+  count = unpack('>L', d[4:8])[0]
+  return [ Cr3.S_STTS_ENTRY.unpack_from(d, 8+n*8) for n in range(count) ]
+
+def ctbo_legacy(d):
+  lines = {}
+  for n in range( unpack('>L', d[0:4])[0] ):
+    idx, offset, size = Cr3.S_CTBO_LINE.unpack_from( d, 4 + n*Cr3.S_CTBO_LINE.size )
+    lines[idx] = Cr3.NT_CTBO_LINE( idx, offset, size )
+  return lines
+
+def ctmd_legacy(d):
+  _, _, nb = Ctmd.S_CTMD_INDEX_HEADER.unpack_from( d, 0 )
+  index_list = []
+  for i in range(nb):
+    _, type, size = Ctmd.S_CTMD_INDEX_ENTRY.unpack_from( d, 12 + i*8 )
+    index_list.append( Ctmd.NT_CTMD_INDEX_ENTRY( type, size ) )
+  return index_list
+
+def payloads(n):
+  '''payload of each table, with n entries'''
+  return {
+    'stsz': pack('>LLL', 0, 0, n) + b''.join( pack('>L', 0x100000+s) for s in range(n) ),
+    'co64': pack('>LL', 0, n) + b''.join( pack('>Q', 0x100000000+s*0x100000) for s in range(n) ),
+    'stsc': pack('>LL', 0, n) + b''.join( pack('>LLL', c+1, 2, 1) for c in range(n) ),
+    'stts': pack('>LL', 0, n) + b''.join( pack('>LL', 1, 1001) for c in range(n) ),
+    'CTBO': pack('>L', n) + b''.join( pack('>LQQ', i, i*0x1000, 0x1000) for i in range(n) ),
+    'CTMD': pack('>LLL', 0, 0, n) + b''.join( pack('>HHL', 0, i & 0xffff, 0x20) for i in range(n) ) }
+
+def bulk(name, d):
+  if name == 'CTMD':
+    return Ctmd( d, len(d), 0, b'CTMD' ).index_list
+  cr3file = Cr3( None )
+  return Cr3.tags[ name.encode('ascii') ]( cr3file, 0, memoryview(d), len(d)+8, 0 )
+
+LEGACY = { 'stsz': stsz_legacy, 'co64': co64_legacy, 'stsc': stsc_legacy, 'stts': stts_legacy, 'CTBO': ctbo_legacy, 'CTMD': ctmd_legacy }
+
+def plain(values):
+  return list( values.items() ) if isinstance(values, dict) else list( values )
+
+def best(repeat, function, *args):
+  times = []
+  for _ in range(repeat):
+    t0 = time.perf_counter()
+    function(*args)
+    times.append(time.perf_counter() - t0)
+  return min(times)*1000
+
+if __name__ == '__main__':
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("-n", "--entries", dest="entries", help="entries per table, comma separated", default='1000,10000,100000')
+  parser.add_option("-r", "--repeat", dest="repeat", type="int", help="best of repeat runs", default=5)
+  (options, args) = parser.parse_args()
+
+  print('%8s %5s %12s %12s %8s' % ('entries', 'table', 'legacy(ms)', 'bulk(ms)', 'speedup'))
+  for n in [ int(s) for s in options.entries.split(',') ]:
+    for name, d in payloads(n).items():
+      if plain( bulk(name, d) ) != plain( LEGACY[name](d) ):
+        print('error: %s values differ' % name)
+      legacy = best(options.repeat, LEGACY[name], d)
+      new = best(options.repeat, bulk, name, d)
+      print('%8d %5s %12.3f %12.3f %8.1f' % (n, name, legacy, new, legacy/new))
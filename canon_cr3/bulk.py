@@ -0,0 +1,185 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+# Asyncio front end of the header only parser, for catalogs of files on high latency storage (NFS, object storage
+# mounted with FUSE). Positioned reads are done by a pool of threads, for up to concurrency files at once.
+# A file is read in two rounds: its first HEADER_READ_SIZE bytes, extended to the top level boxes Cr3.parse_moov()
+# parses (up to moov, and the following ones but mdat when moov has no CTBO), then the areas listed in CTBO (PRVW
+# header, CMTA) and the first CTMD sample, ranges less than gap bytes apart being merged into one read. Parsing is
+# then done from memory by Cr3, like Cr3.parse_headers(): all reads are planned before, none is done by the parser
+# on the event loop thread.
+
+import os
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from CRaw3.Box import BoxReader, PreadReader
+from CRaw3.Cr3 import Cr3
+from canon_cr3.scan import FIELDS, scan_file, _cr3_fields
+
+
+def merge_ranges(ranges, gap=0):
+    """(offset, size) ranges, sorted, and merged when they overlap or are less than gap bytes apart."""
+    merged = []
+    for offset, size in sorted(ranges):
+        if merged and offset <= merged[-1][0] + merged[-1][1] + gap:
+            start = merged[-1][0]
+            merged[-1] = (start, max(merged[-1][1], offset + size - start))
+        else:
+            merged.append((offset, size))
+    return merged
+
+
+class PrefetchedReader(PreadReader):
+    """PreadReader serving only the ranges read by BulkReader: other reads raise ValueError, they are never done."""
+
+    def has(self, offset, size):
+        size = min(size, self.filesize - offset)
+        return any(start <= offset and offset + size <= start + len(data) for start, data in self.segments)
+
+    def pread(self, offset, size):
+        raise ValueError('range not prefetched: offset 0x%x, size 0x%x' % (offset, size))
+
+
+class BulkReader(object):
+    """Reads headers of many CR3 and CRM files at once. reads and bytes_read count positioned reads."""
+
+    def __init__(self, concurrency=32, gap=0x10000, ctmd=True):
+        self.concurrency = concurrency
+        self.gap = gap
+        self.ctmd = ctmd  # also read the first CTMD sample
+        self.executor = ThreadPoolExecutor(concurrency)
+        self.semaphore = None  # created in the running loop
+        self.reads = 0
+        self.bytes_read = 0
+
+    def close(self):
+        self.executor.shutdown()
+
+    async def pread(self, reader, offset, size):
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(self.executor, os.pread, reader.fd, size, offset)
+        self.reads += 1
+        self.bytes_read += len(data)
+        return data
+
+    async def prefetch(self, reader, offset, size):
+        """Reads offset..offset+size into reader, from the end of the segment holding offset if any (one segment)."""
+        size = min(size, reader.filesize - offset)
+        for i, (start, data) in enumerate(reader.segments):
+            if start <= offset <= start + len(data):
+                if offset + size > start + len(data):
+                    data += await self.pread(reader, start + len(data), offset + size - start - len(data))
+                    reader.segments[i] = (start, data)
+                return
+        reader.segments.append((offset, await self.pread(reader, offset, size)))
+
+    async def prefetch_top_boxes(self, reader):
+        """Reads the top level boxes parsed by Cr3.parse_moov(): box headers first, then boxes but mdat."""
+        o = 0
+        while o + BoxReader.S_BOX_HEADER.size <= reader.filesize:
+            await self.prefetch(reader, o, BoxReader.S_BOX_HEADER.size + BoxReader.S_BOX_LARGESIZE.size)
+            box = next(reader.boxes(o, reader.filesize), None)
+            if box is None:
+                return
+            if box.name != b'mdat':
+                await self.prefetch(reader, box.offset, box.size)
+            if box.name == b'moov' and reader.find(b'moov/uuid/CTBO', box.offset, box.offset + box.size):
+                return
+            o += box.size
+
+    async def read(self, path):
+        """Cr3 of path parsed header only, None if path is not a CR3 or CRM file.
+
+        The file is closed when done: its reader keeps the bytes read, other ranges cannot be read.
+        """
+        loop = asyncio.get_running_loop()
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        async with self.semaphore:
+            fd = await loop.run_in_executor(self.executor, os.open, path, os.O_RDONLY)
+            reader = PrefetchedReader(fd, 0)
+            try:
+                reader.filesize = (await loop.run_in_executor(self.executor, os.fstat, fd)).st_size
+                await self.prefetch(reader, 0, Cr3.HEADER_READ_SIZE)
+                if reader.segments[0][1][4:12] != b'ftypcrx ':
+                    return None
+                await self.prefetch_top_boxes(reader)
+                cr3file = Cr3(reader)
+                cr3file.parse_moov()
+                ranges = [(offset, size) for offset, _, size in cr3file.header_areas()]
+                if self.ctmd:
+                    frames = cr3file.get_ctmd_index()
+                    if frames is not None and len(frames):
+                        ranges.append(frames.frame(0)[:2])
+                ranges = merge_ranges([(o, s) for o, s in ranges if not reader.has(o, s)], self.gap)
+                for offset, data in zip([o for o, _ in ranges],
+                                        await asyncio.gather(*[self.pread(reader, o, s) for o, s in ranges])):
+                    reader.segments.append((offset, data))
+                cr3file.parse_areas()
+                return cr3file
+            finally:
+                os.close(fd)
+                reader.fd = None
+
+    async def scan_file(self, path):
+        """Like scan.scan_file(): CR3 and CRM files are read here, others by scan_file() in a thread."""
+        record = dict.fromkeys(FIELDS)
+        record['path'] = path
+        try:
+            cr3file = await self.read(path)
+            if cr3file is None:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, scan_file, path)
+            record['filesize'] = cr3file.reader.filesize
+            _cr3_fields(cr3file, record, self.ctmd)
+        except Exception as e:
+            record['error'] = '%s: %s' % (type(e).__name__, e)
+        return record
+
+
+def scan_records(paths, concurrency=32, ordered=True, reader=None):
+    """Yields scan records of paths, read with a BulkReader, in order of paths or as they are done."""
+    loop = asyncio.new_event_loop()
+    own = reader is None
+    reader = BulkReader(concurrency) if own else reader
+    paths = iter(paths)
+    pending = deque()
+    try:
+        while True:
+            for path in paths:
+                pending.append(loop.create_task(reader.scan_file(path)))
+                if len(pending) >= 2 * reader.concurrency:
+                    break
+            if not pending:
+                break
+            if ordered:
+                yield loop.run_until_complete(pending.popleft())
+                continue
+            done, _ = loop.run_until_complete(asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED))
+            for task in done:
+                pending.remove(task)
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
+        if own:
+            reader.close()
@@ -0,0 +1,165 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+# LRU cache of values parsed from raw files (header only Cr3 objects, CTMD records, Crx tile indexes, previews),
+# bounded by an estimate of their size in bytes, for tools parsing the same files again and again.
+# Entries are dropped when the size or mtime of their file changes.
+
+import os
+import sys
+import copy
+import threading
+from array import array
+from collections import OrderedDict
+
+from CRaw3.Box import PreadReader
+from CRaw3.Cr3 import Cr3
+
+
+def sizeof(value, seen=None):
+    """Estimate of the memory used by value and the objects it refers to, in bytes. Mapped files are not counted."""
+    if seen is None:
+        seen = set()
+    if id(value) in seen or isinstance(value, (type, type(sizeof))):
+        return 0
+    seen.add(id(value))
+    if hasattr(value, 'nbytes') and hasattr(value, 'dtype'):  # numpy array
+        return sys.getsizeof(value) if value.base is not None else value.nbytes + 112
+    if isinstance(value, memoryview):
+        return sys.getsizeof(value) + value.nbytes
+    if isinstance(value, array):
+        return sys.getsizeof(value)
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes, bytearray, int, float)):
+        return size
+    if isinstance(value, dict):
+        return size + sum(sizeof(k, seen) + sizeof(v, seen) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(sizeof(v, seen) for v in value)
+    if hasattr(value, '__dict__'):
+        size += sizeof(vars(value), seen)
+    for name in getattr(type(value), '__slots__', ()):
+        size += sizeof(getattr(value, name, None), seen)
+    return size
+
+
+class ParseCache(object):
+    """LRU cache of values computed from files, evicted when their total size goes over budget bytes.
+
+    get(path, kind, compute, *args) returns compute(path, *args), computed once while the file does not change.
+    Values bigger than budget are returned but not kept. Safe to use from several threads.
+    """
+
+    def __init__(self, budget=64 << 20):
+        self.budget = budget
+        self.entries = OrderedDict()  # (path, kind, args): ((size, mtime), value, bytes), least recently used first
+        self.size = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        return {'entries': len(self.entries), 'bytes': self.size, 'budget': self.budget, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions, 'invalidations': self.invalidations}
+
+    def _remove(self, key):
+        self.size -= self.entries.pop(key)[2]
+
+    def get(self, path, kind, compute, *args):
+        st = os.stat(path)
+        stamp = (st.st_size, st.st_mtime_ns)
+        key = (path, kind) + args
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] == stamp:
+                    self.hits += 1
+                    self.entries.move_to_end(key)
+                    return entry[1]
+                self._remove(key)
+                self.invalidations += 1
+            self.misses += 1
+        value = compute(path, *args)  # not locked: other files are served meanwhile
+        size = sizeof(value)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            if size <= self.budget:
+                self.entries[key] = (stamp, value, size)
+                self.size += size
+                while self.size > self.budget:
+                    self._remove(next(iter(self.entries)))
+                    self.evictions += 1
+        return value
+
+    def invalidate(self, path=None):
+        """Drops entries of path, or all entries."""
+        with self.lock:
+            for key in [k for k in self.entries if path is None or k[0] == path]:
+                self._remove(key)
+                self.invalidations += 1
+
+    def headers(self, path):
+        """Cr3 object of path, parsed header only (see Cr3.parse_headers()). Its reader is closed."""
+        return self.get(path, 'headers', _parse_headers)
+
+    def ctmd(self, path, pic_num=0):
+        """CTMD records of picture pic_num, TIFF records decoded."""
+        return self.get(path, 'ctmd', self._read, 'ctmd', pic_num)
+
+    def crx(self, path, trak='trak3', index=0):
+        """Crx of picture index of trak with its tile, plane and subband headers (not the coded data)."""
+        return self.get(path, 'crx', self._read, 'crx', trak, index)
+
+    def preview(self, path, decoder=None):
+        """PRVW JPEG data, or decoder(data), like pixels decoded with an imaging library."""
+        return self.get(path, 'preview', self._read, 'preview', decoder)
+
+    def _read(self, path, kind, *args):
+        cr3file = _private_copy(self.headers(path))
+        with PreadReader.open(path) as reader:
+            cr3file.reader = reader
+            if kind == 'ctmd':
+                return cr3file.get_ctmd_picture(args[0], tiff=True)
+            if kind == 'crx':
+                return cr3file.get_crx(args[0], args[1], header_only=True)
+            data = cr3file.get_preview()
+            data = None if data is None else bytes(data)
+            decoder = args[0]
+            return data if decoder is None or data is None else decoder(data)
+
+
+def _private_copy(headers):
+    """Copy of cached headers for one _read(), with its own reader: members changed by Cr3 methods are copied too
+    (frame indexes are added by get_frame_index(), get_ctmd() sets CTMD sample offsets), so that the cached value
+    keeps the size it was accounted with."""
+    cr3file = copy.copy(headers)
+    cr3file.frame_indexes = dict(headers.frame_indexes)
+    cr3file.cr3 = dict(headers.cr3)
+    if b'CTMD' in cr3file.cr3:
+        cr3file.cr3[b'CTMD'] = copy.copy(headers.cr3[b'CTMD'])
+    return cr3file
+
+
+def _parse_headers(path):
+    with PreadReader.open(path) as reader:
+        cr3file = Cr3(reader)
+        cr3file.parse_headers()
+    return cr3file
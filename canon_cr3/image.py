@@ -0,0 +1,113 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+
+from CRaw3.Box import BoxReader, PreadReader
+from CRaw3.Cr3 import Cr3
+
+
+class Image(object):
+    """Canon CR3 picture.
+
+    The box tree is parsed on first access and kept by the instance. Embedded
+    pictures are read from their mdat offsets each time a property is accessed.
+
+    With headers_only, the file is not mapped: moov and the areas listed in
+    CTBO are read with a few positioned reads, mdat only when a picture or
+    CTMD is requested.
+    """
+
+    def __init__(self, filename, headers_only=False):
+        self.filename = filename
+        self.headers_only = headers_only
+        self._reader = None
+        self._cr3 = None
+
+    @property
+    def cr3(self):
+        """Parsed CRaw3.Cr3.Cr3 object."""
+        if self._cr3 is None:
+            if self.headers_only:
+                self._reader = PreadReader.open(self.filename)
+                self._cr3 = Cr3(self._reader)
+                self._cr3.parse_headers()
+            else:
+                self._reader = BoxReader.open(self.filename)
+                self._cr3 = Cr3(self._reader)
+                self._cr3.parse()
+        return self._cr3
+
+    def close(self):
+        if self._reader is not None:
+            self._cr3 = None
+            self._reader.close()
+            self._reader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _bytes(view):
+        return None if view is None else bytes(view)
+
+    @property
+    def jpeg_image(self):
+        return self._bytes(self.cr3.get_sample('trak1'))
+
+    @property
+    def sd_crx_image(self):
+        return self._bytes(self.cr3.get_sample('trak2'))
+
+    @property
+    def hd_crx_image(self):
+        return self._bytes(self.cr3.get_sample('trak3'))
+
+    @property
+    def dual_pixel_crx_image(self):
+        return self._bytes(self.cr3.get_sample('trak5'))
+
+    @property
+    def raw_image(self):
+        """Decoded hd CRX picture, as numpy uint16 Bayer array (needs numpy)."""
+        return self.cr3.get_raw('trak3')
+
+    @property
+    def thumbnail_image(self):
+        return self._bytes(self.cr3.get_thumbnail())
+
+    @property
+    def preview_image(self):
+        return self._bytes(self.cr3.get_preview())
+
+    @property
+    def model_id(self):
+        return self.cr3.get_model_id()
+
+    @property
+    def model_name(self):
+        return self.cr3.get_model_name()
+
+    @property
+    def sensor_info(self):
+        return self.cr3.get_sensor_info()
+
+
+Cr3File = Image
@@ -0,0 +1,140 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+# SQLite index of raw file metadata, for incremental rescans and for queries without reading the files.
+# A file is identified by (path, size, mtime, hash of its first 64KB): when all match, its stored record is reused.
+# Besides the flat scan record, the index keeps the box tree, the values kept by Cr3 (trak CRAW, CMP1, stsz, co64,
+# PRVW and THMB offsets, CTBO...) and the decoded tags of CMT1 to CMT4 and of the first CTMD picture.
+
+import os
+import json
+import sqlite3
+import hashlib
+
+from canon_cr3.scan import scan_file
+
+HEAD_SIZE = 0x10000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, head TEXT,
+                                  model_id INTEGER, lens TEXT, iso INTEGER, record TEXT);
+CREATE INDEX IF NOT EXISTS files_model_id ON files (model_id);
+CREATE INDEX IF NOT EXISTS files_lens ON files (lens);
+CREATE INDEX IF NOT EXISTS files_iso ON files (iso);
+CREATE TABLE IF NOT EXISTS boxes (path TEXT, depth INTEGER, name TEXT, offset INTEGER, size INTEGER);
+CREATE INDEX IF NOT EXISTS boxes_path ON boxes (path);
+CREATE TABLE IF NOT EXISTS cr3_values (path TEXT, section TEXT, name TEXT, value TEXT);
+CREATE INDEX IF NOT EXISTS cr3_values_path ON cr3_values (path);
+CREATE TABLE IF NOT EXISTS tags (path TEXT, ifd TEXT, tag INTEGER, value);
+CREATE INDEX IF NOT EXISTS tags_path ON tags (path);
+'''
+
+
+def file_key(path):
+    """(size, mtime in ns, sha1 of the first HEAD_SIZE bytes) of path."""
+    st = os.stat(path)
+    with open(path, 'rb') as f:
+        head = hashlib.sha1(f.read(HEAD_SIZE)).hexdigest()
+    return st.st_size, st.st_mtime_ns, head
+
+
+def index_file(task):
+    """Worker of scan(): task is (path, stored key or None).
+
+    Returns (path, key, record, details). record and details are None when the file did not change, key is None
+    when the file cannot be read (record has the error).
+    """
+    path, stored = task
+    try:
+        key = file_key(path)
+    except OSError:
+        return path, None, scan_file(path), None
+    if stored == key:
+        return path, key, None, None
+    details = {'boxes': [], 'values': [], 'tags': []}
+    return path, key, scan_file(path, details), details
+
+
+class MetadataIndex(object):
+    """Records of scan_file() and their details in a SQLite file."""
+
+    def __init__(self, filename):
+        self.db = sqlite3.connect(filename)
+        self.db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def commit(self):
+        self.db.commit()
+
+    def keys(self):
+        """{path: (size, mtime, head hash)} of indexed files."""
+        return {row[0]: tuple(row[1:]) for row in self.db.execute('SELECT path, size, mtime, head FROM files')}
+
+    def update(self, path, key, record, details):
+        db = self.db
+        for table in ('boxes', 'cr3_values', 'tags'):
+            db.execute('DELETE FROM %s WHERE path = ?' % table, (path,))
+        db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                   (path,) + tuple(key) + (record['model_id'], record['lens'], record['iso'], json.dumps(record)))
+        db.executemany('INSERT INTO boxes VALUES (?, ?, ?, ?, ?)', [(path,) + b for b in details['boxes']])
+        db.executemany('INSERT INTO cr3_values VALUES (?, ?, ?, ?)', [(path,) + v for v in details['values']])
+        db.executemany('INSERT INTO tags VALUES (?, ?, ?, ?)', [(path,) + t for t in details['tags']])
+
+    def get(self, path):
+        """Stored record of path, None if not indexed."""
+        row = self.db.execute('SELECT record FROM files WHERE path = ?', (path,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find(self, model_id=None, lens=None, iso=None):
+        """Records of files with model_id, a lens name containing lens, and iso (criteria which are not None)."""
+        where, args = [], []
+        if model_id is not None:
+            where.append('model_id = ?')
+            args.append(model_id)
+        if lens is not None:
+            where.append('lens LIKE ?')
+            args.append('%' + lens + '%')
+        if iso is not None:
+            where.append('iso = ?')
+            args.append(iso)
+        sql = 'SELECT record FROM files' + (' WHERE ' + ' AND '.join(where) if where else '') + ' ORDER BY path'
+        return [json.loads(row[0]) for row in self.db.execute(sql, args)]
+
+    def boxes(self, path):
+        """Box tree of path, as (depth, name, offset, size) in parsing order."""
+        return self.db.execute('SELECT depth, name, offset, size FROM boxes WHERE path = ? ORDER BY rowid',
+                               (path,)).fetchall()
+
+    def values(self, path, section=None):
+        """{(section, name): value} of the cr3 dict of path, like ('trak3', 'CMP1')."""
+        rows = self.db.execute('SELECT section, name, value FROM cr3_values WHERE path = ?', (path,))
+        return {(s, n): json.loads(v) for s, n, v in rows if section is None or s == section}
+
+    def tags(self, path, ifd=None):
+        """{(ifd, tag): value} of path: text for strings, bytes for bytes sequences, lists of numbers otherwise."""
+        rows = self.db.execute('SELECT ifd, tag, value FROM tags WHERE path = ?', (path,))
+        return {(i, t): json.loads(v) if isinstance(v, str) else v for i, t, v in rows if ifd is None or i == ifd}
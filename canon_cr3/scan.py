@@ -0,0 +1,345 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import csv
+import sys
+import json
+import time
+from multiprocessing import Pool
+
+from CRaw3.Box import BoxReader, PreadReader
+from CRaw3.Cr2 import Cr2
+from CRaw3.Cr3 import Cr3
+from CRaw3.Ctmd import Ctmd
+from CRaw3.Heif import Heif
+from CRaw3.TiffIfd import TiffIfd
+
+EXTENSIONS = ('.cr3', '.cr2', '.crm', '.hif')
+COMMIT_INTERVAL = 1.0  # seconds between commits of the index during a scan
+
+# one flat record per file, same columns for JSON Lines and CSV
+FIELDS = ['path', 'format', 'filesize', 'model_id', 'model_name',
+          'sensor_width', 'sensor_height', 'sensor_left', 'sensor_top', 'sensor_right', 'sensor_bottom',
+          'crx_width', 'crx_height', 'crx_tile_width', 'sd_width', 'sd_height',
+          'jpeg_width', 'jpeg_height', 'preview_width', 'preview_height',
+          'cmp1_width', 'cmp1_height', 'cmp1_tile_width', 'cmp1_tile_height', 'cmp1_bits', 'cmp1_planes',
+          'cmp1_cfa', 'cmp1_extra', 'cmp1_wavelets', 'cmp1_hsize',
+          'timestamp', 'f_number', 'exposure_time', 'iso', 'lens', 'heif_width', 'heif_height', 'heif_tiles', 'error']
+
+
+def find_files(paths, extensions=EXTENSIONS):
+    """Yields files below paths (files or directories) with a raw extension, in sorted order."""
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(extensions):
+                    yield os.path.join(root, name)
+
+
+def _cr3_fields(cr3file, record, ctmd=True):
+    """Fills record from cr3file. With ctmd, also time stamp and exposure of the first CTMD sample."""
+    cr3 = cr3file.cr3
+    record['format'] = 'crm' if cr3file.is_crm() else 'cr3'
+    record['model_id'] = cr3file.get_model_id()
+    record['model_name'] = cr3file.get_model_name().decode('ascii', 'replace')
+    sensor = cr3file.get_sensor_info()
+    record.update(sensor_width=sensor.w, sensor_height=sensor.h, sensor_left=sensor.lb,
+                  sensor_top=sensor.tb, sensor_right=sensor.rb, sensor_bottom=sensor.bb)
+    if b'CRAW' in cr3.get('trak1', {}):
+        record.update(jpeg_width=cr3['trak1'][b'CRAW'].w, jpeg_height=cr3['trak1'][b'CRAW'].h)
+    if b'CRAW' in cr3.get('trak2', {}):
+        record.update(sd_width=cr3['trak2'][b'CRAW'].w, sd_height=cr3['trak2'][b'CRAW'].h)
+    if b'PRVW' in cr3:
+        record.update(preview_width=cr3[b'PRVW'][1].w, preview_height=cr3[b'PRVW'][1].h)
+    # main crx picture: trak3 for CR3, trak1 for CRM
+    for trak in ('trak3', 'trak1'):
+        if b'CMP1' in cr3.get(trak, {}):
+            craw, cmp1 = cr3[trak][b'CRAW'], cr3[trak][b'CMP1']
+            record.update(crx_width=craw.w, crx_height=craw.h, crx_tile_width=cmp1.tw,
+                          cmp1_width=cmp1.iw, cmp1_height=cmp1.ih, cmp1_tile_width=cmp1.tw,
+                          cmp1_tile_height=cmp1.th, cmp1_bits=cmp1.d, cmp1_planes=cmp1.p,
+                          cmp1_cfa=cmp1.cfa, cmp1_extra=cmp1.extra, cmp1_wavelets=cmp1.wl,
+                          cmp1_hsize=cmp1.hsize)
+            break
+    if b'CMT2' in cr3:
+        exif = cr3[b'CMT2'][1]
+        lens = exif.get(TiffIfd.TIFF_EXIF_LensModel)
+        if lens:
+            record['lens'] = lens.decode('ascii', 'replace')
+        iso = exif.get(TiffIfd.TIFF_EXIF_ISO)
+        if iso:
+            record['iso'] = iso[0]
+    if ctmd and b'CTMD' in cr3:  # CTMD samples are in trak4 of CR3 files, trak2 of CRM clips
+        records = cr3file.get_ctmd_picture(0, tiff=False) or {}
+        if Ctmd.CTMD_TYPE_TIMESTAMP in records:
+            t = records[Ctmd.CTMD_TYPE_TIMESTAMP].content
+            record['timestamp'] = '%04d-%02d-%02dT%02d:%02d:%02d' % (t.y, t.mo, t.d, t.h, t.m, t.s)
+        if Ctmd.CTMD_TYPE_EXPOSURE in records:
+            e = records[Ctmd.CTMD_TYPE_EXPOSURE].content
+            if e.f_denum:
+                record['f_number'] = e.f_num / e.f_denum
+            if e.expo_denum:
+                record['exposure_time'] = e.expo_num / e.expo_denum
+            record['iso'] = e.iso
+
+
+def _plain(value):
+    """value with namedtuples as dicts, tuples as lists and bytes as text, for JSON."""
+    if hasattr(value, '_asdict'):
+        return {k: _plain(v) for k, v in value._asdict().items()}
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)) or type(value).__name__ == 'array':
+        return [_plain(v) for v in value]
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).decode('ascii', 'replace')
+    return value
+
+
+def _ifd_tags(name, ifd, details):
+    for tag, entry in ifd.ifd.items():
+        value = ifd.get(tag)
+        if entry.type == TiffIfd.TIFF_TYPE_STRING:
+            value = json.dumps(bytes(value).decode('ascii', 'replace'))
+        elif isinstance(value, (bytes, memoryview)):
+            value = bytes(value)
+        else:
+            value = json.dumps(_plain(value))
+        details['tags'].append((name, tag, value))
+
+
+def _cr3_details(cr3file, details):
+    """Box tree, kept values of the cr3 dict and decoded CMT1-CMT4 and first CTMD picture tags."""
+    cr3 = cr3file.cr3
+    details['boxes'] = [(depth, name.decode('latin-1'), offset, size)
+                        for depth, name, offset, size in cr3file.box_list]
+    for key, value in cr3.items():
+        key = key.decode('latin-1') if isinstance(key, bytes) else key
+        if key.startswith('trak'):
+            for name, v in value.items():
+                details['values'].append((key, name.decode('latin-1'), json.dumps(_plain(v))))
+        elif key in ('PRVW', 'THMB'):
+            offset, v = value
+            details['values'].append((key, 'offset', json.dumps(offset)))
+            details['values'].append((key, key, json.dumps(_plain(v))))
+        elif key in ('CTBO', 'CNCV', 'ftyp'):
+            details['values'].append((key, key, json.dumps(_plain(value))))
+    for name in sorted(Cr3.CMT_TAGS):
+        if name in cr3:
+            _ifd_tags(name.decode('ascii'), cr3[name][1], details)
+    if b'CTMD' in cr3:
+        for type, ctmd_record in (cr3file.get_ctmd_picture(0) or {}).items():
+            if type in Ctmd.CTMD_TIFF_TYPES:
+                for tag, (_, _, _, (_, ifd)) in ctmd_record.content.items():
+                    _ifd_tags('CTMD%d_0x%x' % (type, tag), ifd, details)
+            elif ctmd_record.content is not None:
+                details['values'].append(('CTMD', str(type), json.dumps(_plain(ctmd_record.content))))
+
+
+def _heif_fields(heif, record):
+    record['format'] = 'heif'
+    record['model_id'] = heif.get_model_id()
+    name = heif.get_model_name()
+    if name is not None:
+        record['model_name'] = name.decode('ascii', 'replace')
+    grid = heif.get_grid()
+    if grid:
+        record.update(heif_width=grid.width, heif_height=grid.height, heif_tiles=len(grid.tiles))
+
+
+def scan_file(path, details=None):
+    """Metadata of one file, as a flat dict with FIELDS keys.
+
+    CR3 and CRM files are parsed header only (moov and CTBO areas, plus the
+    first CTMD sample), HEIF files from meta and their Exif item. Errors are reported in the 'error' field, so that one
+    broken file does not stop a batch.
+    details is a dict with 'boxes', 'values' and 'tags' lists, filled for the metadata index (see index.py).
+    """
+    record = dict.fromkeys(FIELDS)
+    record['path'] = path
+    try:
+        with open(path, 'rb') as f:
+            magic = f.read(12)
+        record['filesize'] = os.path.getsize(path)
+        if magic[4:12] == b'ftypcrx ':
+            with PreadReader.open(path) as reader:
+                cr3file = Cr3(reader)
+                cr3file.parse_headers()
+                _cr3_fields(cr3file, record)
+                if details is not None:
+                    _cr3_details(cr3file, details)
+        elif magic[4:12] == b'ftypheix':
+            with PreadReader.open(path) as reader:
+                _heif_fields(Heif(reader).parse(), record)
+        elif magic[:4] == b'II*\x00' and magic[8:12] == b'CR\x02\x00':
+            record['format'] = 'cr2'
+            with BoxReader.open(path) as reader:
+                cr2 = Cr2(reader.data, reader.filesize, 'cr2')
+                record['model_id'] = cr2.get_model_id()
+                record['model_name'] = cr2.get_model_name().decode('ascii', 'replace')
+                if details is not None:
+                    for key, ifd in cr2.ifd_list.items():
+                        _ifd_tags('%x' % key, ifd, details)
+                del cr2  # releases views on the mapping before close
+        else:
+            record['error'] = 'unknown format'
+    except Exception as e:
+        record['error'] = '%s: %s' % (type(e).__name__, e)
+    return record
+
+
+class JsonLinesWriter(object):
+    """One JSON object per line."""
+
+    def __init__(self, f):
+        self.f = f
+
+    def writerow(self, record):
+        self.f.write(json.dumps(record) + '\n')
+
+
+def done_paths(filename, fmt):
+    """Paths already in output file, for resume.
+
+    A partial last line (crash while writing) is removed from the file.
+    """
+    done = set()
+    if not os.path.exists(filename):
+        return done
+    with open(filename, 'r+', newline='', encoding='utf-8') as f:
+        content = f.read()
+        end = content.rfind('\n') + 1
+        if end < len(content):
+            f.seek(0)
+            f.truncate(len(content[:end].encode()))
+        lines = content[:end].splitlines()
+    if fmt == 'csv':
+        for row in csv.DictReader(lines):
+            done.add(row['path'])
+    else:
+        for line in lines:
+            done.add(json.loads(line)['path'])
+    return done
+
+
+def _open_output(output, fmt, append=False):
+    """(file, writer) for records. The CSV header is written unless appending to a non-empty file."""
+    if output:
+        exists = os.path.exists(output) and os.path.getsize(output) > 0
+        out = open(output, 'a' if append else 'w', newline='', encoding='utf-8')
+    else:
+        exists = False
+        out = sys.stdout
+    if fmt == 'csv':
+        writer = csv.DictWriter(out, fieldnames=FIELDS)
+        if not (append and exists):
+            writer.writeheader()
+    else:
+        writer = JsonLinesWriter(out)
+    return out, writer
+
+
+def scan(paths, output=None, fmt='jsonl', jobs=None, ordered=True, resume=False, chunksize=16, progress=None,
+         index=None, concurrency=None):
+    """Scans files below paths with a pool of jobs processes and writes one record per file.
+
+    output is a filename (stdout if None). With resume, files already in output
+    are skipped and new records are appended. progress is a file (like
+    sys.stderr) to report files per second, None for silence.
+    index is a SQLite file (see index.py): files which did not change since they were indexed are not parsed,
+    their stored record is written. Other files are parsed and indexed.
+    With concurrency, headers are read by an asyncio BulkReader (see bulk.py) in this process, concurrency files
+    at once, instead of a pool of processes: for high latency storage. It cannot be used with index.
+    Returns (number of files, elapsed seconds).
+    """
+    if index and concurrency:
+        raise ValueError('index and concurrency cannot be used together')
+    skip = done_paths(output, fmt) if output and resume else set()
+    files = (path for path in find_files(paths) if path not in skip)
+    if index:
+        from canon_cr3.index import MetadataIndex, index_file
+        db = MetadataIndex(index)
+        stored = db.keys()  # the pool reads tasks in another thread, which cannot use db
+        tasks, worker = ((path, stored.get(path)) for path in files), index_file
+    else:
+        tasks, worker = files, scan_file
+
+    out, writer = _open_output(output, fmt, resume)
+    count = unchanged = 0
+    start = last = committed = time.time()
+    pool = None
+    try:
+        if concurrency:
+            from canon_cr3.bulk import scan_records
+            results = scan_records(tasks, concurrency, ordered)
+        else:
+            pool = Pool(jobs)
+            results = (pool.imap if ordered else pool.imap_unordered)(worker, tasks, chunksize)
+        for result in results:
+            record = result
+            if index:
+                path, key, record, details = result
+                if record is None:
+                    record = db.get(path)
+                    unchanged += 1
+                elif key is not None:
+                    db.update(path, key, record, details)
+            writer.writerow(record)
+            out.flush()  # records written are not scanned again on resume
+            count += 1
+            now = time.time()
+            if progress and now - last >= 1:
+                print('%d files, %.1f files/s' % (count, count / (now - start)), file=progress)
+                last = now
+            if index and now - committed >= COMMIT_INTERVAL:  # an interrupted scan keeps what was indexed
+                db.commit()
+                committed = now
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if out is not sys.stdout:
+            out.close()
+        if index:
+            db.close()
+    elapsed = time.time() - start
+    if progress:
+        print('%d files in %.2fs, %.1f files/s' % (count, elapsed, count / elapsed if elapsed else 0), file=progress)
+        if index:
+            print('%d files unchanged since indexed' % unchanged, file=progress)
+    return count, elapsed
+
+
+def query(index, output=None, fmt='jsonl', model_id=None, lens=None, iso=None):
+    """Writes the records of indexed files matching model_id, lens (part of name) and iso. Files are not read.
+    Returns the number of records."""
+    from canon_cr3.index import MetadataIndex
+    with MetadataIndex(index) as db:
+        records = db.find(model_id, lens, iso)
+    out, writer = _open_output(output, fmt)
+    try:
+        for record in records:
+            writer.writerow(record)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return len(records)
@@ -0,0 +1,172 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+# Local HTTP server of the JPEG pictures embedded in CR3 files (THMB, PRVW and the full size picture of trak1).
+# Pictures are sent from their offsets in the raw file with loop.sendfile() (os.sendfile when possible): raw files are
+# never read as a whole. Headers are parsed once per file (header only, in a thread) and kept in a ParseCache while
+# the size and mtime of the file do not change. One byte range (Range, If-Range) and ETag (If-None-Match) are supported.
+#
+# GET or HEAD /thmb/<path>, /prvw/<path> or /jpeg/<path>, path being relative to the served directory.
+
+import os
+import asyncio
+from urllib.parse import unquote, urlsplit
+
+from CRaw3.Box import PreadReader
+from CRaw3.Cr3 import Cr3
+from canon_cr3.cache import ParseCache
+
+KINDS = ('thmb', 'prvw', 'jpeg')
+REASONS = {200: 'OK', 206: 'Partial Content', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 416: 'Range Not Satisfiable'}
+MAX_HEADERS = 100
+
+
+def embedded_ranges(path):
+    """{kind: (offset, size)} of the JPEG pictures of a CR3 file, parsed header only."""
+    with PreadReader.open(path) as reader:
+        cr3file = Cr3(reader)
+        cr3file.parse_headers()
+        ranges = {'thmb': cr3file.get_thumbnail_range(), 'prvw': cr3file.get_preview_range(),
+                  'jpeg': cr3file.get_jpeg_range()}
+    return {kind: r for kind, r in ranges.items() if r is not None}
+
+
+def parse_range(value, length):
+    """(start, stop) of a 'bytes=first-last' Range header value, for a body of length bytes.
+
+    None when the header must be ignored (other unit, several ranges, bad syntax), ValueError when the range is
+    not satisfiable.
+    """
+    unit, _, spec = value.partition('=')
+    first, dash, last = spec.strip().partition('-')
+    if unit.strip().lower() != 'bytes' or not dash or not (first.isdigit() or last.isdigit()):
+        return None
+    if (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+    if not first:  # suffix: last bytes
+        if int(last) == 0:
+            raise ValueError('empty suffix range')
+        return max(0, length - int(last)), length
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= length:
+        raise ValueError('range starts after end')
+    return start, min(int(last) + 1 if last else length, length)
+
+
+class ImageServer(object):
+    """Serves pictures embedded in the CR3 files below root. Picture ranges are kept in cache, a ParseCache."""
+
+    def __init__(self, root, cache=None):
+        self.root = os.path.realpath(root)
+        self.cache = ParseCache(4 << 20) if cache is None else cache
+
+    def resolve(self, target):
+        """(kind, file path) of a request target, None if it is not a picture below root."""
+        kind, _, name = unquote(urlsplit(target).path).lstrip('/').partition('/')
+        path = os.path.realpath(os.path.join(self.root, name))
+        if kind not in KINDS or not name or not path.startswith(self.root + os.sep):
+            return None
+        return kind, path
+
+    async def ranges(self, path):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.cache.get, path, 'ranges', embedded_ranges)
+
+    async def handle(self, reader, writer):
+        """Connection handler for asyncio.start_server(). Connections are kept alive (HTTP/1.1)."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                request = line.decode('latin-1').split()
+                headers = {}
+                while len(headers) <= MAX_HEADERS:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if len(request) != 3 or len(headers) > MAX_HEADERS:
+                    self.send_head(writer, 400, {'Connection': 'close'})
+                    break
+                method, target, version = request
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+                await self.respond(writer, method, target, headers)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def send_head(writer, status, headers, length=0):
+        lines = ['HTTP/1.1 %d %s' % (status, REASONS[status])]
+        lines += ['%s: %s' % item for item in headers.items()]
+        if status != 304:  # no body, and no Content-Length of a zero length representation
+            lines.append('Content-Length: %d' % length)
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+    async def respond(self, writer, method, target, headers):
+        if method not in ('GET', 'HEAD'):
+            return self.send_head(writer, 405, {'Allow': 'GET, HEAD'})
+        resolved = self.resolve(target)
+        if resolved is None:
+            return self.send_head(writer, 404, {})
+        kind, path = resolved
+        try:
+            st = os.stat(path)
+            ranges = await self.ranges(path)
+        except Exception:  # missing file, not a CR3
+            return self.send_head(writer, 404, {})
+        if kind not in ranges:
+            return self.send_head(writer, 404, {})
+        offset, size = ranges[kind]
+        etag = '"%x-%x-%s"' % (st.st_size, st.st_mtime_ns, kind)
+        response = {'Content-Type': 'image/jpeg', 'Accept-Ranges': 'bytes', 'ETag': etag}
+        if_none_match = headers.get('if-none-match')
+        if if_none_match and (if_none_match == '*' or etag in [t.strip() for t in if_none_match.split(',')]):
+            return self.send_head(writer, 304, response)
+        status, start, stop = 200, 0, size
+        if 'range' in headers and headers.get('if-range', etag) == etag:
+            try:
+                r = parse_range(headers['range'], size)
+            except ValueError:
+                response['Content-Range'] = 'bytes */%d' % size
+                return self.send_head(writer, 416, response)
+            if r is not None:
+                status, (start, stop) = 206, r
+                response['Content-Range'] = 'bytes %d-%d/%d' % (start, stop - 1, size)
+        self.send_head(writer, status, response, stop - start)
+        if method == 'GET':
+            await writer.drain()
+            with open(path, 'rb') as f:
+                await asyncio.get_running_loop().sendfile(writer.transport, f, offset + start, stop - start)
+
+
+async def serve(root, host='127.0.0.1', port=8000, cache_budget=4 << 20):
+    """Serves pictures of CR3 files below root until cancelled. Picture ranges use at most cache_budget bytes."""
+    server = await asyncio.start_server(ImageServer(root, ParseCache(cache_budget)).handle, host, port)
+    async with server:
+        await server.serve_forever()
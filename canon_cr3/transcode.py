@@ -0,0 +1,175 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from multiprocessing import Pool
+
+from CRaw3.Box import PreadReader
+from CRaw3.Cr3 import Cr3
+from CRaw3.FrameIndex import FrameIndex
+from CRaw3.TiffIfd import TiffIfd
+
+
+class FileSink(ABC):
+    """Writes one file per frame in directory, named with pattern % frame number.
+
+    decode tells if frames are given as Bayer arrays (True) or CRX samples (False).
+    """
+
+    decode = True
+    pattern = 'frame%06d'
+
+    def __init__(self, directory, pattern=None):
+        self.directory = directory
+        if pattern is not None:
+            self.pattern = pattern
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, n, frame):
+        with open(os.path.join(self.directory, self.pattern % n), 'wb') as f:
+            self.dump(f, frame)
+
+    @abstractmethod
+    def dump(self, f, frame):
+        """Writes frame to the open file f."""
+
+    def close(self):
+        pass
+
+
+class NpySink(FileSink):
+    """Bayer arrays as .npy files."""
+
+    pattern = 'frame%06d.npy'
+
+    def dump(self, f, bayer):
+        import numpy as np
+        np.save(f, bayer)
+
+
+class RawSink(FileSink):
+    """Bayer values as 16 bits little-endian, row after row, without header."""
+
+    pattern = 'frame%06d.raw'
+
+    def dump(self, f, bayer):
+        f.write(bayer.astype('<u2').tobytes())
+
+
+class TiffSink(FileSink):
+    """Bayer arrays as 16 bits grey TIFF, one strip."""
+
+    pattern = 'frame%06d.tif'
+
+    def dump(self, f, bayer):
+        f.write(TiffIfd.tiff16_header(bayer.shape[1], bayer.shape[0]))
+        f.write(bayer.astype('<u2').tobytes())
+
+
+class CrxSink(FileSink):
+    """CRX samples as read from the clip (like parse_cr3.py -x)."""
+
+    decode = False
+    pattern = 'frame%06d_crx.bin'
+
+    def dump(self, f, sample):
+        f.write(sample)
+
+
+SINKS = {'npy': NpySink, 'tiff': TiffSink, 'raw': RawSink, 'crx': CrxSink}
+
+_clip = None  # (Cr3, trak) of a worker process
+
+
+def _open_clip(filename, index=None):
+    reader = PreadReader.open(filename)
+    cr3file = Cr3(reader)
+    cr3file.parse_headers()
+    trak = cr3file.get_crx_trak()
+    if index and os.path.exists(index):
+        cr3file.frame_indexes[trak] = FrameIndex.load(index)
+    return cr3file, trak
+
+
+def _init_worker(filename, index):
+    global _clip
+    _clip = _open_clip(filename, index)
+
+
+def _transcode_frame(task):
+    """Frame n of the clip of this worker: Bayer array, CRX sample, or None if not supported."""
+    n, decode, reduction = task
+    cr3file, trak = _clip
+    # CRX headers are parsed once, from the whole sample when all subbands are decoded
+    crx = cr3file.get_crx(trak, n, header_only=not decode or reduction > 0)
+    if crx is None or not crx.tiles:
+        return n, None
+    if not decode:
+        return n, bytes(cr3file.get_sample(trak, n))
+    return n, cr3file.get_raw(trak, n, reduction=reduction, crx=crx)
+
+
+def transcode(filename, sink, jobs=None, depth=None, start=0, count=None, reduction=0, index=None, progress=None):
+    """Reads frames of a CRM clip (or the pictures of a CR3 roll) in order, decodes them with a pool of jobs
+    processes and writes them in order to sink (a FileSink).
+
+    At most depth frames (2 per process by default) are read, decoded or waiting to be written, so memory does
+    not depend on the length of the clip. Frames from start, count frames (all by default). index is a frame
+    index file (see FrameIndex), built if missing. progress is a file (like sys.stderr) to report frames per
+    second, None for silence.
+    Returns (number of frames written, number of frames not supported, elapsed seconds).
+    """
+    cr3file, trak = _open_clip(filename, index)
+    frames = cr3file.get_frame_index(trak)
+    cr3file.reader.close()
+    if index and not os.path.exists(index):
+        frames.save(index)
+    end = len(frames) if count is None else min(len(frames), start + count)
+    jobs = jobs or os.cpu_count() or 1
+    depth = depth or 2 * jobs
+
+    written = skipped = 0
+    start_time = last = time.time()
+    try:
+        with Pool(jobs, _init_worker, (filename, index)) as pool:
+            pending = deque()
+            n = start
+            while n < end or pending:
+                while n < end and len(pending) < depth:
+                    pending.append(pool.apply_async(_transcode_frame, ((n, sink.decode, reduction),)))
+                    n += 1
+                number, frame = pending.popleft().get()
+                if frame is None:
+                    skipped += 1
+                    continue
+                sink.write(number, frame)
+                written += 1
+                now = time.time()
+                if progress and now - last >= 1:
+                    print('%d frames, %.1f frames/s' % (written, written / (now - start_time)), file=progress)
+                    last = now
+    finally:
+        sink.close()
+    elapsed = time.time() - start_time
+    if progress:
+        print('%d frames in %.2fs, %.1f frames/s, %d not supported' % (
+            written, elapsed, written / elapsed if elapsed else 0, skipped), file=progress)
+    return written, skipped, elapsed
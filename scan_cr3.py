@@ -0,0 +1,41 @@
+# scan directories of CR3, CRM and CR2 files with a pool of processes, metadata as JSON Lines or CSV
+# from https://github.com/lclevy/canon_cr3
+# License is GPLv3 
+
+import sys
+from optparse import OptionParser
+
+from canon_cr3.scan import scan, query
+
+
+if __name__ == '__main__':
+  parser = OptionParser(usage="usage: %prog [options] dir_or_file...")
+  parser.add_option("-o", "--output", dest="output", help="output file, default is stdout", default=None)
+  parser.add_option("-f", "--format", dest="format", help="jsonl or csv", default='jsonl', choices=['jsonl', 'csv'])
+  parser.add_option("-j", "--jobs", type="int", dest="jobs", help="number of processes, default is cpu count", default=None)
+  parser.add_option("-u", "--unordered", action="store_false", dest="ordered", help="write records as files are done", default=True)
+  parser.add_option("-r", "--resume", action="store_true", dest="resume", help="skip files already in output, and append", default=False)
+  parser.add_option("-c", "--chunksize", type="int", dest="chunksize", help="files per task sent to a process", default=16)
+  parser.add_option("-q", "--quiet", action="store_true", dest="quiet", help="do not report files per second", default=False)
+  parser.add_option("-a", "--async", type="int", dest="concurrency", help="read headers with asyncio, this many files at once, instead of processes (high latency storage)", default=None)
+  parser.add_option("-i", "--index", dest="index", help="SQLite metadata index: unchanged files are not parsed again", default=None)
+  parser.add_option("--model-id", dest="model_id", help="with --index, query files of this model ID (like 0x80000424)", default=None)
+  parser.add_option("--lens", dest="lens", help="with --index, query files with lens name containing this", default=None)
+  parser.add_option("--iso", type="int", dest="iso", help="with --index, query files with this ISO", default=None)
+
+  (options, args) = parser.parse_args()
+  if options.model_id is not None or options.lens is not None or options.iso is not None:
+    if not options.index:
+      parser.error('queries need --index')
+    model_id = None if options.model_id is None else int(options.model_id, 0)
+    query( options.index, options.output, options.format, model_id, options.lens, options.iso )
+    sys.exit()
+  if not args:
+    parser.error('no directory or file')
+  if options.resume and not options.output:
+    parser.error('--resume needs --output')
+  if options.index and options.concurrency:
+    parser.error('--async cannot be used with --index')
+
+  scan( args, options.output, options.format, options.jobs, options.ordered, options.resume, options.chunksize,
+        None if options.quiet else sys.stderr, options.index, options.concurrency )
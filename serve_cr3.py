@@ -0,0 +1,24 @@
+# local HTTP server of thumbnails, previews and full size JPEG pictures embedded in CR3 files, for galleries
+# from https://github.com/lclevy/canon_cr3
+# License is GPLv3 
+
+import asyncio
+from optparse import OptionParser
+
+from canon_cr3.server import serve
+
+
+if __name__ == '__main__':
+  parser = OptionParser(usage="usage: %prog [options] directory\n\nGET /thmb/<path>, /prvw/<path> or /jpeg/<path>, path relative to directory")
+  parser.add_option("-b", "--bind", dest="host", help="address to listen on, default is 127.0.0.1", default='127.0.0.1')
+  parser.add_option("-p", "--port", type="int", dest="port", help="port, default is 8000", default=8000)
+  parser.add_option("-c", "--cache", type="int", dest="cache_mb", help="memory for parsed headers, in MB (default 4)", default=4)
+
+  (options, args) = parser.parse_args()
+  if len(args) != 1:
+    parser.error('one directory')
+
+  try:
+    asyncio.run( serve( args[0], options.host, options.port, options.cache_mb << 20 ) )
+  except KeyboardInterrupt:
+    pass
@@ -23,7 +23,8 @@ description = '''Package for extracting images and metadata out of Canon CR3 RAW
 setup(
     name='canon_cr3',
     version='13mar2019',
-    packages=['canon_cr3'],
+    packages=['canon_cr3', 'CRaw3'],
+    extras_require={'decode': ['numpy']},
     keywords='Canon cr3',
     url='https://github.com/superadm1n/CiscoAutomationFramework',
     license='GPLv3',
@@ -0,0 +1,317 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+# CRX plane encoder, the mirror of CrxDecoder, to build lossless and lossy (wavelets) test samples.
+
+from struct import pack
+
+import numpy as np
+
+from CRaw3.CrxDecoder import CrxDecoder
+
+J = CrxDecoder.J
+JS = CrxDecoder.JS
+
+
+class BitWriter(object):
+
+    def __init__(self):
+        self.out = bytearray()
+        self.value = 0
+        self.count = 0
+
+    def write(self, value, count):
+        self.value = (self.value << count) | value
+        self.count += count
+        while self.count >= 32:
+            self.count -= 32
+            self.out += (self.value >> self.count).to_bytes(4, 'big')
+            self.value &= (1 << self.count) - 1
+
+    def getvalue(self):
+        pad = -self.count % 32
+        return bytes(self.out) + (self.value << pad).to_bytes((self.count + pad) // 8, 'big')
+
+
+class PlaneEncoder(object):
+
+    def __init__(self):
+        self.bits = BitWriter()
+        self.k = 0
+        self.s = 0
+
+    def golomb(self, code):
+        k = self.k
+        if code >> k >= CrxDecoder.ESCAPE_ZEROS:
+            self.bits.write(1, CrxDecoder.ESCAPE_ZEROS + 1)
+            self.bits.write(code, CrxDecoder.ESCAPE_BITS)
+        else:
+            self.bits.write(1, (code >> k) + 1)
+            if k:
+                self.bits.write(code & ((1 << k) - 1), k)
+
+    def next_k(self, code, k_max=CrxDecoder.K_MAX):
+        k = self.k
+        k = k - (code < ((1 << k) >> 1)) + ((code >> k) > 2) + ((code >> k) > 5)
+        self.k = k if k_max is None else min(k, k_max)
+
+    def code(self, error, k_code=None):
+        code = 2 * error if error >= 0 else -2 * error - 1
+        self.golomb(code)
+        if k_code is not None:
+            code = k_code(code)
+        self.next_k(code)
+
+    def run(self, count, length):
+        if count == 0:
+            self.bits.write(0, 1)
+            return
+        self.bits.write(1, 1)
+        n = 1
+        while n < length:
+            if n + JS[self.s] <= count:
+                self.bits.write(1, 1)
+                n += JS[self.s]
+                self.s = min(self.s + 1, 31)
+                continue
+            if count == length:  # decoder stops at end of line
+                self.bits.write(1, 1)
+                return
+            self.bits.write(0, 1)
+            if J[self.s]:
+                self.bits.write(count - n, J[self.s])
+            self.s = max(self.s - 1, 0)
+            return
+
+    def encode(self, plane):
+        height, width = len(plane), len(plane[0])
+        prev = None
+        for y in range(height):
+            line = [int(v) for v in plane[y]]
+            cur = [0] * (width + 2)
+            cur[1:width + 1] = line
+            if y == 0:
+                cur[0] = 0
+            else:
+                cur[0] = prev[1]
+            x = 0
+            length = width
+            while length > 1:
+                a = cur[x]
+                if y == 0:
+                    in_run = a == 0
+                    if a:
+                        pred = a
+                else:
+                    in_run = a == prev[x + 1] == prev[x + 2]
+                    if not in_run:
+                        pred = self.median(a, prev[x + 1], prev[x])
+                if in_run:
+                    count = 0
+                    while count < length and line[x + count] == a:
+                        count += 1
+                    self.run(count, length)
+                    length -= count
+                    x += count
+                    if length <= 0:
+                        break
+                    pred = 0 if y == 0 else prev[x + 1]
+                if y == 0 or length == 1:
+                    self.code(cur[x + 1] - pred)
+                else:
+                    d = prev[x + 2] - prev[x + 1]
+                    self.code(cur[x + 1] - pred, lambda code: (code + 2 * abs(d)) >> 1)
+                x += 1
+                length -= 1
+            if length == 1:
+                pred = cur[x] if y == 0 else self.median(cur[x], prev[x + 1], prev[x])
+                self.code(cur[x + 1] - pred)
+                x += 1
+            cur[x + 1] = cur[x] + 1
+            prev = cur
+        return self.bits.getvalue()
+
+    def encode_noref(self, band):
+        height, width = len(band), len(band[0])
+        prev = [0] * (width + 2)
+        kline = [0] * (width + 1)
+        for y in range(height):
+            line = [int(v) for v in band[y]]
+            cur = [0] + line + [0]
+            x = 0
+            if y == 0:
+                length = width
+                while length > 1:
+                    if cur[x]:
+                        code = self.signed(cur[x + 1])
+                    else:
+                        count = 0
+                        while count < length and line[x + count] == 0:
+                            count += 1
+                        self.run(count, length)
+                        length -= count
+                        kline[x:x + count] = [0] * count
+                        x += count
+                        if length <= 0:
+                            break
+                        code = self.signed(cur[x + 1]) - 1  # not zero
+                    self.golomb(code)
+                    self.next_k(code, None)
+                    kline[x] = self.k
+                    x += 1
+                    length -= 1
+                if length == 1:
+                    code = self.signed(cur[x + 1])
+                    self.golomb(code)
+                    self.next_k(code, None)
+                    kline[x] = self.k
+            else:
+                while x < width - 1:
+                    if prev[x + 2] or prev[x + 1] or cur[x]:
+                        code = self.signed(cur[x + 1])
+                    else:
+                        count = 0
+                        while x + count < width and line[x + count] == 0:
+                            count += 1
+                        self.run(count, width - x)
+                        kline[x:x + count] = [0] * count
+                        x += count
+                        if x >= width - 1:
+                            if x == width - 1:
+                                code = self.signed(cur[x + 1]) - 1
+                                self.golomb(code)
+                                self.next_k(code)
+                                kline[x] = self.k
+                            x += 1
+                            continue
+                        code = self.signed(cur[x + 1]) - 1
+                    self.golomb(code)
+                    self.next_k(code, None)
+                    if kline[x + 1] - self.k > 1:
+                        self.k += 1
+                    else:
+                        self.k = min(self.k, CrxDecoder.K_MAX)
+                    kline[x] = self.k
+                    x += 1
+                if x == width - 1:
+                    code = self.signed(cur[x + 1])
+                    self.golomb(code)
+                    self.next_k(code)
+                    kline[x] = self.k
+            prev = cur
+        return self.bits.getvalue()
+
+    @staticmethod
+    def signed(value):
+        return 2 * value if value >= 0 else -2 * value - 1
+
+    @staticmethod
+    def median(a, b, c):
+        d = b - c
+        if d >= 0:
+            return (b if a < b else a) if c < a else a + d
+        return (b if a >= b else a) if c >= a else a + d
+
+
+def encode_plane(plane):
+    '''lossless bitstream of a 2D sequence of (signed) plane values'''
+    return PlaneEncoder().encode(plane)
+
+
+def encode_band(band):
+    '''bitstream of a high frequency subband, values are not predicted'''
+    return PlaneEncoder().encode_noref(band)
+
+
+def fdwt53(x):
+    '''forward LeGall 5/3 lifting along last axis, mirrored at both ends: (low, high)'''
+    length = x.shape[-1]
+    if length <= 1:
+        return x.copy(), x[..., :0]
+    even = x[..., 0::2]
+    odd = x[..., 1::2]
+    odd_count = odd.shape[-1]
+    following = np.concatenate((even[..., 1:], even[..., -1:]), axis=-1)  # x[length] is x[length-2]
+    high = odd - ((even[..., :odd_count] + following[..., :odd_count]) >> 1)
+    mirrored = np.concatenate((high[..., :1], high, high[..., -1:]), axis=-1)
+    low = even + ((mirrored[..., :even.shape[-1]] + mirrored[..., 1:even.shape[-1] + 1] + 2) >> 2)
+    return low, high
+
+
+def tile_bands(plane, area, tile_rows, tile_cols, tindex, levels, margin=64):
+    '''subbands of one tile, in CrxDecoder.band_sizes() order. The tile is transformed with margin
+    values of neighbour tiles, to get the coefficients of neighbours needed by the decoder'''
+    row, col, height, width = area
+    tr, tc = divmod(tindex, tile_cols)
+    step = 1 << levels  # keeps the phase of the tile at all levels
+    top = min(margin, row) // step * step
+    left = min(margin, col) // step * step
+    x = np.asarray(plane, dtype=np.int64)[row - top:row + height + margin, col - left:col + width + margin]
+    rows = CrxDecoder.band_extents(height, tr > 0, tr < tile_rows - 1, levels)
+    cols = CrxDecoder.band_extents(width, tc > 0, tc < tile_cols - 1, levels)
+    bands = []
+    for level in range(levels):
+        low_rows, high_rows = fdwt53(x.T)
+        ll, hl = fdwt53(low_rows.T)
+        lh, hh = fdwt53(high_rows.T)
+        r, c = top >> (level + 1), left >> (level + 1)
+        _, low_h, high_h = rows[level]
+        _, low_w, high_w = cols[level]
+        rh, ch = r - (tr > 0), c - (tc > 0)  # high coefficient before the tile
+        bands.append([hl[r:r + low_h, ch:ch + high_w], lh[rh:rh + high_h, c:c + low_w],
+                      hh[rh:rh + high_h, ch:ch + high_w]])
+        x = ll
+    bands.append([ll[r:r + low_h, c:c + low_w]])
+    return [band for level in reversed(bands) for band in level]
+
+
+def encode_bands(bands, quant=4):
+    '''bitstreams of subbands, LL first. Values are divided by the quantization step'''
+    streams = []
+    for sindex, band in enumerate(bands):
+        q = quant[sindex] if isinstance(quant, list) else quant
+        band = np.asarray(band) // CrxDecoder.qscale(q)
+        streams.append(encode_plane(band) if sindex == 0 else encode_band(band))
+    return streams
+
+
+def crx_sample(planes_per_tile, quant=4, version=1, qp_data=b''):
+    '''CRX sample (headers, then data) for a list of tiles, each a list of 4 planes. A plane is a
+    lossless bitstream or a list of subband bitstreams. quant is the quantValue of subbands, or a list.
+    Version 2 tiles start with qp_data'''
+    header = b''
+    body = b''
+    for tindex, planes in enumerate(planes_per_tile):
+        planes = [[p] if isinstance(p, bytes) else p for p in planes]
+        size = sum(len(b) for p in planes for b in p)
+        if version == 2:
+            header += pack('>HHLH2sLHH', 0xff11, 16, len(qp_data) + size, tindex, b'\0\0', len(qp_data), 0, 0)
+            body += qp_data
+        else:
+            header += pack('>HHLH2s', 0xff01, 8, size, tindex, b'\0\0')
+        for pindex, p in enumerate(planes):
+            header += pack('>HHLL', 0xff12 if version == 2 else 0xff02, 8, sum(len(b) for b in p),
+                           (pindex << 28) | (1 << 27))
+            for sindex, b in enumerate(p):
+                q = quant[sindex] if isinstance(quant, list) else quant
+                if version == 2:
+                    header += pack('>HHLLLH2s', 0xff13, 16, len(b), (sindex << 28) | (q << 19), 0x100, 1, b'')
+                else:
+                    header += pack('>HHLL', 0xff03, 8, len(b), (sindex << 28) | (q << 19))
+        body += b''.join(b for p in planes for b in p)
+    return header, body
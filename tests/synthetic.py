@@ -0,0 +1,183 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+# Synthetic CR3 and CRM files, for tests and benchmarks (see benchmarks/bench_parse.py): ftyp, moov with the Canon
+# uuid (CNCV, CTBO, CMT1 to CMT4, THMB), traks with CRAW/CMP1, stsz and co64, CTMD records and CRX headers in mdat.
+# Only headers are written: JPEG and CRX data are holes of a sparse file, so pictures can not be decoded.
+
+from struct import pack
+
+from CRaw3.Box import BoxReader
+from CRaw3.Ctmd import Ctmd
+from CRaw3.TiffIfd import TiffIfd
+from tests.test_box import box
+from tests.test_ctmd import record
+from tests.test_tiffifd import tiff
+
+MODEL_ID = 0x80000424
+
+
+def crx_header(tiles, subband_size, levels=0, planes=4):
+    '''CRX header (v1) of tiles tiles, with planes planes per tile and 3*levels+1 subbands of subband_size bytes
+    per plane. Returns (header, size of the data following the header)'''
+    subbands = 3 * levels + 1
+    plane_size = subbands * subband_size
+    header = b''
+    for t in range(tiles):
+        header += pack('>HHLH2s', 0xff01, 8, planes * plane_size, t, b'')
+        for p in range(planes):
+            header += pack('>HHLL', 0xff02, 8, plane_size, p << 28)
+            header += b''.join(pack('>HHLL', 0xff03, 8, subband_size, s << 28) for s in range(subbands))
+    return header, tiles * planes * plane_size
+
+
+def crx_trak(width, height, tiles, levels, header):
+    '''stsd with CRAW and CMP1 of a CRX trak, tiles is (columns, rows)'''
+    cmp1 = box(b'CMP1', pack('>HHHHLLLLBBBBL', 0xffff, 0x30, 0x100, 0, width, height, width // tiles[0],
+                              height // tiles[1], 14, 4 << 4, levels, 0, len(header)) + bytes(16))
+    craw = box(b'CRAW', pack('>LL16sHHHHHHLH32sHHHH', 0, 1, b'', width, height, 0x48, 0, 0x48, 0, 0, 1, b'', 24,
+                             0xffff, 1, 1) + cmp1)
+    return box(b'stsd', bytes(8) + craw)
+
+
+def jpeg_trak(width, height):
+    craw = box(b'CRAW', pack('>LL16sHHHHHHLH32sHHHH', 0, 1, b'', width, height, 0x48, 0, 0x48, 0, 0, 1, b'', 24,
+                             0xffff, 3, 0))
+    return box(b'stsd', bytes(8) + craw)
+
+
+def cmt_boxes(roll):
+    '''CMT1 (IFD0), CMT2 (Exif), CMT3 (makernote) and CMT4 (GPS) boxes'''
+    cmt1 = tiff(b'II', [(0x10f, TiffIfd.TIFF_TYPE_STRING, 6, b'Canon\0'),
+                        (TiffIfd.TIFF_EXIF_Model, TiffIfd.TIFF_TYPE_STRING, 15, b'Canon EOS R5\0\0\0'),
+                        (0x112, TiffIfd.TIFF_TYPE_USHORT, 1, pack('<H', 1)),
+                        (0x11a, TiffIfd.TIFF_TYPE_URATIONAL, 1, pack('<LL', 72, 1)),
+                        (0x132, TiffIfd.TIFF_TYPE_STRING, 20, b'2020:08:01 12:00:00\0')])
+    cmt2 = tiff(b'II', [(0x829a, TiffIfd.TIFF_TYPE_URATIONAL, 1, pack('<LL', 1, 250)),
+                        (0x829d, TiffIfd.TIFF_TYPE_URATIONAL, 1, pack('<LL', 56, 10)),
+                        (TiffIfd.TIFF_EXIF_ISO, TiffIfd.TIFF_TYPE_USHORT, 1, pack('<H', 100)),
+                        (0x9202, TiffIfd.TIFF_TYPE_RATIONAL, 1, pack('<ll', 50, 10)),
+                        (TiffIfd.TIFF_EXIF_LensModel, TiffIfd.TIFF_TYPE_STRING, 23, b'RF24-105mm F4 L IS USM\0')])
+    makernote = [(TiffIfd.TIFF_MAKERNOTE_CAMERASETTINGS, TiffIfd.TIFF_TYPE_USHORT, 49,
+                  pack('<49H', 98, *range(48))),
+                 (TiffIfd.TIFF_MAKERNOTE_MODELID, TiffIfd.TIFF_TYPE_ULONG, 1, pack('<L', MODEL_ID)),
+                 (TiffIfd.TIFF_MAKERNOTE_SENSORINFO, TiffIfd.TIFF_TYPE_USHORT, 17,
+                  pack('<17H', 34, 8352, 5586, 1, 1, 156, 50, 8351, 5585, *range(8)))]
+    if roll > 1:
+        makernote.append((TiffIfd.TIFF_MAKERNOTE_ROLLINFO, TiffIfd.TIFF_TYPE_ULONG, 3, pack('<3L', 12, 1, roll)))
+    cmt4 = tiff(b'II', [(0, TiffIfd.TIFF_TYPE_UCHAR, 4, bytes((2, 3, 0, 0)))])
+    return (box(b'CMT1', cmt1) + box(b'CMT2', cmt2) + box(b'CMT3', tiff(b'II', makernote))
+            + box(b'CMT4', cmt4))
+
+
+def ctmd_records(n):
+    '''CTMD records of picture (or frame) n: time stamp, focal, exposure and a makernote'''
+    makernote = tiff(b'II', [(TiffIfd.TIFF_MAKERNOTE_MODELID, TiffIfd.TIFF_TYPE_ULONG, 1, pack('<L', MODEL_ID)),
+                             (0x4, TiffIfd.TIFF_TYPE_USHORT, 4, pack('<4H', n, 0, 0, 0))])
+    return [record(Ctmd.CTMD_TYPE_TIMESTAMP, pack('<HHBBBBBB', 0, 2020, 8, 1, 12, n // 60 % 60, n % 60, 0)),
+            record(Ctmd.CTMD_TYPE_FOCAL, pack('<HH', 50, 1)),
+            record(Ctmd.CTMD_TYPE_EXPOSURE, pack('<HHHHL', 56, 10, 1, 250, 100)),
+            record(7, pack('<LL', 8 + len(makernote), TiffIfd.TIFF_MAKERNOTE) + makernote)]
+
+
+def stbl(stsd, offsets, sizes):
+    return box(b'stbl', stsd + box(b'stsz', pack('>LLL', 0, 0, len(sizes)) + b''.join(pack('>L', s) for s in sizes))
+               + box(b'co64', pack('>LL', 0, len(offsets)) + b''.join(pack('>Q', o) for o in offsets)))
+
+
+def trak(stbl):
+    return box(b'trak', box(b'mdia', box(b'minf', stbl)))
+
+
+def make_file(filename, size=32 << 20, roll=1, tiles=(1, 1), levels=0, width=8352, height=5586, crm=False,
+              dual_pixel=False):
+    '''writes a sparse CR3 (or CRM clip with crm) of about size bytes, with roll pictures (or frames). CRX pictures
+    have tiles (columns, rows) tiles and levels wavelet levels. CR3 has trak1 (JPEG), trak2 (small CRX picture),
+    trak3 (CRX picture), trak4 (CTMD) and trak5 (CRX picture, with dual_pixel). A CRM clip has trak1 (CRX frames)
+    and trak2 (CTMD). Returns (offset, size) of the samples of each trak, as a list per trak'''
+    per_picture = max(size // roll, 0x1000)
+    ctmd = [b''.join(ctmd_records(n)) for n in range(roll)]
+    jpeg_size = 0 if crm else per_picture // 8
+    small_size = 0 if crm else per_picture // 16
+    main_size = (per_picture - jpeg_size - small_size) // (2 if dual_pixel and not crm else 1)
+    pictures = [(width, height, tiles, main_size)]
+    if not crm:
+        pictures = [(width, height, None, jpeg_size), (width // 8 * 2, height // 8 * 2, (1, 1), small_size)] + pictures
+    # (stsd, sample header, sample size) per trak
+    traks = []
+    for w, h, tl, sample_size in pictures:
+        if tl is None:
+            traks.append((jpeg_trak(w, h), b'\xff\xd8', sample_size))
+            continue
+        subbands = tl[0] * tl[1] * 4 * (3 * levels + 1)
+        header, data_size = crx_header(tl[0] * tl[1], max(sample_size // subbands, 1), levels)
+        traks.append((crx_trak(w, h, tl, levels, header), header, len(header) + data_size))
+    index_types = (Ctmd.CTMD_TYPE_TIMESTAMP, Ctmd.CTMD_TYPE_FOCAL, Ctmd.CTMD_TYPE_EXPOSURE, 7)
+    ctmd_index = pack('>LLL', 0, 0, len(index_types)) + b''.join(
+        pack('>HHL', 0, t, len(r)) for t, r in zip(index_types, ctmd_records(0)))
+    traks.append((box(b'stsd', bytes(8) + box(b'CTMD', ctmd_index)), None, None))
+    if dual_pixel and not crm:
+        traks.append(traks[2])
+
+    # mdat content: samples of picture 0 for each trak, then picture 1...
+    samples = [[] for _ in traks]
+    offset = 0
+    for n in range(roll):
+        for t, (_, header, sample_size) in enumerate(traks):
+            sample_size = len(ctmd[n]) if header is None else sample_size
+            samples[t].append((offset, sample_size))
+            offset += sample_size
+    mdat_size = offset
+
+    thumbnail = b'\xff\xd8' + bytes(1000) + b'\xff\xd9'
+    thmb = box(b'THMB', pack('>LHHLHH', 0, 160, 120, len(thumbnail), 0, 0) + thumbnail)
+    preview = b'\xff\xd8' + bytes(2000) + b'\xff\xd9'
+    prvw = box(b'uuid', BoxReader.UUID_PRVW + bytes(8) + box(b'PRVW', pack('>LHHHHL', 0, 0, 1620, 1080, 0,
+                                                                            len(preview)) + preview))
+    xmp = box(b'uuid', BoxReader.UUID_XPACKET + b'<x:xmpmeta xmlns:x="adobe:ns:meta/"></x:xmpmeta>')
+    areas = [(1, xmp), (2, prvw)]
+    if roll > 1 and not crm:
+        areas.append((5, box(b'uuid', BoxReader.UUID_CMTA + cmt_boxes(roll))))
+
+    def head(start):
+        '''ftyp and moov, start is their size (areas follow them, then mdat)'''
+        lines = []
+        o = start
+        for index, area in areas:
+            lines.append(pack('>LQQ', index, o, len(area)))
+            o += len(area)
+        lines.append(pack('>LQQ', 3, o, 16 + mdat_size))
+        mdat_start = o + 16
+        cncv = b'CanonCRM0001/02.09.00/00.00.00' if crm else b'CanonCR3_001/00.09.00/00.00.00'
+        canon = box(b'uuid', BoxReader.UUID_CANON + box(b'CNCV', cncv)
+                    + box(b'CTBO', pack('>L', len(lines)) + b''.join(lines)) + cmt_boxes(1 if crm else roll) + thmb)
+        moov = canon + b''.join(trak(stbl(stsd, [mdat_start + o for o, _ in s], [size for _, size in s]))
+                                for (stsd, _, _), s in zip(traks, samples))
+        return box(b'ftyp', b'crx ' + pack('>L', 1) + b'crx isom') + box(b'moov', moov)
+
+    start = len(head(0))
+    with open(filename, 'wb') as f:
+        f.write(head(start) + b''.join(area for _, area in areas))
+        mdat_start = f.tell() + 16
+        f.write(pack('>L4sQ', 1, b'mdat', 16 + mdat_size))
+        for n in range(roll):
+            for t, (_, header, _) in enumerate(traks):
+                f.seek(mdat_start + samples[t][n][0])
+                f.write(ctmd[n] if header is None else header)
+        f.truncate(mdat_start + mdat_size)
+    return [[(mdat_start + o, s) for o, s in trak_samples] for trak_samples in samples]
@@ -0,0 +1,82 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import tempfile
+from struct import pack
+from unittest import TestCase
+
+from CRaw3.Box import BoxReader, PreadReader
+
+
+def box(name, payload):
+    return pack('>L4s', 8 + len(payload), name) + payload
+
+
+class TestBoxReader(TestCase):
+
+    def setUp(self):
+        cncv = box(b'CNCV', b'CanonCR3_001/00.09.00/00.00.00')
+        stbl = box(b'stbl', box(b'stsz', bytes(12)))
+        moov = box(b'moov', box(b'uuid', BoxReader.UUID_CANON + cncv) + box(b'trak', box(b'mdia', box(b'minf', stbl))))
+        self.data = box(b'ftyp', b'crx \x00\x00\x00\x01') + moov
+        # largesize mdat
+        self.data += pack('>L4sQ', 1, b'mdat', 16 + 4) + b'\xde\xad\xbe\xef'
+
+    def test_walk(self):
+        reader = BoxReader(self.data)
+        tree = [(depth, b.name) for depth, b in reader.walk()]
+        self.assertEqual([(0, b'ftyp'), (0, b'moov'), (1, b'uuid'), (2, b'CNCV'), (1, b'trak'), (2, b'mdia'),
+                          (3, b'minf'), (4, b'stbl'), (5, b'stsz'), (0, b'mdat')], tree)
+
+    def test_largesize_and_payload(self):
+        reader = BoxReader(self.data)
+        mdat = reader.find(b'mdat')
+        self.assertEqual(16, mdat.hsize)
+        self.assertEqual(len(self.data), mdat.offset + mdat.size)
+        payload = reader.payload(mdat)
+        self.assertIsInstance(payload, memoryview)
+        self.assertEqual(b'\xde\xad\xbe\xef', payload.tobytes())
+
+    def test_find(self):
+        reader = BoxReader(self.data)
+        self.assertEqual(b'CanonCR3_001/00.09.00/00.00.00', reader.payload(reader.find(b'moov/uuid/CNCV')).tobytes())
+        self.assertEqual(b'stsz', reader.find(b'moov/trak/mdia/minf/stbl/stsz').name)
+        self.assertIsNone(reader.find(b'moov/trak/CMP1'))
+
+    def test_open_mmap(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'test.cr3')
+            with open(filename, 'wb') as f:
+                f.write(self.data)
+            with BoxReader.open(filename) as reader:
+                self.assertEqual(len(self.data), reader.filesize)
+                self.assertEqual(10, len(list(reader.walk())))
+
+    def test_pread_loaded_ranges(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'test.cr3')
+            with open(filename, 'wb') as f:
+                f.write(self.data)
+            with PreadReader.open(filename) as reader:
+                moov = reader.find(b'moov')
+                reader.load(0, moov.offset + moov.size)  # ftyp and moov
+                reads = reader.reads
+                self.assertEqual(b'stsz', reader.find(b'moov/trak/mdia/minf/stbl/stsz').name)
+                self.assertEqual(reads, reader.reads)  # served from the loaded range
+                self.assertEqual(b'\xde\xad\xbe\xef', bytes(reader.payload(reader.find(b'mdat'))))
@@ -0,0 +1,76 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import tempfile
+from array import array
+from unittest import TestCase
+
+from CRaw3.Box import BoxReader
+from CRaw3.BoxTree import BoxNode, parse_path
+from CRaw3.Cr3 import Cr3
+from tests.synthetic import make_file
+
+
+class TestBoxTree(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, 'roll.cr3')
+        self.samples = make_file(self.filename, 1 << 20, roll=3, dual_pixel=True)
+        self.reader = BoxReader.open(self.filename)
+        self.cr3file = Cr3(self.reader)
+        self.cr3file.parse()
+        self.tree = self.cr3file.tree
+
+    def tearDown(self):
+        self.reader.close()
+        self.tmp.cleanup()
+
+    def test_parse_path(self):
+        self.assertEqual([(b'moov', None), (b'trak', 2), '...', (None, None)], parse_path('moov/trak[2]/.../*'))
+        self.assertRaises(ValueError, parse_path, 'moov/trak[x]')
+
+    def test_paths(self):
+        cr3 = self.cr3file.cr3
+        self.assertIs(cr3['trak3'][b'CMP1'], self.tree.get('moov/trak[3]/mdia/minf/stbl/stsd/CRAW/CMP1'))
+        self.assertIs(cr3['trak5'][b'CMP1'], self.tree.get(b'moov/trak[5]/.../CMP1'))
+        self.assertEqual(5, len(self.tree.findall('.../stsz')))
+        self.assertEqual([b'CNCV', b'CTBO', b'CMT1', b'CMT2', b'CMT3', b'CMT4', b'THMB'],
+                         [n.name for n in self.tree.findall('moov/uuid/*')])
+        self.assertIs(cr3[b'CTMD'], self.tree.get('moov/.../CTMD'))
+        self.assertIsNone(self.tree.find('moov/trak[6]'))
+        self.assertIsNone(self.tree.find('moov/trak[0]'))
+        self.assertEqual('missing', self.tree.get('mdat/stsz', 'missing'))
+
+    def test_values(self):
+        stsz = self.tree.get('moov/trak[3]/.../stsz')
+        co64 = self.tree.get('moov/trak[3]/.../co64')
+        self.assertIsInstance(stsz, array)
+        self.assertEqual('Q', co64.typecode)
+        self.assertEqual(self.samples[2], list(zip(co64, stsz)))
+        node = self.tree.find('moov/trak[1]')
+        self.assertEqual((b'trak', None), (node.name, node.value))
+        self.assertEqual([b'mdia'], [n.name for n in node])
+        self.assertFalse(hasattr(node, '__dict__'))
+
+    def test_box_list(self):
+        names = [name for depth, name, _, _ in self.cr3file.box_list if depth == 0]
+        self.assertEqual([b'ftyp', b'moov', b'uuid', b'uuid', b'uuid', b'mdat'], names)
+        self.assertEqual(len(self.cr3file.box_list), sum(1 for _ in self.tree.walk()))
+        self.assertEqual([], list(BoxNode(b'free', 0, 8)))
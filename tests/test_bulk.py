@@ -0,0 +1,121 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import asyncio
+import tempfile
+from struct import pack
+from unittest import TestCase
+
+from CRaw3.Box import BoxReader, PreadReader
+from CRaw3.Cr3 import Cr3
+from canon_cr3.bulk import BulkReader, merge_ranges, scan_records
+from canon_cr3.scan import scan_file
+from tests.test_box import box
+from tests.test_index import cmt_boxes
+from tests.synthetic import make_file
+
+
+def cr3_file(filename, moov_padding=0, area_gap=0, ctbo=True):
+    '''CR3 with CTBO listing a PRVW area and a CMTA area (CMT1 to CMT3), after moov. Without ctbo, these areas are
+    only found by walking the top level boxes'''
+    prvw = box(b'uuid', BoxReader.UUID_PRVW + bytes(8) + box(b'PRVW', pack('>LHHHHL', 0, 0, 1620, 1080, 0, 4) + b'JPEG'))
+    cmta = box(b'uuid', BoxReader.UUID_CMTA + cmt_boxes(0x80000424, b'RF24-105mm F4 L IS USM', 100))
+    free = box(b'free', bytes(area_gap)) if area_gap else b''
+
+    def head(moov_end):
+        ctbo_box = box(b'CTBO', pack('>L', 2) + pack('>LQQ', 2, moov_end, len(prvw))
+                   + pack('>LQQ', 5, moov_end + len(prvw) + len(free), len(cmta)))
+        cncv = box(b'CNCV', b'CanonCR3_001/00.09.00/00.00.00')
+        padding = box(b'free', bytes(moov_padding)) if moov_padding else b''
+        return box(b'ftyp', b'crx \x00\x00\x00\x01') + box(b'moov', box(b'uuid', BoxReader.UUID_CANON + cncv
+                                                                     + (ctbo_box if ctbo else b'')) + padding)
+
+    with open(filename, 'wb') as f:
+        f.write(head(len(head(0))) + prvw + free + cmta + box(b'mdat', b'picture' + bytes(0x100)))
+
+
+class TestBulkReader(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.small = os.path.join(self.tmp.name, 'small.cr3')
+        cr3_file(self.small)
+        self.big = os.path.join(self.tmp.name, 'big.cr3')
+        cr3_file(self.big, Cr3.HEADER_READ_SIZE, 1000)
+        self.no_ctbo = os.path.join(self.tmp.name, 'no_ctbo.cr3')
+        cr3_file(self.no_ctbo, Cr3.HEADER_READ_SIZE, 1000, ctbo=False)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read(self, path, **options):
+        reader = BulkReader(4, **options)
+        records = list(scan_records([path], reader=reader))
+        reader.close()
+        return reader, records[0]
+
+    def test_merge_ranges(self):
+        self.assertEqual([(0, 30), (100, 10)], merge_ranges([(100, 10), (10, 20), (0, 15)]))
+        self.assertEqual([(0, 110)], merge_ranges([(100, 10), (10, 20), (0, 15)], 70))
+
+    def test_same_as_parse_headers(self):
+        for path in (self.small, self.big, self.no_ctbo):
+            with PreadReader.open(path) as reader:
+                expected = Cr3(reader)
+                expected.parse_headers()
+            reader = BulkReader(4)
+            cr3file = asyncio.run(reader.read(path))
+            reader.close()
+            self.assertEqual(sorted(expected.cr3, key=str), sorted(cr3file.cr3, key=str))
+            self.assertEqual(expected.cr3[b'PRVW'], cr3file.cr3[b'PRVW'])
+            self.assertEqual(0x80000424, cr3file.get_model_id())
+            self.assertEqual(scan_file(path), self.read(path)[1])
+
+    def test_not_prefetched(self):
+        reader = BulkReader(4)
+        cr3file = asyncio.run(reader.read(self.no_ctbo))
+        reader.close()
+        self.assertNotIn(b'CTBO', cr3file.cr3)
+        self.assertEqual(0x80000424, cr3file.get_model_id())
+        with self.assertRaisesRegex(ValueError, 'range not prefetched'):
+            cr3file.reader.read(cr3file.reader.filesize - 0x10, 0x10)  # mdat content
+
+    def test_crm(self):
+        clip = os.path.join(self.tmp.name, 'clip.crm')
+        make_file(clip, 1 << 20, roll=4, crm=True)
+        record = self.read(clip)[1]
+        self.assertEqual(scan_file(clip), record)
+        self.assertEqual('2020-08-01T12:00:00', record['timestamp'])
+        self.assertEqual(0.004, record['exposure_time'])
+
+    def test_reads(self):
+        self.assertEqual(1, self.read(self.small)[0].reads)
+        # head, end of moov, then PRVW and CMTA areas in one read
+        self.assertEqual(3, self.read(self.big)[0].reads)
+        self.assertEqual(4, self.read(self.big, gap=0)[0].reads)
+
+    def test_order(self):
+        other = os.path.join(self.tmp.name, 'other.cr3')
+        with open(other, 'wb') as f:
+            f.write(b'not a raw file')
+        paths = [self.big, other, self.small] * 5
+        records = list(scan_records(paths, 2))
+        self.assertEqual(paths, [r['path'] for r in records])
+        self.assertEqual('unknown format', records[1]['error'])
+        self.assertEqual(sorted(paths), sorted(r['path'] for r in scan_records(paths, 2, ordered=False)))
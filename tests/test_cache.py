@@ -0,0 +1,108 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import tempfile
+from unittest import TestCase, skipIf
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from CRaw3.Ctmd import Ctmd
+from canon_cr3.cache import ParseCache, sizeof
+from tests.test_server import cr3_file, PRVW
+from tests.synthetic import make_file
+
+if np is not None:
+    from tests.test_transcode import crm_file
+
+
+class TestParseCache(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.files = []
+        for name in ('a', 'b', 'c'):
+            self.files.append(os.path.join(self.tmp.name, name + '.cr3'))
+            cr3_file(self.files[-1])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_headers(self):
+        cache = ParseCache()
+        cr3file = cache.headers(self.files[0])
+        self.assertIs(cr3file, cache.headers(self.files[0]))
+        self.assertIn('trak1', cr3file.cr3)
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertEqual(PRVW, cache.preview(self.files[0]))
+        self.assertEqual(len(PRVW), cache.preview(self.files[0], len))
+        self.assertEqual(sum(entry[2] for entry in cache.entries.values()), cache.size)
+
+    def test_invalidation(self):
+        cache = ParseCache()
+        cr3file = cache.headers(self.files[0])
+        cr3_file(self.files[0], b'\xff\xd8another thumbnail\xff\xd9')
+        self.assertIsNot(cr3file, cache.headers(self.files[0]))
+        self.assertEqual((0, 2, 1), (cache.hits, cache.misses, cache.invalidations))
+        cache.invalidate(self.files[0])
+        self.assertEqual((0, 0, 2), (len(cache), cache.size, cache.invalidations))
+
+    def test_headers_unchanged(self):
+        filename = os.path.join(self.tmp.name, 'roll.cr3')
+        make_file(filename, 1 << 20, roll=3)
+        cache = ParseCache()
+        cr3file = cache.headers(filename)
+        self.assertEqual(2, cache.ctmd(filename, 2)[Ctmd.CTMD_TYPE_TIMESTAMP].content.s)
+        # the copy used to read CTMD got the frame indexes and sample offsets, not the cached headers
+        self.assertEqual({}, cr3file.frame_indexes)
+        self.assertFalse(hasattr(cr3file.cr3[b'CTMD'], 'offsets'))
+
+    def test_budget(self):
+        cache = ParseCache(sizeof(bytes(4000)) * 2 + 100)
+        compute = lambda path, size: bytes(size)
+        cache.get(self.files[0], 'data', compute, 4000)
+        cache.get(self.files[1], 'data', compute, 4000)
+        cache.get(self.files[0], 'data', compute, 4000)  # b is now the least recently used
+        cache.get(self.files[2], 'data', compute, 4000)
+        self.assertEqual([self.files[0], self.files[2]], [key[0] for key in cache.entries])
+        self.assertEqual(1, cache.evictions)
+        self.assertLessEqual(cache.size, cache.budget)
+        cache.get(self.files[1], 'data', compute, 10000)  # bigger than budget: not kept
+        self.assertEqual(2, len(cache))
+        self.assertEqual({'entries': 2, 'bytes': cache.size, 'budget': cache.budget, 'hits': 1, 'misses': 4,
+                          'evictions': 1, 'invalidations': 0}, cache.stats())
+
+    def test_sizeof(self):
+        self.assertGreater(sizeof({'a': bytes(1000)}), 1000)
+        self.assertGreater(sizeof([memoryview(bytes(1000))]), 1000)
+        shared = bytes(1000)
+        self.assertLess(sizeof([shared, shared]), 2000)
+
+    @skipIf(np is None, 'numpy is not installed')
+    def test_crx(self):
+        filename = os.path.join(self.tmp.name, 'clip.crm')
+        crm_file(filename, [np.full((8, 16), 2048, np.uint16)] * 3)
+        cache = ParseCache()
+        crx = cache.crx(filename, 'trak1', 2)
+        self.assertEqual(1, len(crx.tiles))
+        self.assertIs(crx, cache.crx(filename, 'trak1', 2))
+        self.assertIsNot(crx, cache.crx(filename, 'trak1', 1))
+        self.assertGreater(sizeof(np.zeros(1000)), 8000)
@@ -0,0 +1,92 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import sys
+import tempfile
+from array import array
+from struct import pack, unpack_from
+from unittest import TestCase, skipIf
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from CRaw3.Cr2 import Cr2
+from CRaw3.TiffIfd import TiffIfd
+from tests.test_tiffifd import tiff
+
+
+def cr2_ifd2(width, height, values):
+    '''Cr2 with IFD2 only: RGB 16 bits values stored after the IFD'''
+    pixels = array('H', values)
+    if sys.byteorder != 'little':
+        pixels.byteswap()
+    long_entry = lambda tag, value: (tag, TiffIfd.TIFF_TYPE_ULONG, 1, pack('<L', value))
+    entries = [long_entry(TiffIfd.TIFF_EXIF_ImageWidth, width), long_entry(TiffIfd.TIFF_EXIF_ImageHeight, height),
+               long_entry(TiffIfd.TIFF_EXIF_PreviewImageStart, 0),
+               long_entry(TiffIfd.TIFF_EXIF_PreviewImageLength, 6 * width * height)]
+    start = len(tiff(b'II', entries))
+    entries[2] = long_entry(TiffIfd.TIFF_EXIF_PreviewImageStart, start)
+    data = tiff(b'II', entries) + pixels.tobytes()
+    cr2 = Cr2.__new__(Cr2)
+    cr2.data = data
+    cr2.ifd_list = {2: TiffIfd(data, len(data), 0, '2', False)}
+    return cr2
+
+
+class TestCr2(TestCase):
+
+    def setUp(self):
+        self.values = [(i * 37) % 16384 for i in range(3 * 5 * 4)]
+        self.cr2 = cr2_ifd2(5, 4, self.values)
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_ppm(self):
+        filename = os.path.join(self.directory.name, 'ifd2.ppm')
+        self.assertEqual((5, 4), self.cr2.extract_pic2(filename))
+        with open(filename, 'rb') as f:
+            data = f.read()
+        header = b'P6\n5 4\n16383\n'
+        self.assertEqual(header, data[:len(header)])
+        self.assertEqual(self.values, list(unpack_from('>60H', data, len(header))))
+
+    def test_tiff(self):
+        filename = os.path.join(self.directory.name, 'ifd2.tif')
+        self.cr2.extract_pic2(filename)
+        with open(filename, 'rb') as f:
+            data = f.read()
+        ifd = TiffIfd(data, len(data), 0, 'ifd2', False)
+        self.assertEqual((16, 16, 16), ifd.get(0x102))
+        self.assertEqual((2,), ifd.get(0x106))
+        start = ifd.get(TiffIfd.TIFF_EXIF_StripOffsets)[0]
+        self.assertEqual(self.values, list(unpack_from('<60H', data, start)))
+
+    def test_truncated(self):
+        self.cr2.data = self.cr2.data[:-2]
+        self.assertIsNone(self.cr2.extract_pic2())
+
+    @skipIf(np is None, 'numpy is not installed')
+    def test_pixels(self):
+        width, height, pixels = self.cr2.extract_pic2(pixels=True)
+        self.assertEqual((4, 5, 3), pixels.shape)
+        self.assertEqual(self.values, pixels.ravel().tolist())
@@ -0,0 +1,214 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+from unittest import TestCase, skipIf
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from CRaw3.Cr3 import Cr3
+from CRaw3.Crx import Crx
+
+if np is not None:
+    from CRaw3.CrxDecoder import CrxDecoder
+    from tests.crx_encoder import encode_plane, crx_sample, tile_bands, encode_bands, fdwt53
+
+
+class SampleReader(object):
+    """reads ranges of a sample at file offsets, like Box.PreadReader"""
+
+    def __init__(self, crx):
+        self.crx = crx
+        self.reads = []
+
+    def read(self, offset, size):
+        self.reads.append(offset)
+        return self.crx.data[offset - self.crx.base:offset - self.crx.base + size]
+
+
+def bayer_sample(bayer, tile_width, tile_height, cfa=0, bits=14, levels=0, quant=4, version=1, qp_data=b''):
+    '''encodes a Bayer array as a CRX sample, lossless or with levels of wavelets, returns Crx'''
+    median = 1 << (bits - 1)
+    ih, iw = bayer.shape
+    pw, ph, ptw, pth = iw // 2, ih // 2, tile_width // 2, tile_height // 2
+    tile_rows, tile_cols = (ph + pth - 1) // pth, (pw + ptw - 1) // ptw
+    tiles = []
+    for tindex in range(tile_rows * tile_cols):
+        row, col = tindex // tile_cols * pth, tindex % tile_cols * ptw
+        area = (row, col, min(pth, ph - row), min(ptw, pw - col))
+        planes = []
+        for dy, dx in CrxDecoder.CFA_OFFSETS[cfa]:
+            plane = bayer[dy::2, dx::2].astype(int) - median
+            if levels:
+                planes.append(encode_bands(tile_bands(plane, area, tile_rows, tile_cols, tindex, levels), quant))
+            else:
+                planes.append(encode_plane(plane[row:row + area[2], col:col + area[3]]))
+        tiles.append(planes)
+    header, body = crx_sample(tiles, quant, version, qp_data)
+    cmp1 = Cr3.NT_CMP1(iw, ih, tile_width, tile_height, bits, 4, cfa, 0, levels, 0, len(header))
+    crx = Crx(0x1000, header + body, cmp1, version)
+    crx.parse_tile()
+    return crx
+
+
+@skipIf(np is None, 'numpy is not installed')
+class TestCrxDecoder(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(2019)
+        self.bayer = (2048 + np.add.outer(np.arange(60) * 7, np.arange(88) * 3) % 3000
+                      + rng.integers(0, 40, (60, 88))).astype(np.uint16)
+        self.bayer[:12, :30] = 8192  # flat area: run length mode
+        self.bayer[20, 10:14] = [0, 16383, 0, 16383]  # escape codes
+
+    def test_plane_round_trip(self):
+        plane = self.bayer[::2, ::2].astype(int) - 8192
+        values = CrxDecoder.decode_lossless(encode_plane(plane), plane.shape[1], plane.shape[0])
+        self.assertEqual(np.int32, values.dtype)
+        self.assertTrue((values == plane).all())
+
+    def test_lossless_known_answer(self):
+        # streams written by hand from the Golomb-Rice codes, independently of crx_encoder
+        values = CrxDecoder.decode_lossless(bytes.fromhex('017d0440'), 3, 2)
+        self.assertEqual([[3, -1, 0], [3, 5, 7]], values.tolist())
+        # top line run mode: the run of 2 zeros is followed by 4
+        values = CrxDecoder.decode_lossless(bytes.fromhex('c0169800'), 3, 2)
+        self.assertEqual([[0, 0, 4], [1, 1, 2]], values.tolist())
+        # second line run stopping before the last value: its k update does not use the next gradient (k 1 -> 0)
+        values = CrxDecoder.decode_lossless(bytes.fromhex('c1d0e000'), 3, 3)
+        self.assertEqual([[0, 0, 2], [0, 0, 2], [1, 1, 2]], values.tolist())
+
+    def test_noref_known_answer(self):
+        # top line: run of 2 zeros then -3, k grows from 0 to 1 (not limited on the top line)
+        values = CrxDecoder.decode_noref(bytes.fromhex('c13a0000'), 3, 2)
+        self.assertEqual([[0, 0, -3], [2, 0, 0]], values.tolist())
+
+    def test_tiles(self):
+        crx = bayer_sample(self.bayer, 48, 40)
+        self.assertEqual(4, len(crx.tiles))
+        decoder = CrxDecoder(crx)
+        self.assertEqual((20, 24, 10, 20), decoder.tile_area(3))
+        self.assertTrue((decoder.decode() == self.bayer).all())
+
+    def test_jobs(self):
+        crx = bayer_sample(self.bayer, 48, 40, levels=3)
+        decoder = CrxDecoder(crx)
+        self.assertEqual(16, len(decoder.units()))
+        self.assertTrue((decoder.decode(jobs=3) == self.bayer).all())
+
+    def test_cfa_layouts(self):
+        for cfa in CrxDecoder.CFA_OFFSETS:
+            crx = bayer_sample(self.bayer, 88, 60, cfa)
+            self.assertTrue((CrxDecoder(crx).decode() == self.bayer).all(), 'cfa=%d' % cfa)
+
+    def test_truncated_plane(self):
+        plane = self.bayer[::2, ::2].astype(int) - 8192
+        with self.assertRaises((ValueError, IndexError)):
+            CrxDecoder.decode_lossless(encode_plane(plane)[:64], plane.shape[1], plane.shape[0])
+
+    def test_idwt53(self):
+        x = np.arange(-40, 40).reshape(2, 40) ** 2 % 97
+        for length in (1, 2, 7, 40):
+            low, high = fdwt53(x[:, :length])
+            self.assertTrue((CrxDecoder.idwt53(low, high, length) == x[:, :length]).all(), 'length=%d' % length)
+
+    def test_idwt53_known_answer(self):
+        # even = low - (h[i-1] + h[i] + 2) >> 2, odd = h[i] + (even[i] + even[i+1]) >> 1, computed by hand
+        self.assertEqual([8, 17, 20, 18], CrxDecoder.idwt53(np.array([10, 20]), np.array([3, -2]), 4).tolist())
+        self.assertEqual([8, 17, 20, 23, 31],
+                         CrxDecoder.idwt53(np.array([10, 20, 30]), np.array([3, -2]), 5).tolist())
+        # coefficients of neighbour tiles instead of mirrored ones
+        self.assertEqual([8, 17, 20, 22], CrxDecoder.idwt53(np.array([10, 20, 30]), np.array([5, 3, -2, 7]), 4,
+                                                            True, True).tolist())
+
+    def test_dequantized_tile(self):
+        # 2x2 tile of one level: LL 10, HL 1, LH 0, HH -1, quantValue 16 is a step of 4
+        q = CrxDecoder.qscale(16)
+        self.assertEqual(4, q)
+        l = CrxDecoder.idwt53(np.array([[10]]), np.array([[1]]) * q, 2)
+        h = CrxDecoder.idwt53(np.array([[0]]), np.array([[-1]]) * q, 2)
+        self.assertEqual([[8, 12]], l.tolist())
+        self.assertEqual([[2, -2]], h.tolist())
+        self.assertEqual([[7, 13], [9, 11]], CrxDecoder.idwt53(l.T, h.T, 2).T.tolist())
+
+    def test_band_extents(self):
+        self.assertEqual([(75, 38, 37), (38, 19, 19), (19, 10, 9)], CrxDecoder.band_extents(75, False, False, 3))
+        self.assertEqual([(75, 39, 39), (39, 21, 21), (21, 11, 12)], CrxDecoder.band_extents(75, True, True, 3))
+
+    def test_lossy_tiles(self):
+        # quantValue 4 is a step of 1: 5/3 wavelets are reversible
+        crx = bayer_sample(self.bayer, 48, 40, levels=3)
+        self.assertEqual(10, len(crx.subbands[0][0]))
+        self.assertTrue((CrxDecoder(crx).decode() == self.bayer).all())
+
+    def test_lossy_quantized(self):
+        quant = [4, 4, 4, 4, 16, 16, 22, 26, 26, 32]
+        self.assertEqual([1, 4, 8, 12, 25], [CrxDecoder.qscale(q) for q in (4, 16, 22, 26, 32)])
+        bayer = self.bayer.copy()
+        bayer[20, 10:14] = 8192
+        decoded = CrxDecoder(bayer_sample(bayer, 88, 60, levels=3, quant=quant)).decode()
+        error = np.abs(decoded.astype(int) - bayer)
+        self.assertTrue(0 < error.max() < 128)
+
+    def test_reduction(self):
+        crx = bayer_sample(self.bayer, 48, 40, levels=3)
+        decoder = CrxDecoder(crx)
+        self.assertEqual((10, 12), decoder.decode(reduction=3).shape)  # tiles of 3+2 rows, 3+3 columns
+        self.assertEqual((16, 22), decoder.decode(reduction=2).shape)
+        self.assertEqual((30, 44), decoder.decode(reduction=1).shape)
+        # on a smooth picture, low band of first level is close to even values of planes
+        smooth = (2048 + np.add.outer(np.arange(60) * 5, np.arange(88) * 3)).astype(np.uint16)
+        half = CrxDecoder(bayer_sample(smooth, 48, 40, levels=3)).decode(reduction=1).astype(int)
+        even = smooth.reshape(15, 2, 2, 22, 2, 2)[:, 0, :, :, 0, :].reshape(30, 44)
+        self.assertLess(np.abs(half - even).max(), 8)
+        lossless = CrxDecoder(bayer_sample(self.bayer, 48, 40))
+        self.assertIsNone(lossless.decode(reduction=1))
+
+    def test_reduction_reads(self):
+        crx = bayer_sample(self.bayer, 48, 40, levels=3)
+        headers = Crx(crx.base, crx.data[:crx.cmp1.hsize], crx.cmp1)
+        headers.parse_tile()
+        reader = SampleReader(crx)
+        reduced = CrxDecoder(headers, reader).decode(reduction=2)
+        self.assertTrue((reduced == CrxDecoder(crx).decode(reduction=2)).all())
+        # LL3, HL3, LH3 and HH3 only
+        offsets = [crx.subbands[t][p][s].offset for t in crx.subbands for p in crx.subbands[t] for s in range(4)]
+        self.assertEqual(sorted(offsets), sorted(reader.reads))
+
+    def test_version2(self):
+        crx = bayer_sample(self.bayer, 48, 40, version=2, qp_data=b'\x55' * 6)
+        self.assertEqual(4, len(crx.tiles))
+        tile = crx.tiles[1]
+        self.assertEqual((6, 0), (tile.qpSize, tile.extraSize))
+        self.assertEqual(tile.offset + 6, crx.planes[1][0].offset)
+        self.assertEqual(crx.planes[1][0].offset, crx.subbands[1][0][0].offset)
+        self.assertTrue((CrxDecoder(crx).decode() == self.bayer).all())
+        lossy = bayer_sample(self.bayer, 88, 60, levels=3, version=2)
+        self.assertEqual(10, len(lossy.subbands[0][3]))
+        self.assertEqual((0x100, 1), (lossy.subbands[0][3][9].qStepBase, lossy.subbands[0][3][9].qStepMult))
+        # v1 parser does not read v2 headers
+        v1 = Crx(lossy.base, lossy.data, lossy.cmp1)
+        v1.parse_tile()
+        self.assertEqual({}, v1.tiles)
+        # header only data ending inside the 20 bytes of a v2 tile header
+        short = Crx(lossy.base, lossy.data[:16], lossy.cmp1, 2)
+        with self.assertLogs('CRaw3.Crx', 'WARNING'):
+            self.assertIsNone(short.parse_tile())
+        self.assertEqual({}, short.tiles)
@@ -0,0 +1,87 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+from struct import pack
+from unittest import TestCase
+
+from CRaw3.Box import BoxReader
+from CRaw3.Ctmd import Ctmd
+from CRaw3.TiffIfd import TiffIfd
+from tests.test_tiffifd import tiff
+
+
+def record(type, payload):
+    return pack('<LHBBHH', 12 + len(payload), type, 0, 0, 0, 0) + payload
+
+
+def roll(count):
+    '''CTMD index, and file data with count pictures of timestamp, exposure and makernote records'''
+    pictures = []
+    for n in range(count):
+        makernote = tiff(b'II', [(TiffIfd.TIFF_MAKERNOTE_MODELID, TiffIfd.TIFF_TYPE_ULONG, 1, pack('<L', n))])
+        pictures.append([record(Ctmd.CTMD_TYPE_TIMESTAMP, pack('<HHBBBBBB', 0, 2019, 5, 1, 12, 0, n % 60, 0)),
+                         record(Ctmd.CTMD_TYPE_EXPOSURE, pack('<HHHHL', 56, 10, 1, 250, 100 * (n + 1))),
+                         record(7, pack('<LL', 8 + len(makernote), TiffIfd.TIFF_MAKERNOTE) + makernote)])
+    types = [Ctmd.CTMD_TYPE_TIMESTAMP, Ctmd.CTMD_TYPE_EXPOSURE, 7]
+    index = pack('>LLL', 0, 0, len(types)) + b''.join(pack('>HHL', 0, t, len(r)) for t, r in zip(types, pictures[0]))
+    size = sum(len(r) for r in pictures[0])
+    data = b'\xff' * 16 + b''.join(r for p in pictures for r in p)
+    return index, data, [16 + n * size for n in range(count)], [size] * count
+
+
+class CountingReader(BoxReader):
+
+    def __init__(self, data):
+        BoxReader.__init__(self, data)
+        self.ranges = []
+
+    def read(self, offset, size):
+        self.ranges.append((offset, size))
+        return BoxReader.read(self, offset, size)
+
+
+class TestCtmd(TestCase):
+
+    def setUp(self):
+        index, data, self.offsets, self.sizes = roll(5)
+        self.reader = CountingReader(data)
+        self.ctmd = Ctmd(index, len(index), 0, b'CTMD')
+        self.ctmd.offsets, self.ctmd.sizes = self.offsets, self.sizes
+
+    def test_pictures(self):
+        pictures = self.ctmd.pictures(self.reader, 2)
+        pic_num, records = next(pictures)
+        self.assertEqual(2, pic_num)
+        self.assertEqual([(self.offsets[2], self.sizes[2])], self.reader.ranges)  # one read per picture
+        self.assertEqual(2, records[Ctmd.CTMD_TYPE_TIMESTAMP].content.s)
+        self.assertEqual(300, records[Ctmd.CTMD_TYPE_EXPOSURE].content.iso)
+        self.assertEqual([3, 4], [n for n, _ in pictures])
+
+    def test_get_tiff(self):
+        _, records = next(self.ctmd.pictures(self.reader, 3))
+        makernote = records[7]
+        self.assertIsNone(makernote.content[TiffIfd.TIFF_MAKERNOTE][3][1])  # not decoded yet
+        ifd = self.ctmd.get_tiff(self.reader, makernote, TiffIfd.TIFF_MAKERNOTE)
+        self.assertEqual((3,), ifd.get(TiffIfd.TIFF_MAKERNOTE_MODELID))
+        self.assertIsNone(self.ctmd.get_tiff(self.reader, makernote, 0x1234))
+
+    def test_parse(self):
+        ctmd_list = self.ctmd.parse(self.reader)
+        self.assertEqual(list(range(5)), list(ctmd_list))
+        ifd = ctmd_list[4][7].content[TiffIfd.TIFF_MAKERNOTE][3][1]
+        self.assertEqual((4,), ifd.get(TiffIfd.TIFF_MAKERNOTE_MODELID))
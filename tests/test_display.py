@@ -0,0 +1,68 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+import io
+import os
+import tempfile
+from contextlib import redirect_stdout
+from unittest import TestCase
+
+from CRaw3.Box import BoxReader
+from CRaw3.Cr3 import Cr3
+from CRaw3.Display import display_tree
+from CRaw3.TiffIfd import TiffIfd
+from tests.synthetic import make_file
+
+
+class TestDisplay(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, 'roll.cr3')
+        make_file(self.filename, 1 << 20, roll=3)
+        self.reader = BoxReader.open(self.filename)
+
+    def tearDown(self):
+        self.reader.close()
+        self.tmp.cleanup()
+
+    def test_parse_is_silent(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            Cr3(self.reader).parse()
+        self.assertEqual('', out.getvalue())
+
+    def test_display_tree(self):
+        cr3file = Cr3(self.reader)
+        cr3file.parse()
+        out = io.StringIO()
+        with redirect_stdout(out):
+            display_tree(cr3file, 1)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(cr3file.box_list), len([line for line in lines if line[5:6] == ':']))
+        self.assertTrue(lines[0].startswith("00000:ftyp: major_brand=b'crx '"))
+        self.assertIn('00018:moov: (0x', lines[1])
+        self.assertEqual(4, len([line for line in lines if 'stsz: version=0' in line]))
+        self.assertEqual(2, len([line for line in lines if 'CMT1: (0x' in line]))
+        self.assertTrue(any("b'mdat' b'ffd8" in line for line in lines))
+
+    def test_logged_problems(self):
+        with self.assertLogs('CRaw3.TiffIfd', 'ERROR') as logs:
+            tiff = TiffIfd(b'XX*\x00\x08\x00\x00\x00', 8, 0, b'CMT1', False)
+        self.assertEqual(['ERROR:CRaw3.TiffIfd:order not II or MM'], logs.output)
+        self.assertEqual(0, len(tiff.ifd))
@@ -0,0 +1,107 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import tempfile
+from struct import pack
+from unittest import TestCase
+
+from CRaw3.Box import BoxReader
+from CRaw3.Cr3 import Cr3
+from CRaw3.FrameIndex import FrameIndex
+from tests.test_box import box
+
+
+def full_box(name, payload):
+    return box(name, b'\0\0\0\0' + payload)
+
+
+class TestFrameIndex(TestCase):
+
+    def setUp(self):
+        # 7 samples in 3 chunks of 3, 3 and 1 samples, 2 durations
+        self.sizes = [10, 20, 30, 11, 21, 31, 5]
+        self.chunks = [0x100, 0x200, 0x300]
+        self.stsc = [(1, 3, 1), (3, 1, 1)]
+        self.stts = [(5, 1001), (2, 2002)]
+        self.offsets = [0x100, 0x10a, 0x11e, 0x200, 0x20b, 0x220, 0x300]
+        self.temp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for name in os.listdir(self.temp):
+            os.remove(os.path.join(self.temp, name))
+        os.rmdir(self.temp)
+
+    def trak(self):
+        return {b'stsz': self.sizes, b'co64': self.chunks, b'stsc': self.stsc, b'stts': self.stts, b'mdhd': 24000}
+
+    def test_from_trak(self):
+        index = FrameIndex.from_trak(self.trak())
+        self.assertEqual(7, len(index))
+        self.assertEqual(self.offsets, list(index.offsets))
+        self.assertEqual((0x20b, 21, 4004), index.frame(4))
+        self.assertEqual(7007 / 24000, index.seconds(6))
+        # CR3: one sample per chunk, no stts
+        index = FrameIndex.from_trak({b'stsz': [8, 9], b'co64': [0x40, 0x80]})
+        self.assertEqual((0x80, 9, 1), index.frame(1))
+        self.assertIsNone(index.seconds(1))
+
+    def test_save_load(self):
+        filename = os.path.join(self.temp, 'clip.idx')
+        FrameIndex.from_trak(self.trak()).save(filename)
+        index = FrameIndex.load(filename)
+        self.assertEqual(self.offsets, list(index.offsets))
+        self.assertEqual(self.sizes, list(index.sizes))
+        self.assertEqual((0x300, 5, 7007), index.frame(6))
+        self.assertEqual(24000, index.timescale)
+        with open(filename, 'r+b') as f:
+            f.truncate(40)
+        self.assertIsNone(FrameIndex.load(filename))
+
+    def test_cr3_samples(self):
+        stbl = (full_box(b'stts', pack('>L', 2) + b''.join(pack('>LL', *e) for e in self.stts))
+                + full_box(b'stsc', pack('>L', 2) + b''.join(pack('>LLL', *e) for e in self.stsc))
+                + full_box(b'stsz', pack('>LL', 0, 7) + b''.join(pack('>L', s) for s in self.sizes))
+                + full_box(b'co64', pack('>L', 3) + b''.join(pack('>Q', o) for o in self.chunks)))
+        mdhd = full_box(b'mdhd', pack('>LLLL', 0, 0, 24000, 7007) + bytes(4))
+        data = box(b'moov', box(b'trak', box(b'mdia', mdhd + box(b'minf', box(b'stbl', stbl)))))
+        data = data.ljust(0x300, b'\0') + bytes(range(5))
+        cr3file = Cr3(BoxReader(data))
+        cr3file.parse()
+        self.assertEqual(24000, cr3file.cr3['trak1'][b'mdhd'])
+        self.assertEqual(bytes(range(5)), bytes(cr3file.get_sample('trak1', 6)))
+        self.assertIsNone(cr3file.get_sample('trak1', 7))
+        self.assertIsNone(cr3file.get_timestamp(0))
+
+    def test_tables(self):
+        cr3file = Cr3(None)
+        stsz = memoryview(pack('>LLL', 0, 0, 7) + b''.join(pack('>L', s) for s in self.sizes))
+        self.assertEqual(self.sizes, list(cr3file.stsz(0, stsz, len(stsz) + 8, 0)))
+        self.assertEqual([16] * 3, list(cr3file.stsz(0, pack('>LLL', 0, 16, 3), 20, 0)))
+        co64 = pack('>LL', 0, 3) + b''.join(pack('>Q', o << 32) for o in self.chunks)
+        self.assertEqual([o << 32 for o in self.chunks], list(cr3file.co64(0, co64, len(co64) + 8, 0)))
+        # truncated tables: entries which are complete
+        self.assertEqual([o << 32 for o in self.chunks[:2]], list(cr3file.co64(0, co64[:-3], len(co64) + 5, 0)))
+        stsc = pack('>LL', 0, 2) + b''.join(pack('>LLL', *e) for e in self.stsc)
+        self.assertEqual(self.stsc, cr3file.stsc(0, stsc, len(stsc) + 8, 0))
+        self.assertEqual(3, cr3file.stsc(0, stsc, len(stsc) + 8, 0)[1].first_chunk)
+        stts = pack('>LL', 0, 2) + b''.join(pack('>LL', *e) for e in self.stts)
+        self.assertEqual(self.stts, cr3file.stts(0, stts, len(stts) + 8, 0))
+        ctbo = cr3file.ctbo(0, pack('>L', 2) + pack('>LQQ', 1, 0x100, 0x20) + pack('>LQQ', 3, 0x120, 0x1000), 52, 0)
+        self.assertEqual([1, 3], list(ctbo))
+        self.assertEqual((3, 0x120, 0x1000), ctbo[3])
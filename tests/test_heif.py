@@ -0,0 +1,123 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import tempfile
+from struct import pack
+from unittest import TestCase
+
+from CRaw3.Box import BoxReader, PreadReader
+from CRaw3.Heif import Heif
+from CRaw3.TiffIfd import TiffIfd
+from tests.test_box import box
+from tests.test_tiffifd import tiff
+
+VPS, SPS, PPS = b'\x40\x01vps', b'\x42\x01sps', b'\x44\x01pps'
+
+
+def hvcc():
+    header = bytes([1, 1]) + bytes(10) + bytes([120, 0xf0, 0, 0xfc, 0xfe, 0xfa, 0xfa, 0, 0, 0x0f, 3])
+    for nal_type, nal in ((32, VPS), (33, SPS), (34, PPS)):
+        header += pack('>BHH', 0x80 | nal_type, 1, len(nal)) + nal
+    return box(b'hvcC', header)
+
+
+def heif_file(tiles, thumbnail, exif):
+    '''HIF file with a 2x2 grid of tiles (lists of NAL units) and a thumbnail, like Canon ones'''
+    items = [(0x100 + n, b'hvc1', b''.join(pack('>L', len(nal)) + nal for nal in tile)) for n, tile in enumerate(tiles)]
+    items += [(0x200, b'hvc1', pack('>L', len(thumbnail)) + thumbnail), (0x300, b'Exif', pack('>L', 6) + b'Exif\0\0' + exif)]
+    grid = pack('>BBBBHH', 0, 0, 1, 1, 128, 64)
+    properties = (hvcc() + box(b'ispe', pack('>LLL', 0, 64, 32)) + box(b'colr', b'nclx' + pack('>HHHB', 9, 16, 9, 0x80))
+                  + box(b'pixi', pack('>LB3B', 0, 3, 10, 10, 10)) + box(b'ispe', pack('>LLL', 0, 128, 64))
+                  + box(b'irot', b'\x01') + box(b'clli', pack('>HH', 1000, 400)) + box(b'ispe', pack('>LLL', 0, 32, 16)))
+    associations = [(1, [5, 6, 7])] + [(item_id, [1, 2, 3, 4]) for item_id, _, _ in items[:4]] + [(0x200, [1, 8, 3])]
+    ipma = box(b'ipma', bytes(4) + pack('>L', len(associations))
+               + b''.join(pack('>HB', i, len(a)) + bytes(0x80 | p for p in a) for i, a in associations))
+    infe = [(1, b'grid')] + [(item_id, item_type) for item_id, item_type, _ in items]
+    iinf = box(b'iinf', bytes(4) + pack('>H', len(infe))
+               + b''.join(box(b'infe', b'\x02\0\0\0' + pack('>HH', i, 0) + t + b'\0') for i, t in infe))
+    iref = box(b'iref', bytes(4) + box(b'dimg', pack('>HH4H', 1, 4, 0x100, 0x101, 0x102, 0x103))
+               + box(b'thmb', pack('>HHH', 0x200, 1, 1)) + box(b'cdsc', pack('>HHH', 0x300, 1, 1)))
+    cncv = box(b'uuid', BoxReader.UUID_CANON + box(b'CNCV', b'CanonHEIF001/10.00.00/00.00.00'))
+
+    def meta(mdat_start):
+        offset, iloc = mdat_start + 8, pack('>H', 1 + len(items)) + pack('>HHHHLL', 1, 1, 0, 1, 0, len(grid))
+        for item_id, _, data in items:
+            iloc += pack('>HHHHLL', item_id, 0, 0, 1, offset, len(data))
+            offset += len(data)
+        return box(b'meta', bytes(4) + box(b'hdlr', bytes(8) + b'pict' + bytes(12)) + cncv
+                   + box(b'pitm', bytes(4) + pack('>H', 1)) + iinf + iref + box(b'iprp', box(b'ipco', properties) + ipma)
+                   + box(b'idat', grid) + box(b'iloc', b'\x01\0\0\0\x44\x00' + iloc))
+
+    ftyp = box(b'ftyp', b'heix\0\0\0\0mif1heix')
+    head = ftyp + meta(0)
+    return ftyp + meta(len(head)) + box(b'mdat', b''.join(data for _, _, data in items))
+
+
+class TestHeif(TestCase):
+
+    def setUp(self):
+        self.tiles = [[b'\x26\x01tile%d' % n, b'\x02\x01slice'] for n in range(4)]
+        self.exif = tiff(b'II', [(TiffIfd.TIFF_EXIF_Model, TiffIfd.TIFF_TYPE_STRING, 12, b'Canon EOS R5')])
+        self.data = heif_file(self.tiles, b'\x26\x01thumb', self.exif)
+        self.heif = Heif(BoxReader(self.data)).parse()
+
+    def test_items(self):
+        heif = self.heif
+        self.assertEqual(b'heix', heif.brand)
+        self.assertEqual(b'CanonHEIF001/10.00.00/00.00.00', heif.cncv)
+        self.assertEqual(1, heif.primary)
+        self.assertEqual([1, 0x100, 0x101, 0x102, 0x103, 0x200, 0x300], list(heif.items))
+        self.assertEqual(Heif.NT_ISPE(128, 64), heif.get_properties(1)[b'ispe'])
+        self.assertEqual(90, heif.get_properties(1)[b'irot'])
+        self.assertEqual([0x200], heif.get_thumbnails())
+        self.assertEqual(b'Canon EOS R5', heif.get_model_name())
+        self.assertIsNone(heif.get_model_id())
+
+    def test_grid(self):
+        grid = self.heif.get_grid()
+        self.assertEqual((2, 2, 128, 64), grid[:4])
+        tiles = self.heif.get_tiles()
+        self.assertEqual([(0, 0), (0, 1), (1, 0), (1, 1)], [(t.row, t.column) for t in tiles])
+        tile = tiles[3]
+        self.assertEqual((64, 32), (tile.width, tile.height))
+        self.assertEqual(b'\x26\x01tile3', self.data[tile.offset + 4:tile.offset + 4 + 7])
+
+    def test_hdr(self):
+        hdr = self.heif.get_hdr()
+        self.assertTrue(hdr['pq'])
+        self.assertEqual((10, 10, 10), hdr['pixi'].bits)
+        self.assertEqual(Heif.NT_CLLI(1000, 400), hdr['clli'])
+        self.assertEqual((9, 16, 9, 1), hdr['colr'][1:])
+
+    def test_extract(self):
+        start = Heif.HEVC_START_CODE
+        self.assertEqual(start + VPS + start + SPS + start + PPS + start + self.tiles[1][0] + start + self.tiles[1][1],
+                         self.heif.hevc_stream(0x101))
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'r5.hif')
+            with open(filename, 'wb') as f:
+                f.write(self.data)
+            with PreadReader.open(filename) as reader:
+                names = Heif(reader).parse().extract(os.path.join(tmp, 'out'), jobs=3)
+            self.assertEqual(['tile0100.hevc', 'tile0101.hevc', 'tile0102.hevc', 'tile0103.hevc', 'thmb0200.hevc',
+                              'exif.bin'], [os.path.basename(n) for n in names])
+            with open(os.path.join(tmp, 'out', 'exif.bin'), 'rb') as f:
+                self.assertEqual(self.exif, f.read())
+            with open(os.path.join(tmp, 'out', 'thmb0200.hevc'), 'rb') as f:
+                self.assertTrue(f.read().endswith(start + b'\x26\x01thumb'))
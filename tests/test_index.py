@@ -0,0 +1,113 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import json
+import sqlite3
+import tempfile
+from struct import pack
+from unittest import TestCase, mock
+
+from CRaw3.Box import BoxReader
+from CRaw3.TiffIfd import TiffIfd
+from canon_cr3.index import MetadataIndex, file_key
+from canon_cr3.scan import scan
+import canon_cr3.scan
+from tests.test_box import box
+from tests.test_tiffifd import tiff
+
+
+def cmt_boxes(model_id, lens, iso):
+    '''CMT1 (model name), CMT2 (lens, ISO) and CMT3 (model ID, sensor) boxes'''
+    cmt1 = tiff(b'II', [(TiffIfd.TIFF_EXIF_Model, TiffIfd.TIFF_TYPE_STRING, 8, b'Canon R\0')])
+    cmt2 = tiff(b'II', [(TiffIfd.TIFF_EXIF_ISO, TiffIfd.TIFF_TYPE_USHORT, 1, pack('<H', iso)),
+                        (TiffIfd.TIFF_EXIF_LensModel, TiffIfd.TIFF_TYPE_STRING, len(lens) + 1, lens + b'\0')])
+    cmt3 = tiff(b'II', [(TiffIfd.TIFF_MAKERNOTE_MODELID, TiffIfd.TIFF_TYPE_ULONG, 1, pack('<L', model_id)),
+                        (TiffIfd.TIFF_MAKERNOTE_SENSORINFO, TiffIfd.TIFF_TYPE_USHORT, 9,
+                         pack('<9H', 18, 6888, 4546, 1, 1, 156, 50, 6875, 4545))])
+    return box(b'CMT1', cmt1) + box(b'CMT2', cmt2) + box(b'CMT3', cmt3)
+
+
+def cr3_file(filename, model_id, lens, iso):
+    '''CR3 headers: ftyp, and moov with CNCV and CMT boxes'''
+    uuid = box(b'uuid', BoxReader.UUID_CANON + box(b'CNCV', b'CanonCR3_001/00.09.00/00.00.00')
+               + cmt_boxes(model_id, lens, iso))
+    with open(filename, 'wb') as f:
+        f.write(box(b'ftyp', b'crx \x00\x00\x00\x01') + box(b'moov', uuid))
+
+
+class TestMetadataIndex(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = os.path.join(self.tmp.name, 'pictures')
+        os.makedirs(self.dir)
+        self.a = os.path.join(self.dir, 'a.cr3')
+        self.b = os.path.join(self.dir, 'b.cr3')
+        cr3_file(self.a, 0x80000424, b'RF24-105mm F4 L IS USM', 100)
+        cr3_file(self.b, 0x80000432, b'RF50mm F1.8 STM', 800)
+        self.index = os.path.join(self.tmp.name, 'index.db')
+        self.output = os.path.join(self.tmp.name, 'out.jsonl')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def records(self):
+        with open(self.output) as f:
+            return [json.loads(line) for line in f]
+
+    def test_index(self):
+        scan([self.dir], self.output, jobs=1, index=self.index)
+        record = self.records()[0]
+        self.assertEqual((None, 'RF24-105mm F4 L IS USM', 100), (record['error'], record['lens'], record['iso']))
+        with MetadataIndex(self.index) as db:
+            self.assertEqual({self.a: file_key(self.a), self.b: file_key(self.b)}, db.keys())
+            self.assertEqual([self.b], [r['path'] for r in db.find(model_id=0x80000432)])
+            self.assertEqual([self.a], [r['path'] for r in db.find(lens='24-105')])
+            self.assertEqual([self.b], [r['path'] for r in db.find(model_id=0x80000432, iso=800)])
+            self.assertEqual([], db.find(lens='24-105', iso=800))
+            names = [name for _, name, _, _ in db.boxes(self.a)]
+            self.assertEqual(['ftyp', 'moov', 'uuid', 'CNCV', 'CMT1', 'CMT2', 'CMT3'], names)
+            self.assertEqual('CanonCR3_001/00.09.00/00.00.00', db.values(self.a)[('CNCV', 'CNCV')])
+            tags = db.tags(self.a, 'CMT3')
+            self.assertEqual([0x80000424], tags[('CMT3', TiffIfd.TIFF_MAKERNOTE_MODELID)])
+            self.assertEqual('Canon R', db.tags(self.a)[('CMT1', TiffIfd.TIFF_EXIF_Model)])
+
+    def test_interrupted(self):
+        # killed before the index is closed: records committed during the scan are kept, without progress
+        with mock.patch.object(MetadataIndex, 'close', lambda index: index.db.close()), \
+                mock.patch.object(canon_cr3.scan, 'COMMIT_INTERVAL', 0):
+            scan([self.dir], self.output, jobs=1, index=self.index)
+        with MetadataIndex(self.index) as db:
+            self.assertEqual({self.a, self.b}, set(db.keys()))
+
+    def test_rescan(self):
+        scan([self.dir], self.output, jobs=1, index=self.index)
+        with sqlite3.connect(self.index) as db:  # stored records are used for unchanged files
+            db.execute("UPDATE files SET record = json_set(record, '$.model_name', 'indexed')")
+        scan([self.dir], self.output, jobs=1, index=self.index)
+        self.assertEqual(['indexed', 'indexed'], [r['model_name'] for r in self.records()])
+        # same size and mtime, other first bytes
+        stat = os.stat(self.b)
+        cr3_file(self.b, 0x80000432, b'RF50mm F1.8 stm', 800)
+        os.utime(self.b, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.utime(self.a, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        scan([self.dir], self.output, jobs=1, index=self.index)
+        self.assertEqual(['Canon R', 'Canon R'], [r['model_name'] for r in self.records()])
+        with MetadataIndex(self.index) as db:
+            self.assertEqual('RF50mm F1.8 stm', db.get(self.b)['lens'])
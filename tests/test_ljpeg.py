@@ -0,0 +1,138 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+from struct import pack
+from unittest import TestCase, skipIf
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from CRaw3.Cr2 import Cr2
+from CRaw3.Jpeg import Jpeg
+from CRaw3.TiffIfd import TiffIfd
+from tests.test_tiffifd import tiff
+
+if np is not None:
+    from CRaw3.LjpegDecoder import LjpegDecoder
+    from tests.crx_encoder import BitWriter
+
+# SSSS 0 to 6 on 3 bits, then one code per length from 4 to 13 bits
+COUNTS = (0, 0, 7, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0)
+SYMBOLS = bytes(range(17))
+
+
+def predict(predictor, ra, rb, rc):
+    return (ra, rb, rc, ra + rb - rc, ra + ((rb - rc) >> 1), rb + ((ra - rc) >> 1), (ra + rb) >> 1)[predictor - 1]
+
+
+def ljpeg(frame, bits=14, predictor=1):
+    '''lossless Jpeg of frame (high, wide, components), one Huffman table for all components'''
+    high, wide, n = frame.shape
+    codes = {}
+    code = 0
+    for length, count in enumerate(COUNTS, 1):
+        for _ in range(count):
+            codes[SYMBOLS[len(codes)]] = (code, length)
+            code += 1
+        code <<= 1
+    out = BitWriter()
+    values = frame.astype(int).tolist()
+    for y in range(high):
+        for x in range(wide):
+            for c in range(n):
+                if x == 0:
+                    p = 1 << (bits - 1) if y == 0 else values[y - 1][0][c]
+                elif y == 0:
+                    p = values[0][x - 1][c]
+                else:
+                    p = predict(predictor, values[y][x - 1][c], values[y - 1][x][c], values[y - 1][x - 1][c])
+                diff = (values[y][x][c] - p) & 0xffff
+                diff = diff - 0x10000 if diff > 0x8000 else diff
+                ssss = 16 if diff == 32768 else abs(diff).bit_length()
+                out.write(*codes[ssss])
+                if 0 < ssss < 16:
+                    out.write(diff if diff > 0 else diff + (1 << ssss) - 1, ssss)
+    scan = out.getvalue().replace(b'\xff', b'\xff\x00')
+    sof = pack('>BHHB', bits, high, wide, n) + b''.join(pack('>BBB', c + 1, 0x11, 0) for c in range(n))
+    dht = bytes([0]) + bytes(COUNTS) + SYMBOLS
+    sos = bytes([n]) + b''.join(bytes([c + 1, 0]) for c in range(n)) + bytes([predictor, 0, 0])
+    segment = lambda marker, body: pack('>HH', marker, len(body) + 2) + body
+    return (pack('>H', Jpeg.JPEG_SOI) + segment(Jpeg.JPEG_DHT, dht) + segment(Jpeg.JPEG_SOF3, sof)
+            + segment(Jpeg.JPEG_SOS, sos) + scan + pack('>H', Jpeg.JPEG_EOI))
+
+
+@skipIf(np is None, 'numpy is not installed')
+class TestLjpegDecoder(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(2008)
+        self.frame = (1000 + np.add.outer(np.arange(12) * 50, np.arange(10) * 9)[:, :, None]
+                      + rng.integers(0, 300, (12, 10, 2))).astype(np.uint16)
+        self.frame[3, 4, 0] = 16383
+        self.frame[3, 5, 0] = 0
+
+    def test_headers(self):
+        jpeg = Jpeg(ljpeg(self.frame), False)
+        self.assertEqual((14, 12, 10, 2), (jpeg.bits, jpeg.high, jpeg.wide, jpeg.n_comp))
+        self.assertEqual((COUNTS, SYMBOLS), jpeg.huffman[0])
+        self.assertEqual(1, jpeg.predictor)
+        self.assertEqual([Jpeg.NT_SCAN_COMPONENT(1, 0), Jpeg.NT_SCAN_COMPONENT(2, 0)], jpeg.scan_components)
+
+    def test_lookup(self):
+        table = LjpegDecoder.lookup(COUNTS, SYMBOLS)
+        self.assertEqual((3 << 8) | 2, table[0b010 << 13])
+        self.assertEqual((13 << 8) | 16, table[0b1111111111110 << 3])
+        self.assertEqual(0, table[0xffff])
+
+    def test_predictor1(self):
+        data = ljpeg(self.frame)
+        self.assertIn(b'\xff\x00', data)
+        decoded = LjpegDecoder(Jpeg(data, False)).decode()
+        self.assertEqual((12, 20), decoded.shape)
+        self.assertTrue((decoded == self.frame.reshape(12, 20)).all())
+
+    def test_predictors(self):
+        for predictor in range(2, 8):
+            decoded = LjpegDecoder(Jpeg(ljpeg(self.frame, predictor=predictor), False)).decode()
+            self.assertTrue((decoded == self.frame.reshape(12, 20)).all(), 'predictor=%d' % predictor)
+
+    def test_truncated(self):
+        data = ljpeg(self.frame)
+        with self.assertRaises(ValueError):
+            LjpegDecoder(Jpeg(data[:len(data) // 2], False)).decode()
+
+    def test_unslice(self):
+        picture = np.arange(6 * 14).reshape(6, 14)
+        frame = np.concatenate([picture[:, :4].ravel(), picture[:, 4:8].ravel(), picture[:, 8:].ravel()])
+        self.assertTrue((LjpegDecoder.unslice(frame.reshape(6, 14), (2, 4, 6)) == picture).all())
+
+    def test_cr2(self):
+        sensor = self.frame.reshape(12, 20)
+        sliced = np.concatenate([sensor[:, :8].ravel(), sensor[:, 8:].ravel()]).reshape(12, 10, 2)
+        data = ljpeg(sliced)
+        entries = [(TiffIfd.TIFF_EXIF_StripOffsets, TiffIfd.TIFF_TYPE_ULONG, 1, pack('<L', 0)),
+                   (TiffIfd.TIFF_EXIF_StripByteCounts, TiffIfd.TIFF_TYPE_ULONG, 1, pack('<L', len(data))),
+                   (TiffIfd.TIFF_CR2_SLICE, TiffIfd.TIFF_TYPE_USHORT, 3, pack('<3H', 1, 8, 12))]
+        start = len(tiff(b'II', entries))
+        entries[0] = (TiffIfd.TIFF_EXIF_StripOffsets, TiffIfd.TIFF_TYPE_ULONG, 1, pack('<L', start))
+        cr2 = Cr2.__new__(Cr2)
+        cr2.data = tiff(b'II', entries) + data
+        cr2.ifd_list = {3: TiffIfd(cr2.data, len(cr2.data), 0, '3', False)}
+        self.assertTrue((cr2.get_raw() == sensor).all())
@@ -0,0 +1,73 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import tempfile
+from unittest import TestCase
+
+from CRaw3.Box import BoxReader
+from CRaw3.Cr3 import Cr3
+from CRaw3.Profiler import Profiler
+from tests.synthetic import make_file
+
+
+class TestProfiler(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, 'roll.cr3')
+        make_file(self.filename, 1 << 20, roll=3, tiles=(2, 1))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def parse(self, profiler=None):
+        with BoxReader.open(self.filename) as reader:
+            cr3file = Cr3(reader, profiler=profiler)
+            cr3file.parse()
+            cr3file.parse_ctmd()
+            cr3file.get_crx('trak3', header_only=True)
+        return cr3file
+
+    def test_summary(self):
+        profiler = Profiler()
+        cr3file = self.parse(profiler)
+        self.assertEqual(sorted(self.parse().cr3, key=str), sorted(cr3file.cr3, key=str))
+        self.assertEqual([], profiler.stack)
+        summary = profiler.summary()
+        self.assertEqual(4, summary['boxes']['stsz']['calls'])
+        self.assertEqual(4, summary['handlers']['stsz']['calls'])
+        self.assertEqual(len(cr3file.box_list), sum(v['calls'] for v in summary['boxes'].values()))
+        # CMT1 to CMT4 in moov and in CMTA (roll), and one makernote per picture
+        self.assertEqual(4 + 4 + 3, summary['classes']['TiffIfd']['calls'])
+        self.assertEqual(sum(cr3file.get_ctmd().sizes), summary['classes']['Ctmd.parse']['bytes'])
+        self.assertEqual(cr3file.cr3['trak3'][b'CMP1'].hsize, summary['classes']['Crx.parse_tile']['bytes'])
+        moov = summary['boxes']['moov']
+        self.assertGreaterEqual(moov['seconds'], moov['own_seconds'])
+        self.assertGreater(moov['allocations'], 0)
+
+    def test_folded(self):
+        profiler = Profiler()
+        self.parse(profiler)
+        stacks = dict(line.rsplit(' ', 1) for line in profiler.folded().splitlines())
+        self.assertIn('moov;trak;mdia;minf;stbl;stsz;tags[stsz]', stacks)
+        self.assertIn('moov;uuid;CMT3;TiffIfd', stacks)
+        self.assertIn('Ctmd.parse;TiffIfd', stacks)
+        self.assertTrue(all(int(us) > 0 for us in stacks.values()))
+        profiler.save(os.path.join(self.tmp.name, 'profile'))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, 'profile.folded')))
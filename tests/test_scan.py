@@ -0,0 +1,71 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import json
+import tempfile
+from unittest import TestCase
+
+from canon_cr3.scan import find_files, scan_file, scan, done_paths
+from tests.synthetic import make_file
+
+
+class TestScan(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = os.path.join(self.tmp.name, 'pictures')
+        os.makedirs(os.path.join(self.dir, 'sub'))
+        for name in ('b.CR3', 'a.cr2', os.path.join('sub', 'c.crm'), 'notes.txt'):
+            with open(os.path.join(self.dir, name), 'wb') as f:
+                f.write(b'not a raw file')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_find_files(self):
+        names = [os.path.relpath(p, self.dir) for p in find_files([self.dir])]
+        self.assertEqual(['a.cr2', 'b.CR3', os.path.join('sub', 'c.crm')], names)
+
+    def test_error_record(self):
+        record = scan_file(os.path.join(self.dir, 'b.CR3'))
+        self.assertEqual('unknown format', record['error'])
+        self.assertEqual(14, record['filesize'])
+
+    def test_crm_exposure(self):
+        filename = os.path.join(self.tmp.name, 'clip.crm')
+        make_file(filename, 1 << 20, roll=4, crm=True)
+        record = scan_file(filename)
+        self.assertIsNone(record['error'])
+        self.assertEqual('crm', record['format'])
+        self.assertEqual('2020-08-01T12:00:00', record['timestamp'])
+        self.assertEqual(5.6, record['f_number'])
+        self.assertEqual(0.004, record['exposure_time'])
+        self.assertEqual(100, record['iso'])
+
+    def test_resume(self):
+        output = os.path.join(self.tmp.name, 'out.jsonl')
+        count, _ = scan([self.dir], output, jobs=1)
+        self.assertEqual(3, count)
+        with open(output, 'a') as f:
+            f.write('{"path": "partial')  # interrupted write
+        count, _ = scan([self.dir], output, jobs=1, resume=True)
+        self.assertEqual(0, count)
+        self.assertEqual(3, len(done_paths(output, 'jsonl')))
+        with open(output) as f:
+            self.assertEqual(3, len([json.loads(line) for line in f]))
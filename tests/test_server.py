@@ -0,0 +1,150 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import asyncio
+import tempfile
+from struct import pack
+from unittest import TestCase
+
+from CRaw3.Box import BoxReader
+from canon_cr3.server import ImageServer, parse_range
+from tests.test_box import box
+
+THMB = b'\xff\xd8thumbnail\xff\xd9'
+PRVW = b'\xff\xd8preview picture\xff\xd9'
+JPEG = b'\xff\xd8full size picture\xff\xd9'
+
+
+def cr3_file(filename, thumbnail=THMB):
+    '''CR3 with THMB (moov), PRVW (uuid) and a trak1 JPEG picture (mdat)'''
+    thmb = box(b'THMB', pack('>LHHLHH', 0, 160, 120, len(thumbnail), 0, 0) + thumbnail)
+    prvw = box(b'uuid', BoxReader.UUID_PRVW + bytes(8) + box(b'PRVW', pack('>LHHHHL', 0, 0, 1620, 1080, 0, len(PRVW))
+                                                                    + PRVW))
+
+    def head(mdat_start):
+        stbl = (box(b'stsz', pack('>LLLL', 0, 0, 1, len(JPEG))) + box(b'co64', pack('>LLQ', 0, 1, mdat_start + 8)))
+        cncv = box(b'CNCV', b'CanonCR3_001/00.09.00/00.00.00')
+        moov = box(b'moov', box(b'uuid', BoxReader.UUID_CANON + cncv + thmb)
+                   + box(b'trak', box(b'mdia', box(b'minf', box(b'stbl', stbl)))))
+        return box(b'ftyp', b'crx \x00\x00\x00\x01') + moov + prvw
+
+    with open(filename, 'wb') as f:
+        f.write(head(len(head(0))) + box(b'mdat', JPEG))
+
+
+async def exchange(port, *requests):
+    '''responses (status, headers, body) to requests sent on one connection'''
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    responses = []
+    for request in requests:
+        writer.write(request.encode('latin-1'))
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1')
+            if not line.strip():
+                break
+            name, _, value = line.partition(':')
+            headers[name.lower()] = value.strip()
+        body = b''
+        if not request.startswith('HEAD') and status != 304:
+            body = await reader.readexactly(int(headers['content-length']))
+        responses.append((status, headers, body))
+    writer.close()
+    await writer.wait_closed()
+    return responses
+
+
+class TestImageServer(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp.name, 'sub'))
+        self.filename = os.path.join(self.tmp.name, 'sub', 'a.cr3')
+        cr3_file(self.filename)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_requests(self, *requests, before=None):
+        async def run():
+            server = ImageServer(self.tmp.name)
+            handled = []
+
+            async def handle(reader, writer):
+                await server.handle(reader, writer)
+                handled.append(writer)
+
+            listener = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = listener.sockets[0].getsockname()[1]
+            async with listener:
+                responses = await exchange(port, *requests)
+                if before is not None:
+                    before()
+                    responses += await exchange(port, *requests)
+                while len(handled) < (1 if before is None else 2):
+                    await asyncio.sleep(0.001)
+            return responses
+        return asyncio.run(run())
+
+    def test_pictures(self):
+        responses = self.run_requests('GET /thmb/sub/a.cr3 HTTP/1.1\r\n\r\n', 'GET /prvw/sub/a.cr3 HTTP/1.1\r\n\r\n',
+                                      'GET /jpeg/sub%2Fa.cr3 HTTP/1.1\r\n\r\n', 'HEAD /jpeg/sub/a.cr3 HTTP/1.1\r\n\r\n')
+        self.assertEqual([(200, THMB), (200, PRVW), (200, JPEG), (200, b'')], [(s, b) for s, _, b in responses])
+        self.assertEqual('image/jpeg', responses[0][1]['content-type'])
+        self.assertEqual(str(len(JPEG)), responses[3][1]['content-length'])
+
+    def test_range_etag(self):
+        (_, headers, _), = self.run_requests('GET /thmb/sub/a.cr3 HTTP/1.1\r\n\r\n')
+        etag = headers['etag']
+        responses = self.run_requests('GET /thmb/sub/a.cr3 HTTP/1.1\r\nRange: bytes=2-10\r\n\r\n',
+                                      'GET /thmb/sub/a.cr3 HTTP/1.1\r\nRange: bytes=-2\r\n\r\n',
+                                      'GET /thmb/sub/a.cr3 HTTP/1.1\r\nRange: bytes=100-\r\n\r\n',
+                                      'GET /thmb/sub/a.cr3 HTTP/1.1\r\nIf-None-Match: %s\r\n\r\n' % etag,
+                                      'GET /thmb/sub/a.cr3 HTTP/1.1\r\nRange: bytes=2-3\r\nIf-Range: "old"\r\n\r\n')
+        self.assertEqual((206, THMB[2:11]), (responses[0][0], responses[0][2]))
+        self.assertEqual('bytes 2-10/%d' % len(THMB), responses[0][1]['content-range'])
+        self.assertEqual((206, b'\xff\xd9'), (responses[1][0], responses[1][2]))
+        self.assertEqual((416, 'bytes */%d' % len(THMB)), (responses[2][0], responses[2][1]['content-range']))
+        self.assertEqual((304, b''), (responses[3][0], responses[3][2]))
+        self.assertEqual(etag, responses[3][1]['etag'])
+        self.assertNotIn('content-length', responses[3][1])
+        self.assertEqual((200, THMB), (responses[4][0], responses[4][2]))
+
+    def test_errors(self):
+        responses = self.run_requests('GET /thmb/../a.cr3 HTTP/1.1\r\n\r\n', 'GET /raw/sub/a.cr3 HTTP/1.1\r\n\r\n',
+                                      'GET /thmb/sub/b.cr3 HTTP/1.1\r\n\r\n', 'POST /thmb/sub/a.cr3 HTTP/1.1\r\n\r\n')
+        self.assertEqual([404, 404, 404, 405], [s for s, _, _ in responses])
+
+    def test_changed_file(self):
+        thumbnail = b'\xff\xd8new thumbnail, longer\xff\xd9'
+        responses = self.run_requests('GET /thmb/sub/a.cr3 HTTP/1.1\r\n\r\n',
+                                      before=lambda: cr3_file(self.filename, thumbnail))
+        self.assertEqual([THMB, thumbnail], [b for _, _, b in responses])
+        self.assertNotEqual(responses[0][1]['etag'], responses[1][1]['etag'])
+
+    def test_parse_range(self):
+        self.assertEqual((0, 100), parse_range('bytes=0-', 100))
+        self.assertEqual((90, 100), parse_range('bytes=90-200', 100))
+        self.assertEqual((0, 100), parse_range('bytes=-500', 100))
+        for ignored in ('items=0-1', 'bytes=0-1,5-6', 'bytes=5-2', 'bytes=-', 'bytes=a-2'):
+            self.assertIsNone(parse_range(ignored, 100), ignored)
+        for unsatisfiable in ('bytes=100-', 'bytes=-0'):
+            with self.assertRaises(ValueError):
+                parse_range(unsatisfiable, 100)
@@ -0,0 +1,76 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import tempfile
+from unittest import TestCase
+
+from CRaw3.Box import BoxReader, PreadReader
+from CRaw3.Cr3 import Cr3
+from tests.synthetic import make_file, MODEL_ID
+
+
+class TestSynthetic(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, 'synthetic.cr3')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def parse(self, **options):
+        samples = make_file(self.filename, **options)
+        reader = BoxReader.open(self.filename)
+        self.addCleanup(reader.close)
+        cr3file = Cr3(reader)
+        cr3file.parse()
+        with PreadReader.open(self.filename) as pread:
+            headers = Cr3(pread)
+            headers.parse_headers()
+        self.assertEqual(sorted(cr3file.cr3, key=str), sorted(headers.cr3, key=str))
+        return cr3file, samples
+
+    def test_cr3(self):
+        cr3file, samples = self.parse(size=4 << 20, roll=3, tiles=(2, 3), levels=3, dual_pixel=True)
+        self.assertTrue(cr3file.is_cr3())
+        self.assertEqual(5, len([k for k in cr3file.cr3 if str(k).startswith('trak')]))
+        self.assertLess(abs(os.path.getsize(self.filename) - (4 << 20)), 1 << 16)
+        self.assertEqual(MODEL_ID, cr3file.get_model_id())
+        self.assertEqual((12, 1, 3), cr3file.get_roll_info())
+        self.assertEqual(samples[0][0], cr3file.get_jpeg_range())
+        self.assertEqual(b'\xff\xd8', bytes(cr3file.get_thumbnail()[:2]))
+        self.assertEqual(b'\xff\xd8', bytes(cr3file.get_preview()[:2]))
+        for trak in (2, 4):
+            crx = cr3file.get_crx('trak%d' % (trak + 1), 2, header_only=True)
+            self.assertEqual(6, len(crx.tiles))
+            self.assertEqual(10, len(crx.subbands[5][3]))
+            self.assertEqual(sum(samples[trak][2]), crx.tiles[5].offset + crx.tiles[5].size)
+        ctmd = cr3file.parse_ctmd()
+        self.assertEqual([0, 1, 2], list(ctmd.ctmd_list))
+        self.assertEqual(2, cr3file.get_timestamp(2).s)
+
+    def test_crm(self):
+        cr3file, samples = self.parse(size=1 << 20, roll=10, crm=True)
+        self.assertTrue(cr3file.is_crm())
+        self.assertEqual(10, len(cr3file.get_frame_index('trak1')))
+        self.assertIsNone(cr3file.get_roll_info())
+        self.assertIsNone(cr3file.get_jpeg_range())
+        crx = cr3file.get_crx('trak1', 9, header_only=True)
+        self.assertEqual(samples[0][9][0] + samples[0][9][1], crx.tiles[0].offset + crx.tiles[0].size)
+        self.assertEqual(9, cr3file.get_timestamp(9).s)
@@ -0,0 +1,82 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+from struct import pack
+from unittest import TestCase
+
+from CRaw3.TiffIfd import TiffIfd
+
+
+def tiff(order, entries):
+    '''TIFF header and one IFD. entries are (tag, type, count, value bytes), values longer than 4 bytes
+    are stored after the IFD'''
+    e = '<' if order == b'II' else '>'
+    ifd_size = 2 + 12 * len(entries) + 4
+    header = order + pack(e + 'HL', 0x2a, 8)
+    ifd = pack(e + 'H', len(entries))
+    extra = b''
+    for tag, type, count, value in entries:
+        if len(value) <= 4:
+            ifd += pack(e + 'HHL', tag, type, count) + value.ljust(4, b'\0')
+        else:
+            ifd += pack(e + 'HHLL', tag, type, count, 8 + ifd_size + len(extra))
+            extra += value
+    return header + ifd + pack(e + 'L', 0) + extra
+
+
+class TestTiffIfd(TestCase):
+
+    def entries(self, order):
+        e = '<' if order == b'II' else '>'
+        return [(TiffIfd.TIFF_EXIF_Model, TiffIfd.TIFF_TYPE_STRING, 9, b'Canon R\0\0'),
+                (TiffIfd.TIFF_MAKERNOTE_SENSORINFO, TiffIfd.TIFF_TYPE_USHORT, 5, pack(e + '5H', 10, 6288, 4056, 0, 1)),
+                (TiffIfd.TIFF_MAKERNOTE_MODELID, TiffIfd.TIFF_TYPE_ULONG, 1, pack(e + 'L', 0x80000424)),
+                (0x11, TiffIfd.TIFF_TYPE_USHORT, 1, pack(e + 'H', 7)),
+                (0x12, TiffIfd.TIFF_TYPE_RATIONAL, 2, pack(e + '4l', -1, 3, 28, 10)),
+                (0x13, TiffIfd.TIFF_TYPE_SHORT, 2, pack(e + '2h', -2, 300)),
+                (0x14, TiffIfd.TIFF_TYPE_BYTESEQ, 6, b'\x01\x02\x03\x04\x05\x06')]
+
+    def test_byte_orders(self):
+        for order in (b'II', b'MM'):
+            data = tiff(order, self.entries(order))
+            ifd = TiffIfd(data, len(data), 0x100, 'CMT3', False)
+            self.assertEqual(order, ifd.order)
+            self.assertEqual(b'Canon R', ifd.get(TiffIfd.TIFF_EXIF_Model))
+            self.assertEqual((10, 6288, 4056, 0, 1), ifd.get(TiffIfd.TIFF_MAKERNOTE_SENSORINFO))
+            self.assertEqual((0x80000424,), ifd.get(TiffIfd.TIFF_MAKERNOTE_MODELID))
+            self.assertEqual((7,), ifd.get(0x11))  # inside the entry
+            self.assertEqual(((-1, 3), (28, 10)), ifd.get(0x12))
+            self.assertEqual((-2, 300), ifd.get(0x13))
+            self.assertEqual(b'\x01\x02\x03\x04\x05\x06', ifd.get(0x14))
+            self.assertEqual(0x100 + 10, ifd.ifd[TiffIfd.TIFF_EXIF_Model].offset)
+
+    def test_memoized(self):
+        data = tiff(b'II', self.entries(b'II'))
+        ifd = TiffIfd(data, len(data), 0, 'CMT3', False)
+        values = ifd.get(TiffIfd.TIFF_MAKERNOTE_SENSORINFO)
+        self.assertIs(values, ifd.get(TiffIfd.TIFF_MAKERNOTE_SENSORINFO))
+        self.assertIsNone(ifd.get(0x4242))
+        self.assertEqual((), ifd.get(0x4242, ()))
+
+    def test_no_header(self):
+        data = tiff(b'II', self.entries(b'II'))
+        ifd = TiffIfd(b'\xff' * 4 + data, len(data), 0, '0', False, False, True, 4 + 8)
+        self.assertEqual(7, len(ifd.ifd))
+        self.assertEqual(0, ifd.next)
+        # value offsets are relative to data
+        self.assertEqual(pack('<L', 0x80000424), ifd.raw(TiffIfd.TIFF_MAKERNOTE_MODELID))
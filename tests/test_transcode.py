@@ -0,0 +1,124 @@
+'''
+This file is part of cannon_cr3.
+
+cannon_cr3 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+cannon_cr3 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with cannon_cr3. If not, see <http://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import tempfile
+from struct import pack
+from unittest import TestCase, skipIf, mock
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from CRaw3.Box import BoxReader
+from CRaw3.TiffIfd import TiffIfd
+from tests.test_box import box
+
+if np is not None:
+    import canon_cr3.transcode
+    from canon_cr3.transcode import transcode, FileSink, NpySink, TiffSink, RawSink, CrxSink
+    from CRaw3.Crx import Crx
+    from tests.test_crx import bayer_sample
+
+
+def crm_file(filename, frames):
+    '''CRM clip of lossless CRX frames (Bayer arrays), two frames per chunk'''
+    samples = [bayer_sample(bayer, bayer.shape[1], bayer.shape[0]) for bayer in frames]
+    data = [crx.data for crx in samples]
+    cmp1 = samples[0].cmp1
+    ih, iw = frames[0].shape
+    cmp1_box = box(b'CMP1', pack('>HHHHLLLLBBBBL', 0xffff, 0x30, 0x100, 0, iw, ih, iw, ih, 14, 4 << 4, 0, 0, cmp1.hsize)
+                   + bytes(16))
+    craw = box(b'CRAW', pack('>LL16sHHHHHHLH32sHHHH', 0, 1, b'', iw, ih, 0x48, 0, 0x48, 0, 0, 1, b'', 24, 0xffff, 1, 1)
+               + cmp1_box)
+
+    def head(mdat_start):
+        chunks, offset = [], mdat_start + 8
+        for n, sample in enumerate(data):
+            if n % 2 == 0:
+                chunks.append(offset)
+            offset += len(sample)
+        stbl = (box(b'stsd', bytes(8) + craw)
+                + box(b'stsz', pack('>LLL', 0, 0, len(data)) + b''.join(pack('>L', len(s)) for s in data))
+                + box(b'stsc', pack('>LLLLL', 0, 1, 1, 2, 1))
+                + box(b'co64', pack('>LL', 0, len(chunks)) + b''.join(pack('>Q', c) for c in chunks)))
+        cncv = box(b'CNCV', b'CanonCRM0001/02.09.00/00.00.00')
+        moov = box(b'moov', box(b'uuid', BoxReader.UUID_CANON + cncv) + box(b'trak', box(b'mdia', box(b'minf', box(b'stbl', stbl)))))
+        return box(b'ftyp', b'crx \x00\x00\x00\x01') + moov
+
+    start = len(head(0))
+    with open(filename, 'wb') as f:
+        f.write(head(start) + box(b'mdat', b''.join(data)))
+
+
+@skipIf(np is None, 'numpy is not installed')
+class TestTranscode(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(200)
+        self.frames = [rng.integers(1024, 15000, (12, 16)).astype(np.uint16) for _ in range(5)]
+        self.clip = os.path.join(self.tmp.name, 'clip.crm')
+        crm_file(self.clip, self.frames)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def output(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_npy(self):
+        index = self.output('clip.idx')
+        written, skipped, _ = transcode(self.clip, NpySink(self.output('npy')), jobs=2, depth=3, index=index)
+        self.assertEqual((5, 0), (written, skipped))
+        self.assertTrue(os.path.exists(index))
+        for n, bayer in enumerate(self.frames):
+            self.assertTrue((np.load(self.output('npy/frame%06d.npy' % n)) == bayer).all())
+        # again, with index file
+        written, _, _ = transcode(self.clip, NpySink(self.output('npy2')), jobs=1, start=3, index=index)
+        self.assertEqual(['frame000003.npy', 'frame000004.npy'], sorted(os.listdir(self.output('npy2'))))
+
+    def test_tiff_and_raw(self):
+        transcode(self.clip, TiffSink(self.output('tif')), jobs=1, start=1, count=2)
+        with open(self.output('tif/frame000002.tif'), 'rb') as f:
+            data = f.read()
+        ifd = TiffIfd(data, len(data), 0, 'tif', False)
+        self.assertEqual((16,), ifd.get(TiffIfd.TIFF_EXIF_ImageWidth))
+        offset, = ifd.get(TiffIfd.TIFF_EXIF_StripOffsets)
+        self.assertEqual(self.frames[2].astype('<u2').tobytes(), data[offset:])
+        transcode(self.clip, RawSink(self.output('raw')), jobs=1, count=1)
+        with open(self.output('raw/frame000000.raw'), 'rb') as f:
+            self.assertEqual(self.frames[0].astype('<u2').tobytes(), f.read())
+
+    def test_crx(self):
+        transcode(self.clip, CrxSink(self.output('crx')), jobs=2, depth=1)
+        with open(self.output('crx/frame000004_crx.bin'), 'rb') as f:
+            self.assertEqual(bayer_sample(self.frames[4], 16, 12).data, f.read())
+
+    def test_sink_is_abstract(self):
+        self.assertRaises(TypeError, FileSink, self.output('sink'))
+
+    def test_crx_parsed_once(self):
+        clip = canon_cr3.transcode._open_clip(self.clip)
+        with mock.patch.object(canon_cr3.transcode, '_clip', clip), \
+                mock.patch.object(Crx, 'parse_tile', autospec=True, side_effect=Crx.parse_tile) as parse_tile:
+            n, bayer = canon_cr3.transcode._transcode_frame((3, True, 0))
+        clip[0].reader.close()
+        self.assertEqual(1, parse_tile.call_count)
+        self.assertTrue((self.frames[3] == bayer).all())
@@ -0,0 +1,28 @@
+# transcode frames of a CRM clip (Cinema Raw Light) with a pool of processes: .npy, 16 bits TIFF, raw Bayer or CRX files
+# from https://github.com/lclevy/canon_cr3
+# License is GPLv3 
+
+import sys
+from optparse import OptionParser
+
+from canon_cr3.transcode import transcode, SINKS
+
+
+if __name__ == '__main__':
+  parser = OptionParser(usage="usage: %prog [options] clip.crm")
+  parser.add_option("-o", "--output", dest="output", help="output directory", default='frames')
+  parser.add_option("-f", "--format", dest="format", help="npy, tiff, raw or crx", default='npy', choices=list(SINKS))
+  parser.add_option("-j", "--jobs", type="int", dest="jobs", help="number of processes, default is cpu count", default=None)
+  parser.add_option("-d", "--depth", type="int", dest="depth", help="frames in flight, default is 2 per process", default=None)
+  parser.add_option("-s", "--start", type="int", dest="start", help="first frame", default=0)
+  parser.add_option("-n", "--count", type="int", dest="count", help="number of frames, default is all", default=None)
+  parser.add_option("-r", "--reduction", type="int", dest="reduction", help="decode lossy frames at 1/2**reduction scale", default=0)
+  parser.add_option("-i", "--index", dest="index", help="frame index file, created if missing", default=None)
+  parser.add_option("-q", "--quiet", action="store_true", dest="quiet", help="do not report frames per second", default=False)
+
+  (options, args) = parser.parse_args()
+  if len(args) != 1:
+    parser.error('one clip is needed')
+
+  transcode( args[0], SINKS[options.format](options.output), options.jobs, options.depth, options.start, options.count,
+             options.reduction, options.index, None if options.quiet else sys.stderr )